@@ -0,0 +1,127 @@
+"""
+Court utilization and revenue rollups.
+
+Bookings are folded into per-hour and per-day usage rows as they are made,
+so owner dashboards read a few hundred pre-aggregated rows instead of
+joining bookings to courts on every load. aggregate_usage() is also the
+batch path that rebuilds those rows from history; it uses NumPy when it
+is installed and plain Python otherwise.
+
+Usage:
+    python analytics.py recompute     # rebuild every rollup from bookings
+"""
+import re
+import sys
+import time
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional; only speeds up batch recomputes
+    np = None
+
+DEFAULT_OPEN_HOURS = range(6, 22)  # "6:00 AM - 10:00 PM daily"
+
+_HOURS_RE = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([AaPp][Mm])\s*-\s*(\d{1,2})(?::(\d{2}))?\s*([AaPp][Mm])")
+
+
+def open_hours(operating_hours: Optional[str]) -> range:
+    """Hours a court is open, from the first range in e.g. '6:00 AM - 10:00 PM daily'"""
+    match = _HOURS_RE.search(operating_hours or "")
+    if not match:
+        return DEFAULT_OPEN_HOURS
+    sh, _, smer, eh, _, emer = match.groups()
+    start = int(sh) % 12 + (12 if smer.lower() == "pm" else 0)
+    end = int(eh) % 12 + (12 if emer.lower() == "pm" else 0)
+    if end == 0:
+        end = 24
+    return range(start, end) if start < end else DEFAULT_OPEN_HOURS
+
+
+def aggregate_usage(bookings: Iterable[tuple], use_numpy: Optional[bool] = None) -> dict[tuple, list[int]]:
+    """Sum bookings into {(court_id, day, hour): [bookings, revenue]}.
+
+    Each booking is (court_id, day, start_hour, end_hour, price_per_hour).
+    use_numpy=None picks the vectorized path whenever NumPy is available.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _aggregate_numpy(list(bookings))
+    usage: dict[tuple, list[int]] = {}
+    for court_id, day, start_hour, end_hour, price in bookings:
+        for hour in range(start_hour, end_hour):
+            cell = usage.get((court_id, day, hour))
+            if cell is None:
+                usage[(court_id, day, hour)] = [1, price or 0]
+            else:
+                cell[0] += 1
+                cell[1] += price or 0
+    return usage
+
+
+def _aggregate_numpy(bookings: list[tuple]) -> dict[tuple, list[int]]:
+    if np is None:
+        raise RuntimeError("NumPy is not installed")
+    if not bookings:
+        return {}
+    court_ids, days, starts, ends, prices = zip(*bookings)
+    ordinals = {day: day.toordinal() for day in set(days)}
+    courts = np.array(court_ids, dtype=np.int64)
+    starts = np.array(starts, dtype=np.int64)
+    first_hour = np.array(list(map(ordinals.__getitem__, days)), dtype=np.int64) * 24 + starts
+    durations = np.array(ends, dtype=np.int64) - starts
+    price = np.array([p or 0 for p in prices], dtype=np.int64)
+
+    # One entry per booked hour: repeat each booking over its duration and
+    # add 0, 1, 2... within each run
+    offsets = np.arange(durations.sum()) - np.repeat(np.cumsum(durations) - durations, durations)
+    hours = np.repeat(first_hour, durations) + offsets
+    # Hours since 0001-01-01 fit in 32 bits, so (court, hour) packs into one int64 key
+    keys = (np.repeat(courts, durations) << 32) | hours
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse)
+    revenue = np.bincount(inverse, weights=np.repeat(price, durations))
+
+    ordinals, hours = np.divmod(unique & 0xFFFFFFFF, 24)
+    days = {ordinal: date.fromordinal(ordinal) for ordinal in np.unique(ordinals).tolist()}
+    keys = zip((unique >> 32).tolist(), map(days.__getitem__, ordinals.tolist()), hours.tolist())
+    return dict(zip(keys, map(list, zip(counts.tolist(), revenue.astype(np.int64).tolist()))))
+
+
+def daily_totals(hourly: dict[tuple, list[int]]) -> dict[tuple, list[int]]:
+    """Roll {(court_id, day, hour): [bookings, revenue]} up to {(court_id, day): [...]}"""
+    daily: dict[tuple, list[int]] = {}
+    for (court_id, day, _), (count, revenue) in hourly.items():
+        cell = daily.setdefault((court_id, day), [0, 0])
+        cell[0] += count
+        cell[1] += revenue
+    return daily
+
+
+def heatmap(cells: Iterable[tuple], start: date, days: int, hours: range) -> list[list[int]]:
+    """Bookings per day (rows) and hour (columns) from (day, hour, bookings) cells."""
+    grid = [[0] * len(hours) for _ in range(days)]
+    for day, hour, count in cells:
+        row = (day - start).days
+        if 0 <= row < days and hour in hours:
+            grid[row][hour - hours.start] = count
+    return grid
+
+
+def date_range(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["recompute"]:
+        print(__doc__)
+        sys.exit(1)
+    import main
+
+    started = time.perf_counter()
+    with main.engine.begin() as conn:
+        rows = main.recompute_usage(conn)
+    print(f"✅ Rebuilt {rows} hourly usage rows in {time.perf_counter() - started:.2f}s "
+          f"({'NumPy' if np is not None else 'pure Python'})")
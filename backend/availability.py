@@ -0,0 +1,160 @@
+"""
+Per-court slot occupancy index.
+
+For each court, every day from today on maps to a 24-bit integer where bit
+``h`` is set when the hour starting at ``h:00`` is booked. The index lives in-process: it is
+warmed from the bookings table the first time a court is looked up and then
+kept current by the booking routes.
+
+Each court also has a shared version that every booking change bumps. A
+court's bitmaps remember the version they were loaded at, and are reloaded
+once the shared version moves past it, so bookings and cancellations made by
+other workers are never missed.
+"""
+import re
+import threading
+from datetime import date, datetime
+from typing import Callable, Iterable, Optional
+
+HOURS_PER_DAY = 24
+
+# "2026-03-01 10:00-11:00" or "2026-03-01 10:00 AM-11:00 AM" (TimeSlotGrid format)
+_SLOT_RE = re.compile(
+    r"^\s*(\d{4}-\d{2}-\d{2})\s+"
+    r"(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s*-\s*"
+    r"(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s*$"
+)
+
+
+def _to_24h(hour: int, meridiem: Optional[str]) -> int:
+    if meridiem is None:
+        return hour
+    hour = hour % 12
+    return hour + 12 if meridiem.lower() == "pm" else hour
+
+
+def parse_time_slot(time_slot: str):
+    """Parse a booking time slot string into (day, start_hour, end_hour).
+
+    Returns None for strings that don't follow a known slot format. An end
+    of midnight ("11:00 PM-12:00 AM") is reported as hour 24.
+    """
+    match = _SLOT_RE.match(time_slot or "")
+    if not match:
+        return None
+    day_str, sh, sm, smer, eh, em, emer = match.groups()
+    try:
+        day = date.fromisoformat(day_str)
+    except ValueError:
+        return None
+    start = _to_24h(int(sh), smer)
+    end = _to_24h(int(eh), emer)
+    if end == 0:
+        end = HOURS_PER_DAY
+    if int(sm) or int(em) or not (0 <= start < end <= HOURS_PER_DAY):
+        return None
+    return day, start, end
+
+
+def hours_mask(start_hour: int, end_hour: int) -> int:
+    """Bitmask with bits [start_hour, end_hour) set."""
+    return ((1 << (end_hour - start_hour)) - 1) << start_hour
+
+
+def mask_to_hours(mask: int) -> list[int]:
+    return [h for h in range(HOURS_PER_DAY) if mask >> h & 1]
+
+
+class SlotBitmapIndex:
+    """Thread-safe map of court_id -> {day: occupancy bitmap}, today onwards.
+
+    Bookings are one hour each, so a booking sets the bit for its start hour.
+    Days before today are dropped once the date changes, so the index holds
+    only what can still be booked and past days read as free.
+    """
+
+    def __init__(self, today: Callable[[], date] = lambda: datetime.utcnow().date()):
+        self._lock = threading.Lock()
+        self._today = today
+        self._day = today()
+        self._courts: dict[int, dict[date, int]] = {}
+        self._versions: dict[int, int] = {}
+
+    def _roll_over(self):
+        """Drop past days the first time the index is touched on a new day; caller holds the lock"""
+        day = self._today()
+        if day == self._day:
+            return
+        self._day = day
+        for bitmaps in self._courts.values():
+            for past in [d for d in bitmaps if d < day]:
+                del bitmaps[past]
+
+    def is_loaded(self, court_id: int) -> bool:
+        return court_id in self._courts
+
+    def is_current(self, court_id: int, version: int) -> bool:
+        """True if the court is loaded at this shared version or a later one"""
+        return court_id in self._courts and self._versions.get(court_id, -1) >= version
+
+    def load(self, court_id: int, starts: Iterable[datetime], version: int = 0):
+        """Replace a court's bitmaps with the start times of its bookings from today on.
+
+        The bookings must have been read after the shared version was.
+        """
+        bitmaps: dict[date, int] = {}
+        for start_at in starts:
+            day = start_at.date()
+            bitmaps[day] = bitmaps.get(day, 0) | 1 << start_at.hour
+        with self._lock:
+            self._roll_over()
+            self._courts[court_id] = {day: mask for day, mask in bitmaps.items() if day >= self._day}
+            self._versions[court_id] = version
+
+    def advance(self, court_id: int, version: int) -> bool:
+        """Adopt the version a booking change from this process produced.
+
+        Returns False, and forgets the court, if it isn't loaded or another
+        change came in since it was; the caller then skips updating bitmaps.
+        """
+        with self._lock:
+            if court_id in self._courts and self._versions.get(court_id) == version - 1:
+                self._versions[court_id] = version
+                return True
+            self._courts.pop(court_id, None)
+            self._versions.pop(court_id, None)
+            return False
+
+    def mark(self, court_id: int, start_at: datetime):
+        """Set the bit for a newly booked hour of a loaded court"""
+        self._update(court_id, start_at, booked=True)
+
+    def unmark(self, court_id: int, start_at: datetime):
+        """Clear the bit for a cancelled hour of a loaded court"""
+        self._update(court_id, start_at, booked=False)
+
+    def _update(self, court_id: int, start_at: datetime, booked: bool):
+        day, bit = start_at.date(), 1 << start_at.hour
+        with self._lock:
+            self._roll_over()
+            bitmaps = self._courts.get(court_id)
+            if bitmaps is None or day < self._day:
+                return
+            mask = bitmaps.get(day, 0) | bit if booked else bitmaps.get(day, 0) & ~bit
+            if mask:
+                bitmaps[day] = mask
+            else:
+                bitmaps.pop(day, None)
+
+    def get(self, court_id: int, day: date) -> int:
+        return self._courts.get(court_id, {}).get(day, 0)
+
+    def invalidate(self, court_id: Optional[int] = None):
+        """Drop cached bitmaps so they are rebuilt on next lookup."""
+        with self._lock:
+            if court_id is None:
+                self._courts.clear()
+                self._versions.clear()
+                return
+            self._courts.pop(court_id, None)
+            self._versions.pop(court_id, None)
@@ -0,0 +1,541 @@
+"""
+Load-testing benchmark for the Pickleball Platform API.
+
+Starts the FastAPI app in-process (uvicorn on a background thread) against a
+seeded database, drives a weighted mix of requests at a fixed concurrency
+and writes latency percentiles, throughput and SQL statements per request as
+JSON.
+
+Usage:
+    # Throwaway SQLite database, default mix
+    python benchmark.py --requests 2000 --concurrency 16 --output bench.json
+
+    # Local Postgres, compared against an earlier run (exit 1 on regression)
+    python benchmark.py --database-url postgresql://localhost/pickleball_bench \\
+        --baseline bench.json --max-regression 0.25
+
+    # Custom mix (relative weights)
+    python benchmark.py --mix login=1,courts=6,bookings=3,book=2
+
+    # Cold start: time from launching uvicorn to the first healthy /health
+    # (first run creates the schema, later runs restart against it)
+    python benchmark.py --startup --startup-runs 3 --startup-budget 5
+
+    # Per-item cost of encoding GET /courts and GET /bookings pages, default
+    # path versus FAST_JSON
+    python benchmark.py --serialization --items 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from passwords import hash_password
+
+DEFAULT_MIX = "login=1,courts=5,bookings=3,book=1"
+BENCH_PASSWORD = "BenchPass123!"
+STARTUP_BUDGET_SECONDS = 5.0  # Railway's healthcheckTimeout (railway.json)
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return weights
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# ── Scenarios ───────────────────────────────────────────────────
+# Each returns (endpoint label, response status).
+
+async def scenario_login(client, ctx):
+    user = random.choice(ctx["users"])
+    resp = await client.post("/auth/login", json={"email": user["email"], "password": BENCH_PASSWORD})
+    return "POST /auth/login", resp.status_code
+
+
+async def scenario_courts(client, ctx):
+    resp = await client.get("/courts")
+    return "GET /courts", resp.status_code
+
+
+async def scenario_bookings(client, ctx):
+    user = random.choice(ctx["users"])
+    resp = await client.get("/bookings", headers=user["headers"])
+    return "GET /bookings", resp.status_code
+
+
+async def scenario_book(client, ctx):
+    user = random.choice(ctx["users"])
+    day = ctx["first_day"] + timedelta(days=random.randrange(ctx["days"]))
+    hour = random.randrange(6, 22)
+    slot = f"{day.isoformat()} {hour:02d}:00-{hour + 1:02d}:00"
+    resp = await client.post("/bookings", json={
+        "court_id": random.choice(ctx["court_ids"]),
+        "time_slot": slot,
+    }, headers=user["headers"])
+    return "POST /bookings", resp.status_code
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "courts": scenario_courts,
+    "bookings": scenario_bookings,
+    "book": scenario_book,
+}
+
+
+# ── Setup ───────────────────────────────────────────────────────
+
+def seed(main, users: int, courts: int, bookings_per_user: int):
+    """Insert benchmark users, courts and bookings directly through the ORM."""
+    password = hash_password(BENCH_PASSWORD, main.BCRYPT_ROUNDS)
+    run_id = f"{int(time.time())}{random.randrange(1000):03d}"
+    db = main.SessionLocal()
+    try:
+        owner = main.User(email=f"bench_owner_{run_id}@example.com", password=password,
+                          name="Bench Owner", role="owner", skill_level="advanced")
+        db.add(owner)
+        db.flush()
+        court_rows = [
+            main.Court(owner_id=owner.id, name=f"Bench Court {i}", location=f"{i} Bench St, Austin, TX",
+                       surface_type=random.choice(["hardcourt", "clay", "other"]),
+                       amenities="Lights, Restrooms", price_per_hour=random.randrange(15, 50))
+            for i in range(courts)
+        ]
+        user_rows = [
+            main.User(email=f"bench_{run_id}_{i}@example.com", password=password,
+                      name=f"Bench Player {i}", role="player", skill_level="intermediate")
+            for i in range(users)
+        ]
+        db.add_all(court_rows + user_rows)
+        db.flush()
+
+        # Historical bookings, well in the past so they never collide with new ones
+        start = date(2020, 1, 1)
+        slot = 0
+        for user in user_rows:
+            for _ in range(bookings_per_user):
+                court = court_rows[slot % len(court_rows)]
+                day = start + timedelta(days=slot // (len(court_rows) * 16))
+                hour = 6 + (slot // len(court_rows)) % 16
+                db.add(main.Booking(
+                    court_id=court.id, player_id=user.id,
+                    time_slot=f"{day.isoformat()} {hour:02d}:00-{hour + 1:02d}:00",
+                    start_at=datetime(day.year, day.month, day.day, hour),
+                    end_at=datetime(day.year, day.month, day.day, hour + 1),
+                ))
+                slot += 1
+        db.commit()
+
+        return {
+            "court_ids": [c.id for c in court_rows],
+            "users": [
+                {
+                    "email": u.email,
+                    "headers": {"Authorization": "Bearer " + main.create_access_token(
+                        data={"sub": str(u.id)},
+                        expires_delta=timedelta(hours=2),
+                    )},
+                }
+                for u in user_rows
+            ],
+        }
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """uvicorn serving the app on a background thread."""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class StatementCounter:
+    """Counts SQL statements on the engine serving requests."""
+
+    def __init__(self, main):
+        self.count = 0
+        self._engine = main.async_engine.sync_engine if main.async_engine is not None else main.engine
+        event.listen(self._engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def close(self):
+        event.remove(self._engine, "before_cursor_execute", self._on_execute)
+
+
+# ── Runner ──────────────────────────────────────────────────────
+
+async def calibrate(client, ctx, counter, weights, samples: int) -> dict[str, float]:
+    """SQL statements per request for each scenario, measured sequentially."""
+    per_request = {}
+    for name in weights:
+        before = counter.count
+        label = None
+        for _ in range(samples):
+            label, _ = await SCENARIOS[name](client, ctx)
+        per_request[label] = round((counter.count - before) / samples, 2)
+    return per_request
+
+
+async def drive(base_url: str, ctx, weights, counter, total: int, concurrency: int, calibration: int):
+    import httpx
+
+    names = list(weights)
+    cumulative = [weights[n] for n in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    remaining = total
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        queries = await calibrate(client, ctx, counter, weights, calibration) if calibration else {}
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                name = random.choices(names, weights=cumulative)[0]
+                start = time.perf_counter()
+                label, status_code = await SCENARIOS[name](client, ctx)
+                latencies[label].append((time.perf_counter() - start) * 1000)
+                statuses[label][str(status_code)] += 1
+
+        statements_before = counter.count
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        statements = counter.count - statements_before
+
+    return latencies, statuses, queries, elapsed, statements
+
+
+def summarize(latencies, statuses, queries, elapsed, statements, config) -> dict:
+    endpoints = {}
+    total = 0
+    errors = 0
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        total += len(values)
+        errors += sum(n for code, n in statuses[label].items() if code.startswith("5"))
+        endpoints[label] = {
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3),
+            "status": dict(statuses[label]),
+            "queries_per_request": queries.get(label),
+        }
+    return {
+        "config": config,
+        "totals": {
+            "requests": total,
+            "duration_s": round(elapsed, 3),
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "server_errors": errors,
+            "queries_per_request": round(statements / total, 2) if total else 0.0,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Describe metrics that got worse than the baseline by more than max_regression."""
+    regressions = []
+
+    def check(label, metric, current, previous, higher_is_worse=True):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        if (change if higher_is_worse else -change) > max_regression:
+            regressions.append(f"{label} {metric}: {previous} -> {current} ({change:+.1%})")
+
+    check("total", "rps", report["totals"]["rps"], baseline["totals"].get("rps"), higher_is_worse=False)
+    for label, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(label)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            check(label, metric, current[metric], previous.get(metric))
+        # Query counts are deterministic: any increase is a regression
+        if current["queries_per_request"] is not None and previous.get("queries_per_request") is not None:
+            if current["queries_per_request"] > previous["queries_per_request"]:
+                regressions.append(
+                    f"{label} queries_per_request: {previous['queries_per_request']} -> {current['queries_per_request']}"
+                )
+    return regressions
+
+
+def run_benchmark(args) -> dict:
+    random.seed(args.seed)
+    # main reads its configuration at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    import main
+
+    # Every simulated client shares one IP; measure the handlers, not the throttle
+    main.rate_limiter.enabled = False
+    with ServerThread(main.app, free_port()) as server:
+        ctx = seed(main, args.users, args.courts, args.bookings_per_user)
+        # New bookings land in a future year no other data uses
+        ctx.update(first_day=date(2030, 1, 1), days=365)
+        counter = StatementCounter(main)
+        try:
+            base_url = f"http://127.0.0.1:{server.server.config.port}"
+            results = asyncio.run(drive(
+                base_url, ctx, parse_mix(args.mix), counter,
+                args.requests, args.concurrency, args.calibration,
+            ))
+        finally:
+            counter.close()
+
+    config = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "users": args.users,
+        "courts": args.courts,
+        "bookings_per_user": args.bookings_per_user,
+        "database": args.database_url.split("://")[0],
+        "db_async": main.DB_ASYNC,
+        "bcrypt_rounds": main.BCRYPT_ROUNDS,
+    }
+    return summarize(*results, config)
+
+
+# ── Startup ─────────────────────────────────────────────────────
+
+def time_to_first_health(database_url: str, timeout: float = 30.0) -> float:
+    """Seconds from launching a uvicorn process until /health answers 200."""
+    import httpx
+
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "DATABASE_URL": database_url},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup with code {process.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        raise RuntimeError(f"/health did not answer within {timeout} s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def measure_startup(database_url: str, runs: int = 3) -> dict:
+    """Cold-start timings; against an empty database the first run also builds the schema."""
+    timings = [round(time_to_first_health(database_url), 3) for _ in range(runs)]
+    return {
+        "runs_s": timings,
+        "first_s": timings[0],
+        "restart_s": min(timings[1:]) if len(timings) > 1 else None,
+        "max_s": max(timings),
+    }
+
+
+# ── Serialization ───────────────────────────────────────────────
+
+def sample_rows(columns: list[str], items: int) -> list:
+    """Rows shaped like the endpoint's column projection, with realistic values"""
+    Row = namedtuple("Row", columns)
+    now = datetime(2030, 1, 1, 12, 30, 15, 250000)
+    values = {
+        "id": 1, "owner_id": 7, "court_id": 3, "player_id": 42,
+        "name": "Sunset Pickleball Club", "court_name": "Sunset Pickleball Club",
+        "location": "123 Sunset Blvd, San Jose, CA", "surface_type": "hardcourt",
+        "amenities": "Lights, Restrooms, Water fountain", "price_per_hour": 25,
+        "operating_hours": "6:00 AM - 10:00 PM daily", "photo_url": "https://example.com/court.jpg",
+        "latitude": 37.3382, "longitude": -121.8863, "time_slot": "2030-01-01 18:00-19:00",
+        "start_at": now, "end_at": now + timedelta(hours=1), "status": "confirmed", "created_at": now,
+    }
+    return [Row(**{**{c: values[c] for c in columns}, "id": n}) for n in range(1, items + 1)]
+
+
+def time_per_item(encode, items: int, repeat: int) -> float:
+    """Best-of-repeat microseconds per item for one call of encode()"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode()
+        best = min(best, time.perf_counter() - started)
+    return round(best / items * 1e6, 3)
+
+
+def measure_serialization(items: int = 1000, repeat: int = 20) -> dict:
+    """Encoding cost per item for a page of GET /courts and GET /bookings, both ways.
+
+    The default path is what each handler does without FAST_JSON: a model
+    per row, then for GET /bookings FastAPI's response_model validation
+    and JSONResponse, and for GET /courts jsonable_encoder and json. The
+    fast path encodes the projection rows directly.
+    """
+    import main
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from serialization import FastJSONResponse, dumps, orjson, row_dicts
+
+    bookings_field = next(
+        route.response_field for route in main.app.routes
+        if getattr(route, "path", None) == "/bookings" and "GET" in route.methods
+    )
+    court_rows = sample_rows([column.key for column in main.court_columns], items)
+    booking_rows = sample_rows(list(main.BookingResponse.model_fields), items)
+
+    def courts_default():
+        return json.dumps(
+            main.jsonable_encoder([main.CourtResponse.model_validate(row) for row in court_rows]),
+            separators=(",", ":"),
+        ).encode()
+
+    def bookings_default():
+        content = [main.BookingResponse.model_validate(row) for row in booking_rows]
+        return JSONResponse(asyncio.run(serialize_response(field=bookings_field, response_content=content))).body
+
+    # Both paths have to produce the same document
+    assert json.loads(courts_default()) == json.loads(dumps(row_dicts(court_rows)))
+    assert json.loads(bookings_default()) == json.loads(FastJSONResponse(row_dicts(booking_rows)).body)
+
+    report = {"items": items, "repeat": repeat, "encoder": "orjson" if orjson is not None else "json", "endpoints": {}}
+    for label, default, fast in [
+        ("GET /courts", courts_default, lambda: dumps(row_dicts(court_rows))),
+        ("GET /bookings", bookings_default, lambda: FastJSONResponse(row_dicts(booking_rows)).body),
+    ]:
+        default_us = time_per_item(default, items, repeat)
+        fast_us = time_per_item(fast, items, repeat)
+        report["endpoints"][label] = {
+            "default_us_per_item": default_us,
+            "fast_us_per_item": fast_us,
+            "speedup": round(default_us / fast_us, 2) if fast_us else None,
+        }
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the Pickleball Platform API in-process")
+    parser.add_argument("--database-url", default=None,
+                        help="database to benchmark against (default: a fresh SQLite file)")
+    parser.add_argument("--requests", type=int, default=1000, help="total requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=50, help="benchmark users to seed")
+    parser.add_argument("--courts", type=int, default=200, help="benchmark courts to seed")
+    parser.add_argument("--bookings-per-user", type=int, default=20, help="historical bookings per user")
+    parser.add_argument("--calibration", type=int, default=10,
+                        help="sequential requests per scenario used to count SQL statements")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request mix")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative slowdown versus the baseline (default: 0.2)")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure time to first /health instead of request load")
+    parser.add_argument("--startup-runs", type=int, default=3, help="server launches to time with --startup")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_SECONDS,
+                        help=f"fail if any launch exceeds this many seconds (default: {STARTUP_BUDGET_SECONDS})")
+    parser.add_argument("--serialization", action="store_true",
+                        help="measure per-item JSON encoding cost of the list endpoints instead of request load")
+    parser.add_argument("--items", type=int, default=1000, help="rows per page with --serialization")
+    return parser
+
+
+def main_cli(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.database_url is None:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pickleball-bench-'), 'bench.db')}"
+
+    if args.startup:
+        report = {"startup": measure_startup(args.database_url, args.startup_runs)}
+    elif args.serialization:
+        os.environ["DATABASE_URL"] = args.database_url
+        report = {"serialization": measure_serialization(args.items)}
+    else:
+        report = run_benchmark(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.startup:
+        if report["startup"]["max_s"] > args.startup_budget:
+            print(f"⚠️ Startup took {report['startup']['max_s']} s, over the {args.startup_budget} s budget",
+                  file=sys.stderr)
+            return 1
+        print(f"✅ Startup within the {args.startup_budget} s budget", file=sys.stderr)
+        return 0
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,212 @@
+"""
+Bulk import and export in NDJSON and CSV.
+
+Both directions are streamed: imports are parsed record by record as the
+upload arrives and handed on in chunks, and exports are encoded a batch of
+rows at a time as they come off a server-side cursor. Neither ever holds a
+whole file in memory.
+
+Usage:
+    python bulk.py import courts.ndjson --owner-email owner@example.com
+    python bulk.py import courts.csv --owner-email owner@example.com
+    python bulk.py export courts > courts.ndjson
+    python bulk.py export bookings --format csv > bookings.csv
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime
+from typing import AsyncIterable, Iterable, Optional
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+IMPORT_CHUNK_SIZE = 500  # records validated and inserted per transaction
+EXPORT_BATCH_SIZE = 1000  # rows fetched from the cursor and encoded per write
+MAX_REPORTED_ERRORS = 100
+
+
+class RecordError(ValueError):
+    """A record that couldn't be parsed; carries its line number"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+
+
+def format_for(filename_or_type: Optional[str]) -> Optional[str]:
+    """'csv' or 'ndjson' from a file name or media type, if recognisable"""
+    value = (filename_or_type or "").lower()
+    if "csv" in value:
+        return "csv"
+    if "ndjson" in value or "jsonl" in value or "json" in value:
+        return "ndjson"
+    return None
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]):
+    """Decode a byte stream as UTF-8 and yield it line by line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def iter_records(lines: AsyncIterable[str], fmt: str):
+    """Yield (line number, dict or RecordError) for each NDJSON line or CSV row.
+
+    A CSV record may continue over several lines inside a quoted field; it
+    is numbered by the line it starts on.
+    """
+    header = None
+    pending, start = "", 0
+    number = 0
+    async for line in lines:
+        number += 1
+        line = line.rstrip("\r")
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, RecordError(number, f"Invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield number, RecordError(number, "Expected a JSON object")
+                continue
+            yield number, record
+            continue
+
+        if not pending:
+            start = number
+            if not line.strip():
+                continue
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue  # inside a quoted field that spans lines
+        values = next(csv.reader([pending]))
+        pending = ""
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, RecordError(start, f"Expected {len(header)} fields, got {len(values)}")
+            continue
+        yield start, {name: (value if value != "" else None) for name, value in zip(header, values)}
+    if pending:
+        yield start, RecordError(start, "Unterminated quoted field")
+
+
+async def import_records(records: AsyncIterable[tuple], insert_chunk, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """Hand (line, record) pairs to insert_chunk a chunk at a time.
+
+    insert_chunk(chunk) is awaited and returns (rows created, [(line, error)]).
+    Returns (created, failed, the first MAX_REPORTED_ERRORS errors).
+    """
+    created, failed, errors = 0, 0, []
+    chunk = []
+
+    async def flush():
+        nonlocal created, failed
+        inserted, chunk_errors = await insert_chunk(chunk)
+        created += inserted
+        failed += len(chunk_errors)
+        errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            await flush()
+            chunk = []
+    if chunk:
+        await flush()
+    return created, failed, errors
+
+
+def jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(rows: Iterable, columns: list[str]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(columns, map(jsonable, row))), separators=(",", ":")) + "\n" for row in rows
+    ).encode()
+
+
+def encode_csv(rows: Iterable, columns: list[str], header: bool = False) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    writer.writerows([jsonable(value) for value in row] for row in rows)
+    return out.getvalue().encode()
+
+
+def encode_rows(batches: Iterable[list], columns: list[str], fmt: str):
+    """Yield the encoded export, one chunk per batch of rows"""
+    if fmt == "csv":
+        yield encode_csv((), columns, header=True)
+    for rows in batches:
+        yield encode_ndjson(rows, columns) if fmt == "ndjson" else encode_csv(rows, columns)
+
+
+async def _file_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 16):
+            yield chunk
+
+
+async def _import_file(path: str, owner_email: str, fmt: str):
+    import main
+
+    with main.SessionLocal() as session:
+        owner = session.query(main.User.id).filter(main.User.email == owner_email).first()
+    if owner is None:
+        sys.exit(f"❌ No user with email {owner_email}")
+
+    async def insert(chunk):
+        with main.SessionLocal() as session:
+            return main.import_court_chunk(session, owner.id, chunk)
+
+    created, failed, errors = await import_records(iter_records(iter_lines(_file_chunks(path)), fmt), insert)
+    for line, error in errors:
+        print(f"⚠️ Line {line}: {error}", file=sys.stderr)
+    print(f"✅ Imported {created} courts, {failed} rows rejected", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Bulk import and export of courts and bookings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="Import courts from an NDJSON or CSV file")
+    importer.add_argument("path")
+    importer.add_argument("--owner-email", required=True, help="Owner of the imported courts")
+    importer.add_argument("--format", choices=FORMATS, help="Default: from the file extension")
+    exporter = commands.add_parser("export", help="Write every court or booking to stdout")
+    exporter.add_argument("table", choices=["courts", "bookings"])
+    exporter.add_argument("--format", choices=FORMATS, default="ndjson")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        fmt = args.format or format_for(args.path)
+        if fmt is None:
+            sys.exit("❌ Can't tell the format from the file name; pass --format")
+        asyncio.run(_import_file(args.path, args.owner_email, fmt))
+    else:
+        import main
+
+        statement, columns = main.export_query(args.table)
+        for chunk in main.stream_export(statement, columns, args.format):
+            sys.stdout.buffer.write(chunk)
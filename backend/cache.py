@@ -0,0 +1,90 @@
+"""
+Small in-process caches.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL.
+
+    Entries can carry their own expiry (e.g. a JWT's exp) which is capped by
+    the cache-wide TTL. hits/misses count lookups for monitoring.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class CachedCounter:
+    """Last value read from a shared counter, trusted for ttl seconds.
+
+    Lets each worker answer "has this changed?" from memory most of the
+    time and only go back to the shared store once the value is stale.
+    """
+
+    def __init__(self, ttl: float = 1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._value: Optional[int] = None
+        self._expires_at = 0.0
+
+    def get(self) -> Optional[int]:
+        if self._value is not None and self._expires_at > self._clock():
+            return self._value
+        return None
+
+    def set(self, value: int):
+        self._value = value
+        self._expires_at = self._clock() + self.ttl
+
+    def expire(self):
+        """Go back to the shared store on the next get"""
+        self._expires_at = 0.0
@@ -0,0 +1,153 @@
+"""
+Offline geocoding and an in-process spatial index for court search.
+
+Coordinates come from a bundled city gazetteer so courts can be placed on
+the map without calling an external geocoding service. Radius queries go
+through a uniform lat/lng grid: only the cells overlapping the search
+circle's bounding box are scanned, so cost scales with the number of
+courts nearby rather than the size of the catalog.
+"""
+import math
+import threading
+from typing import Iterable, Optional
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# (city, state) -> (latitude, longitude) for cities we have venues in
+CITY_COORDINATES = {
+    ("atlanta", "ga"): (33.7490, -84.3880),
+    ("austin", "tx"): (30.2672, -97.7431),
+    ("berkeley", "ca"): (37.8715, -122.2730),
+    ("boston", "ma"): (42.3601, -71.0589),
+    ("charlotte", "nc"): (35.2271, -80.8431),
+    ("chicago", "il"): (41.8781, -87.6298),
+    ("cupertino", "ca"): (37.3230, -122.0322),
+    ("dallas", "tx"): (32.7767, -96.7970),
+    ("denver", "co"): (39.7392, -104.9903),
+    ("houston", "tx"): (29.7604, -95.3698),
+    ("las vegas", "nv"): (36.1699, -115.1398),
+    ("los angeles", "ca"): (34.0522, -118.2437),
+    ("mesa", "az"): (33.4152, -111.8315),
+    ("miami", "fl"): (25.7617, -80.1918),
+    ("minneapolis", "mn"): (44.9778, -93.2650),
+    ("mountain view", "ca"): (37.3861, -122.0839),
+    ("naples", "fl"): (26.1420, -81.7948),
+    ("nashville", "tn"): (36.1627, -86.7816),
+    ("new york", "ny"): (40.7128, -74.0060),
+    ("oakland", "ca"): (37.8044, -122.2712),
+    ("orlando", "fl"): (28.5383, -81.3792),
+    ("palo alto", "ca"): (37.4419, -122.1430),
+    ("philadelphia", "pa"): (39.9526, -75.1652),
+    ("phoenix", "az"): (33.4484, -112.0740),
+    ("portland", "or"): (45.5152, -122.6784),
+    ("sacramento", "ca"): (38.5816, -121.4944),
+    ("salt lake city", "ut"): (40.7608, -111.8910),
+    ("san antonio", "tx"): (29.4241, -98.4936),
+    ("san diego", "ca"): (32.7157, -117.1611),
+    ("san francisco", "ca"): (37.7749, -122.4194),
+    ("san jose", "ca"): (37.3382, -121.8863),
+    ("scottsdale", "az"): (33.4942, -111.9261),
+    ("seattle", "wa"): (47.6062, -122.3321),
+    ("sunnyvale", "ca"): (37.3688, -122.0363),
+    ("tampa", "fl"): (27.9506, -82.4572),
+    ("tucson", "az"): (32.2226, -110.9747),
+    ("washington", "dc"): (38.9072, -77.0369),
+}
+
+
+def geocode(location: Optional[str]):
+    """Look up (latitude, longitude) for an address ending in "City, ST [zip]"."""
+    parts = [p.strip() for p in (location or "").split(",")]
+    if len(parts) < 2 or not parts[-1]:
+        return None
+    state = parts[-1].split()[0].lower()
+    return CITY_COORDINATES.get((parts[-2].lower(), state))
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Bucket points into cell_deg x cell_deg cells for radius lookups."""
+
+    def __init__(self, points: Iterable[tuple[int, float, float]] = (), cell_deg: float = 0.1):
+        self.cell_deg = cell_deg
+        self._cells: dict[tuple[int, int], list[tuple[int, float, float]]] = {}
+        self.size = 0
+        for point_id, lat, lng in points:
+            self._cells.setdefault(self._cell(lat, lng), []).append((point_id, lat, lng))
+            self.size += 1
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def within(self, lat: float, lng: float, radius_km: float) -> list[tuple[int, float]]:
+        """Return (id, distance_km) for points within radius, nearest first."""
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        cos_lat = math.cos(math.radians(lat))
+        # Near the poles the longitude span covers the whole circle
+        dlng = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+        row_lo, col_lo = self._cell(lat - dlat, lng - dlng)
+        row_hi, col_hi = self._cell(lat + dlat, lng + dlng)
+
+        cells = self._cells
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(cells):
+            candidates = (p for bucket in cells.values() for p in bucket)
+        else:
+            candidates = (
+                p
+                for row in range(row_lo, row_hi + 1)
+                for col in range(col_lo, col_hi + 1)
+                for p in cells.get((row, col), ())
+            )
+
+        lat_lo, lat_hi = lat - dlat, lat + dlat
+        hits = []
+        for point_id, plat, plng in candidates:
+            if not lat_lo <= plat <= lat_hi:
+                continue
+            distance = haversine_km(lat, lng, plat, plng)
+            if distance <= radius_km:
+                hits.append((point_id, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+
+class LazySpatialIndex:
+    """GridIndex that is rebuilt on the next query after being invalidated.
+
+    Callers pass the shared courts version they read before loading points,
+    and an index built at an older version is rebuilt, so courts added by
+    other workers show up too.
+    """
+
+    def __init__(self, cell_deg: float = 0.1):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._built: Optional[tuple[int, GridIndex]] = None
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._built = None
+
+    def get(self, load_points, version: int = 0) -> GridIndex:
+        built = self._built
+        if built is not None and built[0] >= version:
+            return built[1]
+        with self._lock:
+            if self._built is not None and self._built[0] >= version:
+                return self._built[1]
+            generation = self._generation
+            index = GridIndex(load_points(), cell_deg=self.cell_deg)
+            # A change that landed mid-build may be missing; serve it once
+            # but rebuild again on the next query.
+            if generation == self._generation:
+                self._built = (version, index)
+            return index
@@ -0,0 +1,44 @@
+"""
+Fill in court coordinates from their addresses using the bundled gazetteer.
+
+Usage:
+    python geocode_courts.py            # only courts without coordinates
+    python geocode_courts.py --all      # re-geocode every court
+
+Works offline; addresses whose city isn't in geo.CITY_COORDINATES are
+reported and left unchanged.
+"""
+import sys
+
+from geo import geocode
+from main import Court, SessionLocal, bump_cache_version
+
+
+def geocode_courts(overwrite: bool = False):
+    db = SessionLocal()
+    try:
+        query = db.query(Court)
+        if not overwrite:
+            query = query.filter(Court.latitude.is_(None))
+        updated, unknown = 0, []
+        for court in query:
+            coordinates = geocode(court.location)
+            if coordinates is None:
+                unknown.append((court.id, court.location))
+                continue
+            court.latitude, court.longitude = coordinates
+            updated += 1
+        if updated:
+            # Running workers rebuild their spatial index and catalog cache
+            bump_cache_version(db, "courts")
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"✅ Geocoded {updated} courts")
+    for court_id, location in unknown:
+        print(f"⚠️ No coordinates for court {court_id}: {location}")
+
+
+if __name__ == "__main__":
+    geocode_courts(overwrite="--all" in sys.argv[1:])
@@ -0,0 +1,43 @@
+"""
+Production server: Gunicorn managing Uvicorn workers on one port.
+
+Usage:
+    gunicorn main:app -c gunicorn.conf.py
+    WEB_CONCURRENCY=2 DATABASE_READ_URL=sqlite:///./replica.db gunicorn main:app -c gunicorn.conf.py
+
+The app is imported once in the master and forked into the workers, so
+they start quickly and share its memory. Each worker gets
+GUNICORN_GRACEFUL_TIMEOUT seconds to finish what it is serving when it
+is stopped.
+
+The matchmaking queue lives only in worker memory, so matchmaking needs
+WEB_CONCURRENCY=1 (the default), and workers are not recycled unless
+GUNICORN_MAX_REQUESTS is set: a restarted worker would silently drop every
+queued player. The slot, spatial and text indexes follow the shared
+versions in cache_versions, so the rest of the API can run on more workers
+if matchmaking is not used; set PUBSUB_URL and RATE_LIMIT_URL then too.
+"""
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))  # 0 = never recycle workers
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))  # a worker silent this long is restarted
+keepalive = 5
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    """Give each worker fresh connection pools instead of the master's"""
+    main = sys.modules.get("main")
+    if main is None:
+        return
+    for engine in {main.engine, main.read_engine}:
+        engine.dispose(close=False)
+    for engine in {main.async_engine, main.async_read_engine} - {None}:
+        engine.sync_engine.dispose(close=False)
@@ -1,49 +1,168 @@
 """
 Pickleball Platform API - FastAPI Backend
 """
+import asyncio
+import base64
+import hashlib
+import json
 import os
-from datetime import datetime, timedelta
-from typing import Optional
-from contextlib import asynccontextmanager
-
-from fastapi import FastAPI, HTTPException, Depends, status
+import time
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+from contextlib import aclosing, asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-import bcrypt as _bcrypt
-# Fix passlib + bcrypt>=4.1 compatibility
-if not hasattr(_bcrypt, '__about__'):
-    class _About:
-        __version__ = _bcrypt.__version__
-    _bcrypt.__about__ = _About()
-
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, EmailStr, Field, ValidationError, field_validator
+from sqlalchemy import create_engine, and_, bindparam, delete, event, func, insert, inspect, literal_column, or_, select, text, union_all, Column, Integer, Float, String, Date, DateTime, Text, ForeignKey, Index, MetaData, Table
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker, Session, validates
 from dotenv import load_dotenv
 
+from analytics import aggregate_usage, daily_totals, date_range, heatmap, open_hours
+from availability import SlotBitmapIndex, mask_to_hours, parse_time_slot
+from bulk import EXPORT_BATCH_SIZE, MEDIA_TYPES, encode_rows, format_for, import_records, iter_lines, iter_records
+from cache import CachedCounter, TTLCache
+from geo import LazySpatialIndex, geocode
+from matchmaking import Matchmaker, QueueEntry, SKILL_LEVELS, skill_rank
+from metrics import Instrumentation, RequestMetricsMiddleware
+from migrations import Migration, migrate
+from passwords import PasswordHasher, PasswordHasherBusy, get_context
+from pubsub import create_pubsub
+from search import LazyTextIndex, words
+from serialization import ORJSON_AVAILABLE, FastJSONResponse, dumps, row_dicts
+from waitlist import WaitlistIndex
+from ratelimit import AdmissionControlMiddleware, RateLimiter, RateLimitRule, create_rate_limit_backend
+from replicas import PRIMARY_UNTIL_HEADER, ReadYourWrites, ReadYourWritesMiddleware
+
 # Load environment variables
 load_dotenv()
 
 # Configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pickleball.db")
+# Optional replica for GET /courts, GET /bookings and availability; a client
+# that has just written reads from the primary for DATABASE_READ_STICKY_SECONDS
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+DATABASE_READ_STICKY_SECONDS = float(os.getenv("DATABASE_READ_STICKY_SECONDS", 5))
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+STREAM_TOKEN_EXPIRE_SECONDS = 60  # only has to last until an EventSource connects
+STREAM_TOKEN_SCOPE = "message_events"
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+MAX_BATCH_SLOTS = 100  # per POST /bookings/batch
+BOOKING_LENGTH = timedelta(hours=1)  # every booking is one court hour
+MAX_MESSAGE_LENGTH = 4000
+COURTS_CACHE_MAX_AGE = int(os.getenv("COURTS_CACHE_MAX_AGE", 0))
+CATALOG_VERSION_TTL_SECONDS = float(os.getenv("CATALOG_VERSION_TTL_SECONDS", 1))
+# Encode GET /courts and GET /bookings straight from their column projections,
+# skipping per-row models and FastAPI's response validation (with orjson)
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+SEARCH_LANGUAGE = "english"  # PostgreSQL text search config baked into courts.search_vector
+PUBSUB_URL = os.getenv("PUBSUB_URL")  # unset: in-process; redis://... to share across workers
+LIVE_HEARTBEAT_SECONDS = 15  # SSE keep-alive comment interval
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 500))  # log requests slower than this with their SQL
+
+# Rate limiting and admission control
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL")  # unset: per process; redis://... to share across workers
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "20/minute")  # per IP, login and register together
+RATE_LIMIT_BOOKINGS = os.getenv("RATE_LIMIT_BOOKINGS", "30/minute")  # per IP and per user
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))  # proxies appending to X-Forwarded-For
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 100))  # per worker; 0 disables
+
+# Idempotency-Key support for POST /bookings and POST /courts
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", 10000))
+IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS = 300
+IDEMPOTENCY_CLEANUP_BATCH = 1000  # expired keys deleted per statement
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# Open-play matchmaking; the queue lives in each worker's memory
+MATCHMAKING_TICK_SECONDS = float(os.getenv("MATCHMAKING_TICK_SECONDS", 5))  # 0 disables the background matcher
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+PASSWORD_HASH_RETRY_AFTER = 1  # seconds
+
+password_hasher = PasswordHasher(
+    rounds=BCRYPT_ROUNDS,
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+)
 
 # Database
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# DB_ASYNC=true serves requests through an async engine (asyncpg / aiosqlite);
+# otherwise request DB work runs on the threadpool with the sync engine.
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def engine_options(url: str) -> dict:
+    """Pool settings shared by the sync and async engines"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # SQLite picks its own pool class per driver; sizing only applies to servers
+    if not url.startswith("sqlite"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+def async_database_url(url: str) -> str:
+    """Swap the sync driver in DATABASE_URL for its async counterpart"""
+    scheme, sep, rest = url.partition("://")
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+def create_sync_engine(url: str):
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {},
+        **engine_options(url),
+    )
+
+
+engine = create_sync_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Without a replica, reads share the primary's engine and sessions
+read_engine = create_sync_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if DATABASE_READ_URL else SessionLocal
+
+async_engine = async_read_engine = None
+AsyncSessionLocal = AsyncReadSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **engine_options(DATABASE_URL))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    async_read_engine, AsyncReadSessionLocal = async_engine, AsyncSessionLocal
+    if DATABASE_READ_URL:
+        async_read_engine = create_async_engine(async_database_url(DATABASE_READ_URL), **engine_options(DATABASE_READ_URL))
+        AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+# Per-request latency and SQL metrics, served on /metrics
+instrumentation = Instrumentation(slow_request_seconds=SLOW_REQUEST_MS / 1000)
+for instrumented in {engine, read_engine}:
+    instrumentation.instrument_engine(instrumented)
+for instrumented in {async_engine, async_read_engine} - {None}:
+    instrumentation.instrument_engine(instrumented.sync_engine)
+
 
 # Database Models
 class User(Base):
@@ -70,8 +189,28 @@ class Court(Base):
     price_per_hour = Column(Integer, default=25)
     operating_hours = Column(String(255), default="6:00 AM - 10:00 PM daily")
     photo_url = Column(String(500), nullable=True)
+    city = Column(String(100), nullable=True)  # lowercased, derived from location
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), optionally narrowed by filter
+        Index("ix_courts_created_id", "created_at", "id"),
+        Index("ix_courts_surface_created_id", "surface_type", "created_at", "id"),
+        Index("ix_courts_city_created_id", "city", "created_at", "id"),
+        Index("ix_courts_price", "price_per_hour"),
+    )
+
+    @validates("location")
+    def _derive_location_fields(self, key, location):
+        self.city = city_key(location)
+        if self.latitude is None and self.longitude is None:
+            coordinates = geocode(location)
+            if coordinates:
+                self.latitude, self.longitude = coordinates
+        return location
+
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -80,9 +219,24 @@ class Booking(Base):
     court_id = Column(Integer, ForeignKey("courts.id"))
     player_id = Column(Integer, ForeignKey("users.id"))
     time_slot = Column(String(100))
+    start_at = Column(DateTime, nullable=True)
+    end_at = Column(DateTime, nullable=True)
     status = Column(String(50), default="confirmed")
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_bookings_court_start", "court_id", "start_at"),
+        Index("ix_bookings_player_created", "player_id", "created_at"),
+        # At most one active booking per court and start hour; enforced by the
+        # database so concurrent requests can't both win the same slot.
+        Index(
+            "uq_bookings_court_start_active", "court_id", "start_at",
+            unique=True,
+            postgresql_where=text("status <> 'cancelled'"),
+            sqlite_where=text("status <> 'cancelled'"),
+        ),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -93,50 +247,529 @@ class Message(Base):
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Inbox pages and each direction of a thread are single index range scans
+        Index("ix_messages_receiver_created", "receiver_id", "created_at", "id"),
+        Index("ix_messages_sender_receiver_created", "sender_id", "receiver_id", "created_at", "id"),
+    )
+
+
+class Conversation(Base):
+    """Thread summary as seen by user_id, one row per peer.
+
+    Updated on every send, so thread lists and unread counts never have to
+    aggregate the messages table.
+    """
+    __tablename__ = "conversations"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    peer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_message_id = Column(Integer)
+    last_message_at = Column(DateTime)
+    last_read_at = Column(DateTime, nullable=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_conversations_user_last", "user_id", "last_message_at", "peer_id"),
+    )
+
+
+class CourtHourlyUsage(Base):
+    """Bookings and revenue per court, day and hour, kept current by the booking routes"""
+    __tablename__ = "court_hourly_usage"
+
+    court_id = Column(Integer, ForeignKey("courts.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0)
+    revenue = Column(Integer, nullable=False, default=0)
+
+
+class CourtDailyUsage(Base):
+    """Booked hours and revenue per court and day, kept current by the booking routes"""
+    __tablename__ = "court_daily_usage"
+
+    court_id = Column(Integer, ForeignKey("courts.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0)  # booked hours
+    revenue = Column(Integer, nullable=False, default=0)
+
+
+class BookingPlayer(Base):
+    """Everyone playing in a booking, such as the four players of a matchmade game"""
+    __tablename__ = "booking_players"
+
+    booking_id = Column(Integer, ForeignKey("bookings.id"), primary_key=True)
+    player_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_booking_players_player", "player_id", "booking_id"),
+    )
+
+
+class WaitlistEntry(Base):
+    """A player waiting for a booked slot; the lowest id for a slot is next in line"""
+    __tablename__ = "waitlist_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    court_id = Column(Integer, ForeignKey("courts.id"), nullable=False)
+    player_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    time_slot = Column(String(100), nullable=False)
+    start_at = Column(DateTime, nullable=False)
+    end_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # A court's queues load with one range scan, in line order
+        Index("ix_waitlist_court_start_id", "court_id", "start_at", "id"),
+        Index("uq_waitlist_court_start_player", "court_id", "start_at", "player_id", unique=True),
+        Index("ix_waitlist_player_start", "player_id", "start_at"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Stored response of a write made with an Idempotency-Key, replayed to retries"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256 of user, route and client key
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the request body
+    status_code = Column(Integer, nullable=False)
+    response = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class CacheVersion(Base):
+    """Change counters shared by every worker, bumped alongside the data they cover"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+def read_cache_version(db: Session, name: str) -> int:
+    return db.query(CacheVersion.version).filter(CacheVersion.name == name).scalar() or 0
+
+
+def bump_cache_version(db: Session, name: str) -> int:
+    """Increment a change counter inside the caller's transaction; returns the new value.
+
+    A counter that doesn't exist yet starts at 1, so per-court counters need
+    no row of their own until the court first changes.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(CacheVersion).values(name=name, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CacheVersion.name], set_={"version": CacheVersion.version + 1}
+    ).returning(CacheVersion.version)
+    return db.execute(stmt).scalar_one()
+
+
+def slot_bounds(time_slot: str):
+    """Convert a time slot string into (start_at, end_at) datetimes"""
+    parsed = parse_time_slot(time_slot)
+    if parsed is None:
+        return None
+    day, start_hour, end_hour = parsed
+    midnight = datetime.combine(day, datetime.min.time())
+    return midnight + timedelta(hours=start_hour), midnight + timedelta(hours=end_hour)
+
+
+def booking_bounds(time_slot: str):
+    """slot_bounds for a slot that can be booked: exactly one hour.
+
+    The unique (court, start) index only stops double bookings if every
+    booking covers a single hour; longer stays are booked hour by hour.
+    """
+    bounds = slot_bounds(time_slot)
+    if bounds is None or bounds[1] - bounds[0] != BOOKING_LENGTH:
+        return None
+    return bounds
+
+
+def city_key(location: Optional[str]) -> Optional[str]:
+    """Extract the lowercased city from an address like '123 Main St, Austin, TX'"""
+    parts = [p.strip() for p in (location or "").split(",")]
+    if len(parts) < 2 or not parts[-2]:
+        return None
+    return parts[-2].lower()
+
+
+def add_missing_columns(conn, table):
+    """Add model columns that an existing table was created without"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+# The schema 0001_baseline creates, frozen as it was: model changes after it
+# get migrations of their own. Composite indexes on the busy tables are left
+# to the online migrations that follow, so upgrading a live database from
+# before migrations doesn't lock them.
+baseline = MetaData()
+Table(
+    "users", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String(255), unique=True, index=True),
+    Column("password", String(255)),
+    Column("name", String(255)),
+    Column("role", String(50)),
+    Column("skill_level", String(50)),
+    Column("created_at", DateTime),
+)
+Table(
+    "courts", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("name", String(255)),
+    Column("location", String(255)),
+    Column("surface_type", String(100)),
+    Column("amenities", Text),
+    Column("price_per_hour", Integer),
+    Column("operating_hours", String(255)),
+    Column("photo_url", String(500), nullable=True),
+    Column("city", String(100), nullable=True),
+    Column("latitude", Float, nullable=True),
+    Column("longitude", Float, nullable=True),
+    Column("created_at", DateTime),
+)
+Table(
+    "bookings", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("court_id", Integer, ForeignKey("courts.id")),
+    Column("player_id", Integer, ForeignKey("users.id")),
+    Column("time_slot", String(100)),
+    Column("start_at", DateTime, nullable=True),
+    Column("end_at", DateTime, nullable=True),
+    Column("status", String(50)),
+    Column("created_at", DateTime),
+)
+Table(
+    "messages", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sender_id", Integer, ForeignKey("users.id")),
+    Column("receiver_id", Integer, ForeignKey("users.id")),
+    Column("content", Text),
+    Column("created_at", DateTime),
+)
+Table(
+    "conversations", baseline,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("peer_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("last_message_id", Integer),
+    Column("last_message_at", DateTime),
+    Column("last_read_at", DateTime, nullable=True),
+    Column("unread_count", Integer, nullable=False),
+)
+Table(
+    "cache_versions", baseline,
+    Column("name", String(50), primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+
+# What migrations 0003_court_usage and 0008_hourly_bookings work with, frozen
+# like baseline: the rollup tables as 0003 creates them, and only the courts
+# and bookings columns they read or write.
+rollup_schema = MetaData()
+Table(
+    "courts", rollup_schema,
+    Column("id", Integer, primary_key=True),
+    Column("price_per_hour", Integer),
+)
+Table(
+    "bookings", rollup_schema,
+    Column("id", Integer, primary_key=True),
+    Column("court_id", Integer),
+    Column("player_id", Integer),
+    Column("time_slot", String(100)),
+    Column("start_at", DateTime, nullable=True),
+    Column("end_at", DateTime, nullable=True),
+    Column("status", String(50)),
+    Column("created_at", DateTime),
+)
+Table(
+    "court_hourly_usage", rollup_schema,
+    Column("court_id", Integer, ForeignKey("courts.id"), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("hour", Integer, primary_key=True),
+    Column("bookings", Integer, nullable=False),
+    Column("revenue", Integer, nullable=False),
+)
+Table(
+    "court_daily_usage", rollup_schema,
+    Column("court_id", Integer, ForeignKey("courts.id"), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("bookings", Integer, nullable=False),
+    Column("revenue", Integer, nullable=False),
+)
+
+
+def backfill_booking_slots(conn) -> int:
+    """Fill start_at/end_at from the free-form time_slot of older bookings"""
+    bookings = baseline.tables["bookings"]
+    rows = conn.execute(
+        select(bookings.c.id, bookings.c.court_id, bookings.c.time_slot, bookings.c.status)
+        .where(bookings.c.start_at.is_(None), bookings.c.time_slot.isnot(None))
+        .order_by(bookings.c.id)
+    ).all()
+    taken = set(conn.execute(
+        select(bookings.c.court_id, bookings.c.start_at)
+        .where(bookings.c.start_at.isnot(None), bookings.c.status != "cancelled")
+    ).all()) if rows else set()
+    migrated = 0
+    for row in rows:
+        bounds = slot_bounds(row.time_slot)
+        if bounds is None:
+            continue
+        key = (row.court_id, bounds[0])
+        if row.status != "cancelled":
+            # Pre-existing double bookings keep the earliest row; later
+            # duplicates stay unstructured rather than breaking the index.
+            if key in taken:
+                continue
+            taken.add(key)
+        conn.execute(
+            bookings.update().where(bookings.c.id == row.id)
+            .values(start_at=bounds[0], end_at=bounds[1])
+        )
+        migrated += 1
+    return migrated
+
+
+def split_multi_hour_bookings(conn) -> int:
+    """Split active bookings longer than an hour into one booking per hour.
+
+    The first hour keeps the original row. An hour another booking already
+    holds is dropped from the split, as backfill_booking_slots does with
+    duplicate starts. Returns the number of bookings split.
+    """
+    bookings = rollup_schema.tables["bookings"]
+    rows = conn.execute(
+        select(
+            bookings.c.id, bookings.c.court_id, bookings.c.player_id, bookings.c.status, bookings.c.created_at,
+            bookings.c.start_at, bookings.c.end_at,
+        )
+        .where(bookings.c.start_at.isnot(None), bookings.c.end_at.isnot(None), bookings.c.status != "cancelled")
+        .order_by(bookings.c.id)
+    ).all()
+    taken = {(row.court_id, row.start_at) for row in rows}
+    split, split_courts = 0, set()
+    for row in rows:
+        if row.end_at - row.start_at <= BOOKING_LENGTH:
+            continue
+        first_end = row.start_at + BOOKING_LENGTH
+        conn.execute(
+            bookings.update().where(bookings.c.id == row.id)
+            .values(end_at=first_end, time_slot=format_time_slot(row.start_at, first_end))
+        )
+        hour = first_end
+        while hour < row.end_at:
+            if (row.court_id, hour) not in taken:
+                taken.add((row.court_id, hour))
+                conn.execute(bookings.insert().values(
+                    court_id=row.court_id, player_id=row.player_id, status=row.status, created_at=row.created_at,
+                    time_slot=format_time_slot(hour, hour + BOOKING_LENGTH), start_at=hour, end_at=hour + BOOKING_LENGTH,
+                ))
+            hour += BOOKING_LENGTH
+        split += 1
+        split_courts.add(row.court_id)
+    if split_courts:
+        recompute_usage(conn, sorted(split_courts))
+    return split
+
+
+def backfill_court_cities(conn) -> int:
+    """Derive the city filter column for courts created before it existed"""
+    courts = baseline.tables["courts"]
+    rows = conn.execute(
+        select(courts.c.id, courts.c.location)
+        .where(courts.c.city.is_(None), courts.c.location.isnot(None))
+    ).all()
+    migrated = 0
+    for row in rows:
+        city = city_key(row.location)
+        if city:
+            conn.execute(courts.update().where(courts.c.id == row.id).values(city=city))
+            migrated += 1
+    return migrated
+
+
+def slot_span(start_at: datetime, end_at: datetime) -> tuple[date, int, int]:
+    """(day, start_hour, end_hour) of a booking; a slot ending at midnight ends at hour 24"""
+    end_hour = end_at.hour if end_at.date() == start_at.date() else 24
+    return start_at.date(), start_at.hour, end_hour
+
+
+def recompute_usage(conn, court_ids: Optional[list[int]] = None) -> int:
+    """Rebuild the usage rollups from bookings; returns the number of hourly rows.
+
+    Revenue is recomputed at each court's current price, where the booking
+    routes record the price at booking time.
+    """
+    bookings, courts = rollup_schema.tables["bookings"], rollup_schema.tables["courts"]
+    hourly_table, daily_table = rollup_schema.tables["court_hourly_usage"], rollup_schema.tables["court_daily_usage"]
+    query = (
+        select(bookings.c.court_id, bookings.c.start_at, bookings.c.end_at, courts.c.price_per_hour)
+        .join(courts, courts.c.id == bookings.c.court_id)
+        .where(bookings.c.start_at.isnot(None), bookings.c.end_at.isnot(None), bookings.c.status != "cancelled")
+    )
+    clear_hourly, clear_daily = hourly_table.delete(), daily_table.delete()
+    if court_ids is not None:
+        query = query.where(bookings.c.court_id.in_(court_ids))
+        clear_hourly = clear_hourly.where(hourly_table.c.court_id.in_(court_ids))
+        clear_daily = clear_daily.where(daily_table.c.court_id.in_(court_ids))
+
+    hourly = aggregate_usage(
+        (row.court_id, *slot_span(row.start_at, row.end_at), row.price_per_hour)
+        for row in conn.execute(query)
+    )
+    conn.execute(clear_hourly)
+    conn.execute(clear_daily)
+    if hourly:
+        conn.execute(hourly_table.insert(), [
+            {"court_id": court_id, "day": day, "hour": hour, "bookings": count, "revenue": revenue}
+            for (court_id, day, hour), (count, revenue) in hourly.items()
+        ])
+        conn.execute(daily_table.insert(), [
+            {"court_id": court_id, "day": day, "bookings": count, "revenue": revenue}
+            for (court_id, day), (count, revenue) in daily_totals(hourly).items()
+        ])
+    return len(hourly)
+
+
+def migrate_0001_baseline(conn):
+    """Tables, columns and backfills as of the move to versioned migrations.
+
+    Also what a fresh database starts from. Only tables it creates get
+    indexes here; see baseline.
+    """
+    baseline.create_all(bind=conn)
+    for table in baseline.sorted_tables:
+        add_missing_columns(conn, table)
+    slots = backfill_booking_slots(conn)
+    cities = backfill_court_cities(conn)
+    versions = baseline.tables["cache_versions"]
+    if conn.execute(select(versions.c.name).where(versions.c.name == "courts")).first() is None:
+        conn.execute(versions.insert().values(name="courts", version=0))
+    # Replaced by schema_migrations
+    conn.execute(text("DROP TABLE IF EXISTS schema_state"))
+    if slots:
+        print(f"✅ Migrated {slots} booking time slots")
+    if cities:
+        print(f"✅ Backfilled {cities} court cities")
+
+
+def migrate_0003_court_usage(conn):
+    """Usage rollup tables, backfilled from existing bookings"""
+    rollup_schema.tables["court_hourly_usage"].create(bind=conn, checkfirst=True)
+    rollup_schema.tables["court_daily_usage"].create(bind=conn, checkfirst=True)
+    rows = recompute_usage(conn)
+    if rows:
+        print(f"✅ Backfilled {rows} hourly court usage rows")
+
+
+def migrate_0004_idempotency_keys(conn):
+    IdempotencyKey.__table__.create(bind=conn, checkfirst=True)
+
+
+def migrate_0005_court_search(conn):
+    """Weighted full-text vector over courts, kept current by PostgreSQL itself.
+
+    Other databases search an in-process index instead (see search.py).
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(f"""
+        ALTER TABLE courts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(city, '') || ' ' || coalesce(amenities, '')), 'B') ||
+            setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(location, '')), 'C')
+        ) STORED
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_courts_search ON courts USING gin (search_vector)"))
+
+
+def migrate_0006_booking_players(conn):
+    BookingPlayer.__table__.create(bind=conn, checkfirst=True)
+
+
+def migrate_0007_waitlist(conn):
+    WaitlistEntry.__table__.create(bind=conn, checkfirst=True)
+    versions = CacheVersion.__table__
+    if conn.execute(select(versions.c.name).where(versions.c.name == "waitlist")).first() is None:
+        conn.execute(versions.insert().values(name="waitlist", version=0))
+
+
+def migrate_0008_hourly_bookings(conn):
+    """One booking per court hour, so the unique (court, start) index covers every hour booked"""
+    split = split_multi_hour_bookings(conn)
+    if split:
+        print(f"✅ Split {split} multi-hour bookings into hourly bookings")
+
+
+def model_index(model, name: str) -> Index:
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def online_index(id: str, model, name: str) -> Migration:
+    return Migration(id, indexes=(model_index(model, name),))
+
+
+MIGRATIONS = [
+    Migration("0001_baseline", migrate_0001_baseline),
+    # GET /bookings filters on player_id and sorts by created_at
+    online_index("0002_bookings_player_created", Booking, "ix_bookings_player_created"),
+    Migration("0003_court_usage", migrate_0003_court_usage),
+    Migration("0004_idempotency_keys", migrate_0004_idempotency_keys),
+    Migration("0005_court_search", migrate_0005_court_search),
+    Migration("0006_booking_players", migrate_0006_booking_players),
+    Migration("0007_waitlist", migrate_0007_waitlist),
+    Migration("0008_hourly_bookings", migrate_0008_hourly_bookings),
+    # Indexes the baseline used to build with a blocking CREATE INDEX. Already
+    # there on databases it created; IF NOT EXISTS makes them no-ops.
+    online_index("0009_bookings_court_start", Booking, "ix_bookings_court_start"),
+    # 0001 and 0008 leave no duplicate active (court, start) for it to trip on
+    online_index("0010_bookings_court_start_active", Booking, "uq_bookings_court_start_active"),
+    online_index("0011_courts_created_id", Court, "ix_courts_created_id"),
+    online_index("0012_courts_surface_created_id", Court, "ix_courts_surface_created_id"),
+    online_index("0013_courts_city_created_id", Court, "ix_courts_city_created_id"),
+    online_index("0014_courts_price", Court, "ix_courts_price"),
+    online_index("0015_messages_receiver_created", Message, "ix_messages_receiver_created"),
+    online_index("0016_messages_sender_receiver_created", Message, "ix_messages_sender_receiver_created"),
+    online_index("0017_conversations_user_last", Conversation, "ix_conversations_user_last"),
+]
+
 
 # Initialize database
 def init_db():
-    """Create all database tables and seed demo data"""
+    """Apply pending schema migrations.
+
+    Against an up-to-date database this costs two quick queries. On PostgreSQL,
+    online index builds carry on in the background so a deploy doesn't
+    wait for them. Demo data is loaded separately with `python seed_demo.py`.
+    """
     try:
-        Base.metadata.create_all(bind=engine)
-        print("✅ Database tables initialized")
+        applied = migrate(engine, MIGRATIONS, background_online=True)
+        print("✅ Database tables initialized" if applied else "✅ Database schema up to date")
     except Exception as e:
         print(f"⚠️ Database initialization warning: {str(e)}")
         print("ℹ️ App will start, but database operations may fail until DATABASE_URL is properly configured")
-    
-    # Seed demo data (separate try block so table init errors don't block seeding)
+
+
+def warm_up():
+    """Import jose and load the bcrypt backend ahead of the first login"""
+    if FAST_JSON and not ORJSON_AVAILABLE:
+        print("⚠️ FAST_JSON is on but orjson isn't installed; responses are encoded with the json module")
     try:
-        db = SessionLocal()
-        try:
-            demo_user = db.query(User).filter(User.email == "alice@test.com").first()
-            if not demo_user:
-                # Demo users
-                alice = User(email="alice@test.com", password=hash_password("password"), name="Alice Demo", role="player", skill_level="intermediate")
-                bob = User(email="bob@test.com", password=hash_password("password"), name="Bob Smith", role="player", skill_level="beginner")
-                carol = User(email="carol@test.com", password=hash_password("password"), name="Carol Owner", role="owner", skill_level="advanced")
-                db.add_all([alice, bob, carol])
-                db.flush()
-                
-                # Demo courts (10 realistic courts across US cities)
-                courts = [
-                    Court(owner_id=carol.id, name="Sunset Pickleball Club", location="123 Sunset Blvd, San Jose, CA", surface_type="hardcourt", amenities="Lights, Restrooms, Water fountain, Ball machine rental", price_per_hour=25, operating_hours="6:00 AM - 10:00 PM daily", photo_url="https://images.unsplash.com/photo-1626224583764-f87db24ac4ea?w=800"),
-                    Court(owner_id=carol.id, name="Bay Area Courts", location="456 Marina Dr, San Francisco, CA", surface_type="hardcourt", amenities="Covered courts, Pro shop, Parking, Coaching available", price_per_hour=35, operating_hours="7:00 AM - 9:00 PM daily", photo_url="https://images.unsplash.com/photo-1554068865-24cecd4e34b8?w=800"),
-                    Court(owner_id=carol.id, name="Golden Gate Pickleball", location="789 Park Ave, Oakland, CA", surface_type="other", amenities="Indoor, Climate controlled, Locker rooms, Showers", price_per_hour=45, operating_hours="6:00 AM - 11:00 PM daily", photo_url="https://images.unsplash.com/photo-1558618666-fcd25c85f82e?w=800"),
-                    Court(owner_id=carol.id, name="Peninsula Paddle Center", location="321 El Camino Real, Palo Alto, CA", surface_type="hardcourt", amenities="Lights, Seating, Vending machines, Free Wi-Fi", price_per_hour=30, operating_hours="7:00 AM - 10:00 PM daily"),
-                    Court(owner_id=carol.id, name="South Bay Smash Courts", location="555 Stevens Creek, Cupertino, CA", surface_type="other", amenities="Outdoor, Shaded seating, Free parking, Picnic area", price_per_hour=20, operating_hours="6:00 AM - 9:00 PM daily"),
-                    Court(owner_id=carol.id, name="Desert Dink Pickleball", location="2100 E Camelback Rd, Scottsdale, AZ", surface_type="hardcourt", amenities="Shaded courts, Misting system, Pro shop, Tournament hosting", price_per_hour=28, operating_hours="5:00 AM - 9:00 PM daily", photo_url="https://images.unsplash.com/photo-1622279457486-62dcc4a431d6?w=800"),
-                    Court(owner_id=carol.id, name="Lone Star Paddle Club", location="800 Congress Ave, Austin, TX", surface_type="clay", amenities="Clay courts, Clubhouse, Bar & grill, Lessons", price_per_hour=40, operating_hours="7:00 AM - 10:00 PM Mon-Sat, 8:00 AM - 8:00 PM Sun", photo_url="https://images.unsplash.com/photo-1551698618-1dfe5d97d256?w=800"),
-                    Court(owner_id=carol.id, name="Peach State Pickleball", location="450 Peachtree St NE, Atlanta, GA", surface_type="hardcourt", amenities="Lights, Restrooms, Water stations, Beginner clinics", price_per_hour=22, operating_hours="6:00 AM - 10:00 PM daily"),
-                    Court(owner_id=carol.id, name="Mile High Dinks", location="1550 Court Pl, Denver, CO", surface_type="other", amenities="Indoor, Heated, Altitude training, Equipment rental", price_per_hour=38, operating_hours="6:00 AM - 11:00 PM daily", photo_url="https://images.unsplash.com/photo-1574629810360-7efbbe195018?w=800"),
-                    Court(owner_id=carol.id, name="Emerald City Courts", location="305 Harrison St, Seattle, WA", surface_type="hardcourt", amenities="Covered outdoor, Rain shelters, Coffee bar, Open play sessions", price_per_hour=15, operating_hours="7:00 AM - 9:00 PM daily"),
-                ]
-                db.add_all(courts)
-                db.commit()
-                print("✅ Demo data seeded: 3 users, 10 courts")
-        finally:
-            db.close()
+        import jose.jwt  # noqa: F401
+        get_context(BCRYPT_ROUNDS).handler("bcrypt").get_backend()
     except Exception as e:
-        print(f"⚠️ Seed warning: {str(e)}")
+        print(f"⚠️ Warm-up warning: {str(e)}")
 
 
 @asynccontextmanager
@@ -144,8 +777,22 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown"""
     # Startup
     init_db()
+    # Finish loading what import time deferred while health checks already pass
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+    tasks = [asyncio.create_task(purge_idempotency_keys_periodically())]
+    if MATCHMAKING_TICK_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_matchmaking_periodically()))
     yield
     # Shutdown
+    for task in tasks:
+        task.cancel()
+    password_hasher.shutdown()
+    await pubsub.close()
+    await rate_limiter.backend.close()
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
 
 
 # Pydantic Models
@@ -172,6 +819,18 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class CurrentUser(BaseModel):
+    """Identity of the authenticated caller, safe to cache between requests"""
+    id: int
+    email: str
+    name: Optional[str] = None
+    role: Optional[str] = None
+    skill_level: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
@@ -186,6 +845,8 @@ class CourtCreate(BaseModel):
     price_per_hour: Optional[int] = 25
     operating_hours: Optional[str] = "6:00 AM - 10:00 PM daily"
     photo_url: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class CourtResponse(BaseModel):
@@ -198,22 +859,126 @@ class CourtResponse(BaseModel):
     price_per_hour: Optional[int]
     operating_hours: Optional[str]
     photo_url: Optional[str]
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
 
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResponse(BaseModel):
+    created: int
+    failed: int
+    errors: list[ImportRowError]  # the first MAX_REPORTED_ERRORS
+
+
+class NearbyCourtResponse(CourtResponse):
+    distance_km: float
+
+
+class CourtSearchResult(CourtResponse):
+    score: float
+
+
 class BookingCreate(BaseModel):
     court_id: int
     time_slot: str
 
 
+class RecurrenceRule(BaseModel):
+    start: datetime  # first occurrence, on the hour, naive UTC
+    hours: int = Field(1, ge=1, le=12)  # booked as that many one-hour slots
+    frequency: Literal["daily", "weekly"] = "weekly"
+    interval: int = Field(1, ge=1, le=52)
+    count: int = Field(..., ge=1, le=MAX_BATCH_SLOTS)
+
+    @field_validator("start")
+    @classmethod
+    def _on_the_hour(cls, start: datetime) -> datetime:
+        if start.tzinfo is not None:
+            raise ValueError("start must be UTC without a timezone offset")
+        if start.minute or start.second or start.microsecond:
+            raise ValueError("start must be on the hour")
+        return start
+
+
+class BatchBookingCreate(BaseModel):
+    court_id: int
+    time_slots: list[str] = Field(default_factory=list, max_length=MAX_BATCH_SLOTS)
+    recurrence: Optional[RecurrenceRule] = None
+    atomic: bool = False  # all-or-nothing: book every slot or none
+
+
+class BatchSlotResult(BaseModel):
+    time_slot: str
+    status: Literal["created", "conflict", "duplicate", "invalid", "skipped"]
+    booking_id: Optional[int] = None
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
+
+
+class BatchBookingResponse(BaseModel):
+    court_id: int
+    created: int
+    results: list[BatchSlotResult]
+
+
+class WaitlistJoin(BaseModel):
+    court_id: int
+    time_slot: str
+
+
+class WaitlistEntryResponse(BaseModel):
+    id: int
+    court_id: int
+    time_slot: str
+    start_at: datetime
+    end_at: datetime
+    position: int  # 1 = next in line
+    created_at: datetime
+
+
+class MatchmakingJoin(BaseModel):
+    court_id: int
+    day: date
+    start_hour: int = Field(..., ge=0, le=23)  # earliest start of a one-hour game
+    end_hour: int = Field(..., ge=1, le=24)  # games end by this hour
+
+
+class MatchmakingStatus(BaseModel):
+    status: Literal["queued", "matched", "idle"]
+    court_id: Optional[int] = None
+    skill_level: Optional[str] = None
+    start_times: list[datetime] = []  # while queued: the start times still acceptable
+    booking_id: Optional[int] = None
+    time_slot: Optional[str] = None
+    player_ids: list[int] = []
+
+
+class DayAvailability(BaseModel):
+    date: date
+    bitmap: int
+    booked_hours: list[int]
+
+
+class AvailabilityResponse(BaseModel):
+    court_id: int
+    days: list[DayAvailability]
+
+
 class BookingResponse(BaseModel):
     id: int
     court_id: int
     player_id: int
     time_slot: str
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
     status: str
     court_name: Optional[str] = None
     location: Optional[str] = None
@@ -223,6 +988,81 @@ class BookingResponse(BaseModel):
         from_attributes = True
 
 
+class CancellationResponse(BookingResponse):
+    slot_reassigned: bool = False  # the slot went to the next player on its waitlist
+
+
+class MessageCreate(BaseModel):
+    receiver_id: int
+    content: str = Field(..., min_length=1, max_length=MAX_MESSAGE_LENGTH)
+
+
+class MessageResponse(BaseModel):
+    id: int
+    sender_id: int
+    receiver_id: int
+    content: str
+    sender_name: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ConversationResponse(BaseModel):
+    peer_id: int
+    peer_name: Optional[str] = None
+    last_message_id: int
+    last_message_at: datetime
+    last_read_at: Optional[datetime] = None
+    unread_count: int
+
+    class Config:
+        from_attributes = True
+
+
+class UnreadResponse(BaseModel):
+    total: int
+
+
+class StreamTokenResponse(BaseModel):
+    token: str
+    expires_in: int
+
+
+class DailyUsage(BaseModel):
+    date: date
+    booked_hours: int
+    revenue: int
+    occupancy: float  # booked hours / open hours
+
+
+class CourtUsage(BaseModel):
+    court_id: int
+    name: str
+    open_hours_per_day: int
+    booked_hours: int
+    revenue: int
+    occupancy: float
+    days: list[DailyUsage]
+
+
+class OwnerAnalyticsResponse(BaseModel):
+    start: date
+    end: date
+    booked_hours: int
+    revenue: int
+    courts: list[CourtUsage]
+
+
+class HeatmapResponse(BaseModel):
+    court_id: int
+    start: date
+    days: int
+    hours: list[int]
+    bookings: list[list[int]]  # one row per day, one column per open hour
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Pickleball Platform API",
@@ -231,6 +1071,31 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Throttle bcrypt-backed auth and bookings per IP and user, and shed load past
+# MAX_CONCURRENT_REQUESTS. Added first, so it sits inside the CORS and metrics
+# middleware: rejections still carry CORS headers and are counted.
+rate_limiter = RateLimiter(
+    create_rate_limit_backend(RATE_LIMIT_URL),
+    rules=[
+        RateLimitRule("auth", RATE_LIMIT_AUTH, [("POST", "/auth/login"), ("POST", "/auth/register")]),
+        RateLimitRule("bookings", RATE_LIMIT_BOOKINGS, [("POST", "/bookings"), ("POST", "/bookings/batch")], per_user=True),
+    ],
+    identify_user=lambda token: decode_token_subject(token),
+    trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES,
+    enabled=RATE_LIMIT_ENABLED,
+)
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limiter=rate_limiter,
+    max_concurrent=MAX_CONCURRENT_REQUESTS,
+    # Health checks must answer under load; event streams hold a request open for minutes
+    exempt=lambda path: path in ("/health", "/metrics") or path.endswith("/events"),
+)
+
+# Pin clients that just wrote to the primary while reads go to the replica
+read_your_writes = ReadYourWrites(window=DATABASE_READ_STICKY_SECONDS, enabled=DATABASE_READ_URL is not None)
+app.add_middleware(ReadYourWritesMiddleware, policy=read_your_writes)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -238,35 +1103,125 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser read the pagination cursor and the read-your-writes window
+    expose_headers=["X-Next-Cursor", PRIMARY_UNTIL_HEADER],
 )
+app.add_middleware(RequestMetricsMiddleware, instrumentation=instrumentation)
 
 
 # Health check endpoint (for Railway/Docker health checks)
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "service": "pickleball-api"}
+    return {
+        "status": "ok",
+        "service": "pickleball-api",
+        "caches": {"tokens": token_cache.stats(), "users": user_cache.stats()},
+    }
+
+
+def monitored_caches() -> dict:
+    return {"tokens": token_cache, "users": user_cache, "catalog": catalog_cache, "idempotency": idempotency_cache}
+
+
+def pool_checked_out() -> dict:
+    pool = (async_engine.sync_engine if async_engine is not None else engine).pool
+    return {(): pool.checkedout()} if hasattr(pool, "checkedout") else {}
+
+
+instrumentation.registry.callback(
+    "cache_hits_total", "In-process cache hits.", ("cache",),
+    lambda: {(name,): c.hits for name, c in monitored_caches().items()}, kind="counter")
+instrumentation.registry.callback(
+    "cache_misses_total", "In-process cache misses.", ("cache",),
+    lambda: {(name,): c.misses for name, c in monitored_caches().items()}, kind="counter")
+instrumentation.registry.callback(
+    "cache_entries", "Entries held by each in-process cache.", ("cache",),
+    lambda: {(name,): len(c) for name, c in monitored_caches().items()})
+instrumentation.registry.callback(
+    "db_pool_checked_out", "Connections currently checked out of the pool.", (), pool_checked_out)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: per-route latency, SQL per request, pool and cache stats"""
+    return Response(content=instrumentation.registry.render(), media_type="text/plain; version=0.0.4")
 
 
 # Dependency: Database session
-def get_db():
-    db = SessionLocal()
+class Database:
+    """Request-scoped database handle for async route handlers.
+
+    Route code stays ordinary sync ORM code, passed to run() as a function
+    of a Session. With the async engine it runs via AsyncSession.run_sync,
+    so queries await the driver; otherwise it runs on the threadpool.
+    replica is True when the session reads from DATABASE_READ_URL.
+    """
+
+    def __init__(self, session, replica: bool = False):
+        self.session = session
+        self.replica = replica
+
+    async def run(self, fn, *args):
+        if AsyncSessionLocal is not None:
+            return await self.session.run_sync(fn, *args)
+        return await run_in_threadpool(fn, self.session, *args)
+
+
+@asynccontextmanager
+async def open_database(replica: bool = False):
+    if AsyncSessionLocal is not None:
+        async with (AsyncReadSessionLocal if replica else AsyncSessionLocal)() as session:
+            yield Database(session, replica)
+        return
+    session = (ReadSessionLocal if replica else SessionLocal)()
     try:
-        yield db
+        yield Database(session, replica)
     finally:
-        db.close()
+        await run_in_threadpool(session.close)
+
+
+async def get_db():
+    async with open_database() as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """Session for read-only routes: the replica, unless this client just wrote"""
+    replica = DATABASE_READ_URL is not None and not getattr(request.state, "read_primary", False)
+    async with open_database(replica) as db:
+        yield db
 
 
 # Utility Functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, please retry",
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+    )
+
 
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the bcrypt worker pool"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise password_pool_busy()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """Verify a password on the bcrypt worker pool; returns (ok, rehashed or None)"""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise password_pool_busy()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    # jose and its crypto backends load on first use rather than at startup
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -278,168 +1233,1888 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# token -> user id, held until the token expires
+token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+# user id -> CurrentUser, dropped whenever the user row changes
+user_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+def decode_token_subject(token: str) -> Optional[int]:
+    """Return the user id a token was issued for, or None if it isn't valid"""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        user_id = int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+    if payload.get("scope"):
+        return None  # a stream token is good for its stream only
+    expires_in = payload.get("exp", 0) - time.time()
+    token_cache.set(token, user_id, ttl=expires_in)
+    return user_id
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-):
+    db: Database = Depends(get_db),
+) -> CurrentUser:
     """Verify JWT token and return current user"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        user_id = int(user_id)
-    except (JWTError, ValueError):
+    user_id = decode_token_subject(credentials.credentials)
+    if user_id is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        def load_user(session: Session):
+            db_user = session.query(User).filter(User.id == user_id).first()
+            return CurrentUser.model_validate(db_user) if db_user else None
+
+        user = await db.run(load_user)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(user_id, user)
     return user
 
 
+# Idempotency keys: a retried write carrying the same Idempotency-Key gets the
+# original response back instead of being executed again
+# storage key -> (fingerprint, status code, response body), in front of the table
+idempotency_cache = TTLCache(maxsize=IDEMPOTENCY_CACHE_MAX_ENTRIES, ttl=IDEMPOTENCY_TTL_SECONDS)
+
+
+class IdempotentRequest:
+    """A write made with an Idempotency-Key.
+
+    Successful responses are stored in the same transaction as the write,
+    so a retry either finds the response or finds that nothing happened.
+    """
+
+    def __init__(self, key: str, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self._stored: Optional[tuple] = None
+
+    def _replay(self, fingerprint: str, status_code: int, body: str) -> Response:
+        if fingerprint != self.fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return Response(
+            content=body, status_code=status_code, media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    def cached_response(self) -> Optional[Response]:
+        entry = idempotency_cache.get(self.key)
+        return self._replay(*entry) if entry else None
+
+    def stored_response(self, db: Session) -> Optional[Response]:
+        """The original response if this key was used before, from the front cache or the table"""
+        cached = self.cached_response()
+        if cached is not None:
+            return cached
+        row = db.get(IdempotencyKey, self.key)
+        if row is None:
+            return None
+        if row.expires_at <= datetime.utcnow():
+            # Not purged yet; the key is free to be used again
+            db.delete(row)
+            db.flush()
+            return None
+        idempotency_cache.set(self.key, (row.fingerprint, row.status_code, row.response))
+        return self._replay(row.fingerprint, row.status_code, row.response)
+
+    def store(self, db: Session, result: BaseModel, status_code: int = 200):
+        """Record the response inside the caller's transaction, before it commits"""
+        body = result.model_dump_json()
+        db.add(IdempotencyKey(
+            key=self.key,
+            fingerprint=self.fingerprint,
+            status_code=status_code,
+            response=body,
+            expires_at=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        ))
+        self._stored = (self.fingerprint, status_code, body)
+
+    def committed(self):
+        if self._stored is not None:
+            idempotency_cache.set(self.key, self._stored)
+
+
+async def get_idempotency(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+) -> Optional[IdempotentRequest]:
+    """The request's Idempotency-Key, scoped to the caller and route, if it sent one"""
+    if idempotency_key is None:
+        return None
+    if not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=422, detail=f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    scope = f"{current_user.id}\n{request.method} {request.url.path}\n{idempotency_key}"
+    return IdempotentRequest(
+        key=hashlib.sha256(scope.encode()).hexdigest(),
+        fingerprint=hashlib.sha256(await request.body()).hexdigest(),
+    )
+
+
+def purge_expired_idempotency_keys(batch_size: int = IDEMPOTENCY_CLEANUP_BATCH) -> int:
+    """Delete expired keys a batch per transaction, so no single statement holds locks for long"""
+    keys = IdempotencyKey.__table__
+    purged = 0
+    while True:
+        with engine.begin() as conn:
+            expired = select(keys.c.key).where(keys.c.expires_at <= datetime.utcnow()).limit(batch_size)
+            deleted = conn.execute(keys.delete().where(keys.c.key.in_(expired))).rowcount
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+async def purge_idempotency_keys_periodically():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(purge_expired_idempotency_keys)
+        except Exception as e:
+            print(f"⚠️ Idempotency key cleanup failed: {str(e)}")
+
+
 # Auth Routes
 @app.post("/auth/register", response_model=TokenResponse)
-def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: Database = Depends(get_db)):
     """Register a new user"""
     # Check if user exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.run(
+        lambda session: session.query(User.id).filter(User.email == user_data.email).first()
+    )
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
     
     # Create user
-    hashed_password = hash_password(user_data.password)
-    db_user = User(
-        email=user_data.email,
-        password=hashed_password,
-        name=user_data.name,
-        role=user_data.role,
-        skill_level=user_data.skill_level,
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    hashed_password = await hash_password_async(user_data.password)
+
+    def insert_user(session: Session):
+        db_user = User(
+            email=user_data.email,
+            password=hashed_password,
+            name=user_data.name,
+            role=user_data.role,
+            skill_level=user_data.skill_level,
+        )
+        session.add(db_user)
+        session.commit()
+        session.refresh(db_user)
+        return UserResponse.model_validate(db_user)
+
+    user = await db.run(insert_user)
     
     # Generate token
     access_token = create_access_token(
-        data={"sub": str(db_user.id)},
+        data={"sub": str(user.id)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": UserResponse.model_validate(db_user)
+        "user": user
     }
 
 
 @app.post("/auth/login", response_model=TokenResponse)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: Database = Depends(get_db)):
     """User login"""
-    user = db.query(User).filter(User.email == credentials.email).first()
-    if not user or not verify_password(credentials.password, user.password):
+    user = await db.run(
+        lambda session: session.query(User).filter(User.email == credentials.email).first()
+    )
+    valid, rehashed = (False, None)
+    if user:
+        valid, rehashed = await verify_password_async(credentials.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
+    user_response = UserResponse.model_validate(user)
+    if rehashed:
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it in place
+        def save_rehash(session: Session):
+            user.password = rehashed
+            session.commit()
+
+        await db.run(save_rehash)
     
     # Generate token
     access_token = create_access_token(
-        data={"sub": str(user.id)},
+        data={"sub": str(user_response.id)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": UserResponse.model_validate(user)
+        "user": user_response
     }
 
 
 # Courts Routes
+COURTS_PAGE_SIZE = 50
+COURTS_MAX_PAGE_SIZE = 200
+
+court_columns = [getattr(Court, name) for name in CourtResponse.model_fields]
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for pages ordered by (created_at, id) descending"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def older_than(created_column, id_column, after):
+    """Keyset predicate for the rows after a decoded cursor"""
+    created_at, row_id = after
+    return or_(created_column < created_at, and_(created_column == created_at, id_column < row_id))
+
+
+# Serialized GET /courts responses keyed by (catalog version, query string)
+catalog_cache = TTLCache(maxsize=256, ttl=3600)
+catalog_version = CachedCounter(ttl=CATALOG_VERSION_TTL_SECONDS)
+
+
+def read_catalog_version(db: Session) -> int:
+    return read_cache_version(db, "courts")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
 @app.get("/courts", response_model=list[CourtResponse])
-def get_courts(db: Session = Depends(get_db)):
-    """Get all courts"""
-    courts = db.query(Court).order_by(Court.created_at.desc()).all()
-    return courts
+async def get_courts(
+    request: Request,
+    surface_type: Optional[str] = None,
+    city: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    limit: int = Query(COURTS_PAGE_SIZE, ge=1, le=COURTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    all_courts: bool = Query(False, alias="all"),
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_read_db),
+):
+    """List courts, newest first.
+
+    Results are paginated by keyset on (created_at, id); the cursor for the
+    next page is returned in the X-Next-Cursor header. Pass all=true for the
+    full, unpaginated catalog.
+
+    Serialized pages are cached per catalog version and carry a strong
+    ETag, so revalidation with If-None-Match is answered from memory.
+    """
+    after = decode_cursor(cursor) if cursor and not all_courts else None
+
+    def list_courts(session: Session):
+        query = session.query(*court_columns)
+        if surface_type:
+            query = query.filter(Court.surface_type == surface_type)
+        if city:
+            query = query.filter(Court.city == city.strip().lower())
+        if min_price is not None:
+            query = query.filter(Court.price_per_hour >= min_price)
+        if max_price is not None:
+            query = query.filter(Court.price_per_hour <= max_price)
+        query = query.order_by(Court.created_at.desc(), Court.id.desc())
+
+        if all_courts:
+            return query.all()
+        if after:
+            query = query.filter(older_than(Court.created_at, Court.id, after))
+        return query.limit(limit + 1).all()
+
+    def list_replica_courts(session: Session):
+        # Version first: if the replica had reached it, the rows read after do too
+        caught_up = read_catalog_version(session) >= version
+        return caught_up, list_courts(session)
+
+    # A client pinned to the primary after a write mustn't trust a version cached from the replica
+    pinned = DATABASE_READ_URL is not None and not db.replica
+    version = None if pinned else catalog_version.get()
+    if version is None:
+        version = await db.run(read_catalog_version)
+        catalog_version.set(version)
+
+    cache_key = (version, str(sorted(request.query_params.multi_items())))
+    entry = catalog_cache.get(cache_key)
+    if entry is None:
+        cacheable = True
+        if db.replica:
+            # The version may come from this worker's own writes, ahead of a lagging replica
+            cacheable, rows = await db.run(list_replica_courts)
+        else:
+            rows = await db.run(list_courts)
+        headers = {}
+        if not all_courts and len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+        if FAST_JSON:
+            body = dumps(row_dicts(rows))
+        else:
+            body = json.dumps(
+                jsonable_encoder([CourtResponse.model_validate(row) for row in rows]),
+                separators=(",", ":"),
+            ).encode()
+        headers["ETag"] = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        entry = (body, headers)
+        if cacheable:
+            catalog_cache.set(cache_key, entry)
+
+    body, headers = entry
+    headers = {
+        **headers,
+        "Cache-Control": f"public, max-age={COURTS_CACHE_MAX_AGE}" if COURTS_CACHE_MAX_AGE else "no-cache",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Spatial index over court coordinates, rebuilt lazily after the courts version moves
+court_locations = LazySpatialIndex()
+
+
+def load_court_points(db: Session):
+    return db.query(Court.id, Court.latitude, Court.longitude).filter(
+        Court.latitude.isnot(None), Court.longitude.isnot(None)
+    ).all()
+
+
+@app.get("/courts/nearby", response_model=list[NearbyCourtResponse])
+async def get_nearby_courts(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(25, gt=0, le=500, description="Search radius in km"),
+    limit: int = Query(COURTS_PAGE_SIZE, ge=1, le=COURTS_MAX_PAGE_SIZE),
+    db: Database = Depends(get_db),
+):
+    """Get courts within a radius of a point, nearest first"""
+    def find_nearby(session: Session):
+        index = court_locations.get(lambda: load_court_points(session), read_catalog_version(session))
+        hits = index.within(lat, lng, radius)[:limit]
+        if not hits:
+            return []
+        rows = {row.id: row for row in session.query(*court_columns).filter(Court.id.in_([h[0] for h in hits]))}
+        return [
+            NearbyCourtResponse(**rows[court_id]._asdict(), distance_km=round(distance, 3))
+            for court_id, distance in hits
+            if court_id in rows
+        ]
+
+    return await db.run(find_nearby)
+
+
+# Full-text index for databases without their own (SQLite), kept current on create_court
+# and rebuilt when another worker moves the courts version
+court_text_index = LazyTextIndex()
+
+
+def load_court_documents(db: Session):
+    rows = db.query(Court.id, Court.name, Court.city, Court.amenities, Court.location).all()
+    return [
+        (row.id, {"name": row.name, "city": row.city, "amenities": row.amenities, "location": row.location})
+        for row in rows
+    ]
+
+
+def court_document(court) -> dict:
+    return {"name": court.name, "city": city_key(court.location), "amenities": court.amenities, "location": court.location}
+
+
+def search_courts_postgres(db: Session, query: str, limit: int, offset: int):
+    """(total, [(court id, score)]) from the search_vector GIN index"""
+    # Words are plain alphanumerics, so they are safe to join into tsquery syntax;
+    # the last one matches as a prefix for search-as-you-type
+    tsquery = func.to_tsquery(SEARCH_LANGUAGE, " & ".join(words(query)) + ":*")
+    vector = literal_column("courts.search_vector")
+    rank = func.ts_rank_cd(vector, tsquery).label("score")
+    rows = (
+        db.query(Court.id, rank, func.count().over().label("total"))
+        .filter(vector.op("@@")(tsquery))
+        .order_by(rank.desc(), Court.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    if not rows and offset:
+        total = db.query(func.count(Court.id)).filter(vector.op("@@")(tsquery)).scalar()
+        return total, []
+    return (rows[0].total if rows else 0), [(row.id, round(row.score, 4)) for row in rows]
+
+
+@app.get("/courts/search", response_model=list[CourtSearchResult])
+async def search_courts(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=COURTS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Database = Depends(get_db),
+):
+    """Search courts by name, city, amenities and location, best match first.
+
+    Every word has to match and the last one may be a prefix, so results
+    narrow as the user types. The total number of matches is returned in
+    the X-Total-Count header.
+    """
+    if not words(q):
+        raise HTTPException(status_code=400, detail="Search query must contain a letter or digit")
+
+    def find_courts(session: Session):
+        if session.get_bind().dialect.name == "postgresql":
+            total, hits = search_courts_postgres(session, q, limit, offset)
+        else:
+            total, hits = court_text_index.search(
+                lambda: load_court_documents(session), q, limit, offset, read_catalog_version(session)
+            )
+        if not hits:
+            return total, []
+        rows = {row.id: row for row in session.query(*court_columns).filter(Court.id.in_([h[0] for h in hits]))}
+        return total, [
+            CourtSearchResult(**rows[court_id]._asdict(), score=score)
+            for court_id, score in hits
+            if court_id in rows
+        ]
+
+    total, results = await db.run(find_courts)
+    response.headers["X-Total-Count"] = str(total)
+    return results
+
+
+@app.get("/courts/{court_id:int}", response_model=CourtResponse)
+async def get_court(court_id: int, db: Database = Depends(get_db)):
+    """Get a single court"""
+    court = await db.run(
+        lambda session: session.query(*court_columns).filter(Court.id == court_id).first()
+    )
+    if not court:
+        raise HTTPException(status_code=404, detail="Court not found")
+    return court
+
+
+def court_values(court_data: CourtCreate, owner_id: int) -> dict:
+    """Column values for a new court, with city and coordinates derived as Court's validator does"""
+    values = court_data.model_dump(exclude={"latitude", "longitude"})
+    for name in ("price_per_hour", "operating_hours"):
+        if values[name] is None:  # e.g. an empty CSV cell
+            values[name] = CourtCreate.model_fields[name].default
+    values["owner_id"] = owner_id
+    values["city"] = city_key(court_data.location)
+    if court_data.latitude is not None and court_data.longitude is not None:
+        coordinates = (court_data.latitude, court_data.longitude)
+    else:
+        coordinates = geocode(court_data.location)
+    # Every row gets the same keys, so a chunk goes out as one multi-row INSERT
+    values["latitude"], values["longitude"] = coordinates or (None, None)
+    return values
 
 
 @app.post("/courts", response_model=CourtResponse)
-def create_court(
+async def create_court(
     court_data: CourtCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    idempotency: Optional[IdempotentRequest] = Depends(get_idempotency),
+    db: Database = Depends(get_db)
 ):
-    """Create a new court (requires authentication)"""
+    """Create a new court (requires authentication; honours Idempotency-Key)"""
+    if idempotency and (replay := idempotency.cached_response()):
+        return replay
+
+    def insert_court(session: Session):
+        if idempotency and (replay := idempotency.stored_response(session)):
+            return replay, None
+        db_court = Court(**court_values(court_data, current_user.id))
+        session.add(db_court)
+        session.flush()
+        version = bump_cache_version(session, "courts")
+        court = CourtResponse.model_validate(db_court)
+        if idempotency:
+            idempotency.store(session, court)
+        try:
+            session.commit()
+        except IntegrityError:
+            # A concurrent retry with the same key committed first
+            session.rollback()
+            if idempotency and (replay := idempotency.stored_response(session)):
+                return replay, None
+            raise
+        if idempotency:
+            idempotency.committed()
+        return court, version
+
+    court, version = await db.run(insert_court)
+    if version is not None:
+        catalog_version.set(version)
+        court_locations.invalidate()
+        court_text_index.add(court.id, court_document(court), version)
     
-    db_court = Court(
-        owner_id=current_user.id,
-        name=court_data.name,
-        location=court_data.location,
-        surface_type=court_data.surface_type,
-        amenities=court_data.amenities,
+    return court
+
+
+# Bulk import and export
+def import_court_chunk(db: Session, owner_id: int, records: list[tuple]) -> tuple[int, list[tuple[int, str]]]:
+    """Validate a chunk of (line, record) pairs and insert the valid courts in one statement.
+
+    Returns the number inserted and (line, error) for each rejected record.
+    The courts version is bumped with each chunk, so courts are visible to
+    every worker's caches as soon as they are committed.
+    """
+    rows, errors = [], []
+    for line, record in records:
+        if isinstance(record, Exception):
+            errors.append((line, str(record)))
+            continue
+        try:
+            court_data = CourtCreate.model_validate(record)
+        except ValidationError as e:
+            errors.append((line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())))
+            continue
+        rows.append(court_values(court_data, owner_id))
+    if rows:
+        # render_nulls keeps rows with and without NULLs in the same batch
+        db.execute(insert(Court).execution_options(render_nulls=True), rows)
+        bump_cache_version(db, "courts")
+        db.commit()
+    return len(rows), errors
+
+
+@app.post("/courts/import", response_model=ImportResponse)
+async def import_courts(
+    request: Request,
+    fmt: Optional[Literal["ndjson", "csv"]] = Query(None, alias="format"),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Create courts from an NDJSON or CSV upload (requires authentication).
+
+    The body is parsed as it streams in and inserted in chunks, each its own
+    transaction, so valid rows are kept even when others are rejected.
+    The format comes from ?format= or the Content-Type.
+    """
+    fmt = fmt or format_for(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send application/x-ndjson or text/csv, or pass format=",
+        )
+    committed = 0
+
+    async def insert_chunk(chunk):
+        nonlocal committed
+        inserted, chunk_errors = await db.run(import_court_chunk, current_user.id, chunk)
+        committed += inserted
+        return inserted, chunk_errors
+
+    try:
+        created, failed, errors = await import_records(iter_records(iter_lines(request.stream()), fmt), insert_chunk)
+    finally:
+        # Even if the upload broke off, the chunks already committed are kept
+        if committed:
+            catalog_version.expire()
+            court_locations.invalidate()
+            court_text_index.invalidate()
+    return ImportResponse(
+        created=created,
+        failed=failed,
+        errors=[ImportRowError(line=line, error=error) for line, error in errors],
     )
-    db.add(db_court)
-    db.commit()
-    db.refresh(db_court)
-    
-    return db_court
+
+
+booking_export_columns = [
+    Booking.id, Booking.court_id, Booking.player_id, Booking.time_slot,
+    Booking.start_at, Booking.end_at, Booking.status, Booking.created_at,
+]
+
+
+def export_query(table: str):
+    """SELECT for every row of an export, in id order, and its column names"""
+    columns = court_columns if table == "courts" else booking_export_columns
+    return select(*columns).order_by(columns[0]), [column.key for column in columns]
+
+
+def stream_export(statement, columns: list[str], fmt: str):
+    """Encoded export chunks, read through a server-side cursor on a connection of its own.
+
+    Only one batch of rows is in memory at a time; the connection is held
+    until the client has downloaded the last one.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        yield from encode_rows(result.partitions(), columns, fmt)
+
+
+def export_response(statement, columns: list[str], fmt: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_export(statement, columns, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+@app.get("/courts/export")
+async def export_courts(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """Stream every court as NDJSON or CSV (requires authentication)"""
+    statement, columns = export_query("courts")
+    return export_response(statement, columns, fmt, "courts")
+
+
+# In-process occupancy bitmaps, one bit per hour per (court, day)
+slot_index = SlotBitmapIndex()
+
+
+def slots_version_name(court_id: int) -> str:
+    """The shared version bumped by every change to a court's bookings"""
+    return f"slots:{court_id}"
+
+
+def ensure_slot_index(db: Session, court_id: int):
+    """Warm the slot index for a court from the bookings table, or reload it if another worker changed them"""
+    version = read_cache_version(db, slots_version_name(court_id))
+    if slot_index.is_current(court_id, version):
+        return
+    # Only hours that can still be booked; the index drops past days anyway
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    rows = db.query(Booking.start_at).filter(
+        Booking.court_id == court_id,
+        Booking.start_at >= today,
+        Booking.status != "cancelled",
+    ).all()
+    slot_index.load(court_id, (row.start_at for row in rows), version)
+
+
+def mark_booked(court_id: int, starts: list[datetime], version: Optional[int]):
+    """Add this process's own bookings to the slot index once committed"""
+    if version is not None and slot_index.advance(court_id, version):
+        for start_at in starts:
+            slot_index.mark(court_id, start_at)
+
+
+@app.get("/courts/{court_id:int}/availability", response_model=AvailabilityResponse)
+async def get_court_availability(
+    court_id: int,
+    from_date: Optional[date] = Query(None, alias="from"),
+    days: int = Query(7, ge=1, le=31),
+    db: Database = Depends(get_read_db),
+):
+    """Get booked hours for a court over a range of days"""
+    def load_court(session: Session):
+        if not session.query(Court.id).filter(Court.id == court_id).first():
+            return False
+        ensure_slot_index(session, court_id)
+        return True
+
+    if not db.replica:
+        found = await db.run(load_court)
+    else:
+        def check_court(session: Session):
+            if not session.query(Court.id).filter(Court.id == court_id).first():
+                return False, 0
+            return True, read_cache_version(session, slots_version_name(court_id))
+
+        found, version = await db.run(check_court)
+        # A replica that trails the primary only ever asks for an older version
+        if found and not slot_index.is_current(court_id, version):
+            # Booking and waitlist checks trust the slot index, so it's only ever loaded from the primary
+            async with open_database() as primary:
+                await primary.run(ensure_slot_index, court_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Court not found")
+
+    start = from_date or datetime.utcnow().date()
+    result = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        bitmap = slot_index.get(court_id, day)
+        result.append(DayAvailability(date=day, bitmap=bitmap, booked_hours=mask_to_hours(bitmap)))
+    return AvailabilityResponse(court_id=court_id, days=result)
+
+
+# Live availability: booking changes fan out to every client watching a court
+pubsub = create_pubsub(PUBSUB_URL)
+
+
+def court_channel(court_id: int) -> str:
+    return f"court:{court_id}"
+
+
+def slot_event(court_id: int, time_slots: list[str], slot_status: str) -> Optional[dict]:
+    """Delta event listing the hours that changed, grouped by day"""
+    days: dict[str, list[int]] = {}
+    for time_slot in time_slots:
+        parsed = parse_time_slot(time_slot)
+        if parsed is None:
+            continue
+        day, start, end = parsed
+        days.setdefault(day.isoformat(), []).extend(range(start, end))
+    if not days:
+        return None
+    return {
+        "type": "slots",
+        "court_id": court_id,
+        "status": slot_status,
+        "slots": [{"date": day, "hours": sorted(hours)} for day, hours in sorted(days.items())],
+    }
+
+
+async def publish_slots(court_id: int, time_slots: list[str], slot_status: str = "booked"):
+    """Broadcast a slot delta; the booking itself has already committed"""
+    event = slot_event(court_id, time_slots, slot_status)
+    if event is None:
+        return
+    try:
+        await pubsub.publish(court_channel(court_id), event)
+    except Exception as e:
+        print(f"⚠️ Live update failed for court {court_id}: {str(e)}")
+
+
+async def court_exists(court_id: int) -> bool:
+    # Uses its own short-lived session so long-lived streams don't hold a connection
+    async with aclosing(get_db()) as sessions:
+        async for db in sessions:
+            return await db.run(lambda session: session.query(Court.id).filter(Court.id == court_id).first() is not None)
+
+
+def event_stream(channel: str, request: Request, hello: dict) -> StreamingResponse:
+    """Server-Sent Events response relaying a pub/sub channel until the client leaves"""
+    async def stream():
+        async with pubsub.subscribe(channel) as subscription:
+            yield f"data: {json.dumps(hello)}\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                yield f"data: {json.dumps(event)}\n\n" if event else ": ping\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/courts/{court_id:int}/events")
+async def court_events(court_id: int, request: Request):
+    """Server-Sent Events stream of booking changes for a court"""
+    if not await court_exists(court_id):
+        raise HTTPException(status_code=404, detail="Court not found")
+    return event_stream(court_channel(court_id), request, {"type": "subscribed", "court_id": court_id})
+
+
+@app.websocket("/courts/{court_id:int}/live")
+async def court_live(websocket: WebSocket, court_id: int):
+    """WebSocket stream of booking changes for a court"""
+    if not await court_exists(court_id):
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    async with pubsub.subscribe(court_channel(court_id)) as subscription:
+        await websocket.send_json({"type": "subscribed", "court_id": court_id})
+
+        async def forward():
+            async for event in subscription:
+                await websocket.send_json(event)
+
+        sender = asyncio.create_task(forward())
+        try:
+            # Clients only listen; receiving just tells us when they go away
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            sender.cancel()
 
 
 # Bookings Routes
+def booking_rows(db: Session):
+    """Bookings joined with their court, projected to BookingResponse columns"""
+    return db.query(
+        Booking.id,
+        Booking.court_id,
+        Booking.player_id,
+        Booking.time_slot,
+        Booking.start_at,
+        Booking.end_at,
+        Booking.status,
+        Booking.created_at,
+        Court.name.label("court_name"),
+        Court.location.label("location"),
+    ).outerjoin(Court, Court.id == Booking.court_id)
+
+
+def upsert_usage(db: Session, model, rows: list[dict], price):
+    """Add bookings to a usage rollup, summing into existing rows, in one statement.
+
+    Revenue is each row's booked hours times the price expression, so the
+    court's price is read by the same statement rather than a separate query.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    keys = [column.name for column in model.__table__.primary_key]
+    stmt = dialect_insert(model).values(
+        **{key: bindparam(key) for key in keys},
+        bookings=bindparam("booked"),
+        revenue=bindparam("booked") * price,
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=keys, set_={
+        "bookings": model.bookings + stmt.excluded.bookings,
+        "revenue": model.revenue + stmt.excluded.revenue,
+    })
+    db.execute(stmt, rows)
+
+
+def record_usage(db: Session, court_id: int, slots: list[tuple[datetime, datetime]], sign: int = 1):
+    """Fold new bookings (or, with sign=-1, cancelled ones) into the usage rollups inside the caller's transaction"""
+    price = select(func.coalesce(Court.price_per_hour, 0)).where(Court.id == court_id).scalar_subquery()
+    hourly = aggregate_usage([(court_id, *slot_span(*slot), 0) for slot in slots], use_numpy=False)
+    if not hourly:
+        return
+    upsert_usage(db, CourtHourlyUsage, [
+        {"court_id": court, "day": day, "hour": hour, "booked": count * sign}
+        for (court, day, hour), (count, _) in hourly.items()
+    ], price)
+    upsert_usage(db, CourtDailyUsage, [
+        {"court_id": court, "day": day, "booked": count * sign}
+        for (court, day), (count, _) in daily_totals(hourly).items()
+    ], price)
+    if sign < 0:  # drop emptied rows, as recompute_usage would never write them
+        days = {day for _, day, _ in hourly}
+        for model in (CourtHourlyUsage, CourtDailyUsage):
+            db.execute(delete(model).where(model.court_id == court_id, model.day.in_(days), model.bookings <= 0))
+
+
 @app.get("/bookings", response_model=list[BookingResponse])
-def get_bookings(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_bookings(current_user: CurrentUser = Depends(get_current_user), db: Database = Depends(get_read_db)):
     """Get user's bookings (requires authentication)"""
-    
-    bookings = db.query(Booking).filter(
+    rows = await db.run(lambda session: booking_rows(session).filter(
         Booking.player_id == current_user.id
-    ).order_by(Booking.created_at.desc()).all()
-    
-    # Add court details
-    result = []
-    for booking in bookings:
-        court = db.query(Court).filter(Court.id == booking.court_id).first()
-        booking_dict = BookingResponse.model_validate(booking)
-        if court:
-            booking_dict.court_name = court.name
-            booking_dict.location = court.location
-        result.append(booking_dict)
-    
-    return result
+    ).order_by(Booking.created_at.desc()).all())
+    if FAST_JSON:
+        return FastJSONResponse(row_dicts(rows))
+    return [BookingResponse.model_validate(row) for row in rows]
 
 
 @app.post("/bookings", response_model=BookingResponse)
-def create_booking(
+async def create_booking(
     booking_data: BookingCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    idempotency: Optional[IdempotentRequest] = Depends(get_idempotency),
+    db: Database = Depends(get_db)
 ):
-    """Create a new booking (requires authentication)"""
-    
-    db_booking = Booking(
-        court_id=booking_data.court_id,
-        player_id=current_user.id,
-        time_slot=booking_data.time_slot,
+    """Create a new booking (requires authentication; honours Idempotency-Key)"""
+    bounds = booking_bounds(booking_data.time_slot)
+    if bounds is None:
+        raise HTTPException(status_code=422, detail="Invalid time slot; bookings are one hour, e.g. 2026-03-01 10:00-11:00")
+    if idempotency and (replay := idempotency.cached_response()):
+        return replay
+
+    def insert_booking(session: Session):
+        if idempotency and (replay := idempotency.stored_response(session)):
+            return replay
+        db_booking = Booking(
+            court_id=booking_data.court_id,
+            player_id=current_user.id,
+            time_slot=booking_data.time_slot,
+            start_at=bounds[0],
+            end_at=bounds[1],
+        )
+        session.add(db_booking)
+        try:
+            session.flush()
+            record_usage(session, booking_data.court_id, [bounds])
+            # Read the booking back together with its court details in one
+            # round trip, before commit so the response can be stored with it
+            booking = BookingResponse.model_validate(
+                booking_rows(session).filter(Booking.id == db_booking.id).one()
+            )
+            if idempotency:
+                idempotency.store(session, booking)
+            version = bump_cache_version(session, slots_version_name(booking_data.court_id))
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            # A concurrent retry with the same key may have booked the slot
+            if idempotency and (replay := idempotency.stored_response(session)):
+                return replay
+            if not session.query(Court.id).filter(Court.id == booking_data.court_id).first():
+                raise HTTPException(status_code=404, detail="Court not found")
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Time slot already booked")
+        if idempotency:
+            idempotency.committed()
+        mark_booked(booking_data.court_id, [bounds[0]], version)
+        return booking
+
+    result = await db.run(insert_booking)
+    if isinstance(result, BookingResponse):
+        await publish_slots(booking_data.court_id, [booking_data.time_slot])
+    return result
+
+
+def format_time_slot(start: datetime, end: datetime) -> str:
+    end_label = "24:00" if end.date() != start.date() and end.hour == 0 else f"{end.hour:02d}:00"
+    return f"{start.date().isoformat()} {start.hour:02d}:00-{end_label}"
+
+
+def expand_recurrence(rule: RecurrenceRule) -> list[str]:
+    """One-hour time slot strings covering every occurrence of a recurrence rule"""
+    step = timedelta(days=rule.interval * (7 if rule.frequency == "weekly" else 1))
+    slots = []
+    for n in range(rule.count):
+        for hour in range(rule.hours):
+            start = rule.start + step * n + BOOKING_LENGTH * hour
+            slots.append(format_time_slot(start, start + BOOKING_LENGTH))
+    return slots
+
+
+@app.get("/bookings/export")
+async def export_bookings(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """Stream bookings as NDJSON or CSV (requires authentication).
+
+    Owners get every booking on their courts, players their own bookings;
+    from/to narrow the export to bookings starting on those days.
+    """
+    statement, columns = export_query("bookings")
+    if current_user.role == "owner":
+        statement = statement.join(Court, Court.id == Booking.court_id).where(Court.owner_id == current_user.id)
+    else:
+        statement = statement.where(Booking.player_id == current_user.id)
+    if from_date:
+        statement = statement.where(Booking.start_at >= datetime.combine(from_date, datetime.min.time()))
+    if to_date:
+        statement = statement.where(Booking.start_at < datetime.combine(to_date + timedelta(days=1), datetime.min.time()))
+    return export_response(statement, columns, fmt, "bookings")
+
+
+@app.post("/bookings/batch", response_model=BatchBookingResponse)
+async def create_bookings_batch(
+    batch: BatchBookingCreate,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Book many slots on one court in a single transaction (requires authentication).
+
+    Slots come from time_slots and/or a recurrence rule. Each gets its own
+    result; with atomic=true nothing is booked unless every slot is free.
+    """
+    time_slots = list(batch.time_slots)
+    if batch.recurrence:
+        time_slots += expand_recurrence(batch.recurrence)
+    if not time_slots:
+        raise HTTPException(status_code=422, detail="No time slots given")
+    if len(time_slots) > MAX_BATCH_SLOTS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_SLOTS} slots per batch")
+
+    results = [BatchSlotResult(time_slot=time_slot, status="invalid") for time_slot in time_slots]
+    pending: dict[datetime, BatchSlotResult] = {}
+    for result in results:
+        bounds = booking_bounds(result.time_slot)
+        if bounds is None:
+            continue
+        result.start_at, result.end_at = bounds
+        if bounds[0] in pending:
+            result.status = "duplicate"
+            continue
+        result.status = "created"
+        pending[bounds[0]] = result
+
+    def insert_batch(session: Session):
+        if not session.query(Court.id).filter(Court.id == batch.court_id).first():
+            raise HTTPException(status_code=404, detail="Court not found")
+
+        # One indexed lookup for every requested start time
+        taken = {
+            row.start_at for row in session.query(Booking.start_at).filter(
+                Booking.court_id == batch.court_id,
+                Booking.start_at.in_(list(pending)),
+                Booking.status != "cancelled",
+            )
+        } if pending else set()
+        for start_at in taken:
+            pending.pop(start_at).status = "conflict"
+
+        failed = any(r.status != "created" for r in results)
+        if not pending or (batch.atomic and failed):
+            return
+
+        rows = [
+            {
+                "court_id": batch.court_id,
+                "player_id": current_user.id,
+                "time_slot": r.time_slot,
+                "start_at": r.start_at,
+                "end_at": r.end_at,
+            }
+            for r in pending.values()
+        ]
+        try:
+            # Multi-row INSERT; rows are matched back by start time, which is
+            # unique within the batch, so RETURNING order doesn't matter
+            inserted = session.execute(insert(Booking).returning(Booking.id, Booking.start_at), rows).all()
+            record_usage(session, batch.court_id, [(row["start_at"], row["end_at"]) for row in rows])
+            version = bump_cache_version(session, slots_version_name(batch.court_id))
+            session.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent booking; fall back to per-slot savepoints
+            session.rollback()
+            if batch.atomic:
+                for r in pending.values():
+                    r.status = "conflict"
+                return
+            inserted = []
+            for row, r in zip(rows, pending.values()):
+                try:
+                    with session.begin_nested():
+                        inserted.append(session.execute(
+                            insert(Booking).returning(Booking.id, Booking.start_at), [row]
+                        ).one())
+                except IntegrityError:
+                    r.status = "conflict"
+            booked = {start_at for _, start_at in inserted}
+            record_usage(session, batch.court_id, [
+                (row["start_at"], row["end_at"]) for row in rows if row["start_at"] in booked
+            ])
+            version = bump_cache_version(session, slots_version_name(batch.court_id)) if inserted else None
+            session.commit()
+        for booking_id, start_at in inserted:
+            pending[start_at].booking_id = booking_id
+        return version
+
+    version = await db.run(insert_batch)
+
+    created = [r for r in results if r.status == "created" and r.booking_id]
+    if batch.atomic and len(created) != len(results):
+        for r in results:
+            if r.status == "created":
+                r.status = "skipped"
+        response.status_code = status.HTTP_409_CONFLICT
+    mark_booked(batch.court_id, [r.start_at for r in created], version)
+    await publish_slots(batch.court_id, [r.time_slot for r in created])
+    return BatchBookingResponse(court_id=batch.court_id, created=len(created), results=results)
+
+
+# Cancellation and waitlist
+# This process's copy of the waitlist queues, checked against the shared version
+waitlist_index = WaitlistIndex()
+
+
+def sync_waitlist(db: Session, court_id: int):
+    """Bring this process's view of a court's waitlist up to date"""
+    waitlist_index.sync(read_cache_version(db, "waitlist"))
+    if not waitlist_index.is_loaded(court_id):
+        rows = db.query(WaitlistEntry.id, WaitlistEntry.start_at, WaitlistEntry.player_id).filter(
+            WaitlistEntry.court_id == court_id,
+            WaitlistEntry.start_at >= datetime.utcnow(),
+        ).all()
+        waitlist_index.load(court_id, rows)
+
+
+def promote_from_waitlist(db: Session, court_id: int, start_at: datetime):
+    """Book a freed slot for the first player waiting on it, inside the caller's transaction.
+
+    Returns the waitlist entry promoted and the new booking's id, or None
+    if nobody is waiting or the slot was taken again in the meantime.
+    """
+    sync_waitlist(db, court_id)
+    while (head := waitlist_index.head(court_id, start_at)) is not None:
+        entry = db.query(
+            WaitlistEntry.id, WaitlistEntry.player_id, WaitlistEntry.time_slot,
+            WaitlistEntry.start_at, WaitlistEntry.end_at,
+        ).filter(WaitlistEntry.id == head[0]).first()
+        booking = None
+        try:
+            # The entry leaves the waitlist only if the booking goes in too
+            with db.begin_nested():
+                # Gone if it was withdrawn through another worker since we loaded
+                if entry is not None and db.query(WaitlistEntry).filter(
+                    WaitlistEntry.id == entry.id
+                ).delete(synchronize_session=False):
+                    booking = Booking(
+                        court_id=court_id,
+                        player_id=entry.player_id,
+                        time_slot=entry.time_slot,
+                        start_at=entry.start_at,
+                        end_at=entry.end_at,
+                    )
+                    db.add(booking)
+                    db.flush()
+        except IntegrityError:
+            return None
+        if booking is None:
+            waitlist_index.remove(court_id, start_at, head[0])
+            continue
+        record_usage(db, court_id, [(entry.start_at, entry.end_at)])
+        return entry, booking.id
+    return None
+
+
+def released_slots(court_id: int, start_at: datetime) -> list[str]:
+    """The cancelled booking's slot, unless another active booking (a promotion) holds it"""
+    if slot_index.get(court_id, start_at.date()) >> start_at.hour & 1:
+        return []
+    return [format_time_slot(start_at, start_at + BOOKING_LENGTH)]
+
+
+@app.post("/bookings/{booking_id:int}/cancel", response_model=CancellationResponse)
+async def cancel_booking(
+    booking_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Cancel a booking (its player or the court's owner).
+
+    In the same transaction the slot goes to the first player on its
+    waitlist, if anyone is waiting.
+    """
+    def cancel(session: Session):
+        booking = session.query(
+            Booking.court_id, Booking.player_id, Booking.status, Booking.time_slot, Booking.start_at, Booking.end_at,
+            Court.owner_id,
+        ).outerjoin(Court, Court.id == Booking.court_id).filter(Booking.id == booking_id).first()
+        if booking is None or current_user.id not in (booking.player_id, booking.owner_id):
+            raise HTTPException(status_code=404, detail="Booking not found")
+        if booking.start_at is not None and booking.start_at <= datetime.utcnow():
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Booking has already started")
+        cancelled = session.query(Booking).filter(
+            Booking.id == booking_id, Booking.status != "cancelled"
+        ).update({Booking.status: "cancelled"}, synchronize_session=False)
+        if not cancelled:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Booking is already cancelled")
+
+        slots_version = bump_cache_version(session, slots_version_name(booking.court_id))
+        promoted, version = None, None
+        if booking.start_at is not None and booking.end_at is not None:
+            record_usage(session, booking.court_id, [(booking.start_at, booking.end_at)], sign=-1)
+            promoted = promote_from_waitlist(session, booking.court_id, booking.start_at)
+            if promoted:
+                version = bump_cache_version(session, "waitlist")
+        result = CancellationResponse(
+            **booking_rows(session).filter(Booking.id == booking_id).one()._asdict(),
+            slot_reassigned=promoted is not None,
+        )
+        session.commit()
+
+        if booking.start_at is None:
+            return result, promoted, version, []
+        if slot_index.advance(booking.court_id, slots_version):
+            slot_index.unmark(booking.court_id, booking.start_at)
+            if promoted:
+                slot_index.mark(booking.court_id, promoted[0].start_at)
+        else:
+            ensure_slot_index(session, booking.court_id)
+        return result, promoted, version, released_slots(booking.court_id, booking.start_at)
+
+    result, promoted, version, released = await db.run(cancel)
+    await publish_slots(result.court_id, released, "released")
+    if promoted:
+        entry, promoted_booking_id = promoted
+        if waitlist_index.advance(version):
+            waitlist_index.remove(result.court_id, entry.start_at, entry.id)
+        await publish_slots(result.court_id, [entry.time_slot])
+        try:
+            await pubsub.publish(user_channel(entry.player_id), {
+                "type": "waitlist_promoted",
+                "booking_id": promoted_booking_id,
+                "court_id": result.court_id,
+                "time_slot": entry.time_slot,
+            })
+        except Exception as e:
+            print(f"⚠️ Waitlist notification failed for user {entry.player_id}: {str(e)}")
+    return result
+
+
+def waitlist_entry_response(entry, position: int) -> WaitlistEntryResponse:
+    return WaitlistEntryResponse(
+        id=entry.id,
+        court_id=entry.court_id,
+        time_slot=entry.time_slot,
+        start_at=entry.start_at,
+        end_at=entry.end_at,
+        position=position,
+        created_at=entry.created_at,
     )
-    db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
-    
-    # Get court details
-    court = db.query(Court).filter(Court.id == db_booking.court_id).first()
-    booking_response = BookingResponse.model_validate(db_booking)
-    if court:
-        booking_response.court_name = court.name
-        booking_response.location = court.location
-    
-    return booking_response
+
+
+@app.post("/waitlist", response_model=WaitlistEntryResponse)
+async def join_waitlist(
+    request: WaitlistJoin,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Wait for a booked slot (requires authentication).
+
+    If the booking is cancelled, the slot is booked for the first player
+    in line, who is notified on GET /messages/events.
+    """
+    bounds = booking_bounds(request.time_slot)
+    if bounds is None:
+        raise HTTPException(status_code=422, detail="Invalid time slot")
+    if bounds[0] <= datetime.utcnow():
+        raise HTTPException(status_code=422, detail="Time slot has already started")
+
+    def join(session: Session):
+        if not session.query(Court.id).filter(Court.id == request.court_id).first():
+            raise HTTPException(status_code=404, detail="Court not found")
+        holder = session.query(Booking.player_id).filter(
+            Booking.court_id == request.court_id,
+            Booking.start_at == bounds[0],
+            Booking.status != "cancelled",
+        ).first()
+        if holder is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Time slot is available, book it instead")
+        if holder.player_id == current_user.id:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="You already have this slot booked")
+
+        sync_waitlist(session, request.court_id)
+        entry = WaitlistEntry(
+            court_id=request.court_id,
+            player_id=current_user.id,
+            time_slot=request.time_slot,
+            start_at=bounds[0],
+            end_at=bounds[1],
+        )
+        session.add(entry)
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Already on the waitlist for this slot")
+        response = waitlist_entry_response(entry, waitlist_index.waiting(request.court_id, bounds[0]) + 1)
+        version = bump_cache_version(session, "waitlist")
+        session.commit()
+        return response, version
+
+    response, version = await db.run(join)
+    if waitlist_index.advance(version):
+        waitlist_index.push(response.court_id, response.start_at, response.id, current_user.id)
+    return response
+
+
+@app.get("/waitlist", response_model=list[WaitlistEntryResponse])
+async def get_waitlist(current_user: CurrentUser = Depends(get_current_user), db: Database = Depends(get_db)):
+    """Slots the caller is waiting for, soonest first, with their place in line"""
+    def list_entries(session: Session):
+        entries = session.query(WaitlistEntry).filter(
+            WaitlistEntry.player_id == current_user.id,
+            WaitlistEntry.start_at >= datetime.utcnow(),
+        ).order_by(WaitlistEntry.start_at, WaitlistEntry.id).all()
+        responses = []
+        for entry in entries:
+            sync_waitlist(session, entry.court_id)
+            position = waitlist_index.position(entry.court_id, entry.start_at, entry.id)
+            if position is not None:
+                responses.append(waitlist_entry_response(entry, position))
+        return responses
+
+    return await db.run(list_entries)
+
+
+@app.delete("/waitlist/{entry_id:int}", status_code=status.HTTP_204_NO_CONTENT)
+async def leave_waitlist(
+    entry_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Leave a slot's waitlist (requires authentication)"""
+    def leave(session: Session):
+        entry = session.query(WaitlistEntry.court_id, WaitlistEntry.start_at).filter(
+            WaitlistEntry.id == entry_id, WaitlistEntry.player_id == current_user.id
+        ).first()
+        if entry is None or not session.query(WaitlistEntry).filter(
+            WaitlistEntry.id == entry_id
+        ).delete(synchronize_session=False):
+            raise HTTPException(status_code=404, detail="Waitlist entry not found")
+        version = bump_cache_version(session, "waitlist")
+        session.commit()
+        return entry, version
+
+    entry, version = await db.run(leave)
+    if waitlist_index.advance(version):
+        waitlist_index.remove(entry.court_id, entry.start_at, entry_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+# Matchmaking Routes
+matchmaker = Matchmaker()
+
+
+def queued_status(entry: QueueEntry) -> MatchmakingStatus:
+    return MatchmakingStatus(
+        status="queued",
+        court_id=entry.court_id,
+        skill_level=SKILL_LEVELS[entry.skill],
+        start_times=list(entry.starts),
+    )
+
+
+def slot_is_free(court_id: int, start_at: datetime) -> bool:
+    """Check the slot index, which the caller has brought up to date for this court"""
+    return not slot_index.get(court_id, start_at.date()) >> start_at.hour & 1
+
+
+def run_matchmaking_tick() -> list[tuple[int, str]]:
+    """Group queued players and book a court hour for each group.
+
+    Each group's booking and player rows go in under their own savepoint, so
+    a slot lost to a concurrent booking only sends that group back to the
+    queue. Returns the (court_id, time_slot) of every booking made.
+    """
+    now = datetime.utcnow()
+    matchmaker.expire(now)
+    if not len(matchmaker):
+        return []
+    booked = []
+    with SessionLocal() as session:
+        # Load occupancy first so the matcher never waits on the database
+        for court_id in matchmaker.pending_courts():
+            ensure_slot_index(session, court_id)
+        matches = matchmaker.tick(slot_is_free, now=now)
+        for match in matches:
+            end_at = match.start_at + timedelta(hours=1)
+            time_slot = format_time_slot(match.start_at, end_at)
+            try:
+                with session.begin_nested():
+                    booking = Booking(
+                        court_id=match.court_id,
+                        player_id=match.player_ids[0],  # longest in the queue
+                        time_slot=time_slot,
+                        start_at=match.start_at,
+                        end_at=end_at,
+                    )
+                    session.add(booking)
+                    session.flush()
+                    session.execute(insert(BookingPlayer), [
+                        {"booking_id": booking.id, "player_id": player_id} for player_id in match.player_ids
+                    ])
+                    record_usage(session, match.court_id, [(match.start_at, end_at)])
+                    version = bump_cache_version(session, slots_version_name(match.court_id))
+            except IntegrityError:
+                slot_index.invalidate(match.court_id)
+                matchmaker.requeue(match.entries)
+                continue
+            booked.append((match.court_id, match.start_at, time_slot, version))
+        session.commit()
+    # Versions were bumped in booking order, so each court advances one step at a time
+    for court_id, start_at, _, version in booked:
+        mark_booked(court_id, [start_at], version)
+    return [(court_id, time_slot) for court_id, _, time_slot, _ in booked]
+
+
+async def run_matchmaking_periodically():
+    while True:
+        await asyncio.sleep(MATCHMAKING_TICK_SECONDS)
+        try:
+            for court_id, time_slot in await run_in_threadpool(run_matchmaking_tick):
+                await publish_slots(court_id, [time_slot])
+        except Exception as e:
+            print(f"⚠️ Matchmaking tick failed: {str(e)}")
+
+
+@app.post("/matchmaking/queue", response_model=MatchmakingStatus)
+async def join_matchmaking(
+    request: MatchmakingJoin,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Queue for a doubles game on a court, starting at any hour in a window (requires authentication).
+
+    Players are grouped by skill level and booked in fours; rejoining
+    replaces the caller's earlier request.
+    """
+    skill = skill_rank(current_user.skill_level)
+    if skill is None:
+        raise HTTPException(status_code=422, detail=f"Set a skill level ({', '.join(SKILL_LEVELS)}) to use matchmaking")
+    if request.start_hour >= request.end_hour:
+        raise HTTPException(status_code=422, detail="start_hour must be before end_hour")
+    midnight = datetime.combine(request.day, datetime.min.time())
+    now = datetime.utcnow()
+    starts = [
+        midnight + timedelta(hours=hour)
+        for hour in range(request.start_hour, request.end_hour)
+        if midnight + timedelta(hours=hour) >= now
+    ]
+    if not starts:
+        raise HTTPException(status_code=422, detail="The requested window has already started")
+    if not await db.run(lambda session: session.query(Court.id).filter(Court.id == request.court_id).first()):
+        raise HTTPException(status_code=404, detail="Court not found")
+
+    entry = QueueEntry(current_user.id, request.court_id, starts, skill)
+    matchmaker.enqueue(entry)
+    return queued_status(entry)
+
+
+@app.get("/matchmaking/queue", response_model=MatchmakingStatus)
+async def get_matchmaking_status(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """The caller's place in matchmaking: still queued, their next matched game, or idle"""
+    entry = matchmaker.get(current_user.id)
+    if entry is not None:
+        return queued_status(entry)
+
+    def next_match(session: Session):
+        booking = session.query(Booking.id, Booking.court_id, Booking.time_slot).join(
+            BookingPlayer, BookingPlayer.booking_id == Booking.id
+        ).filter(
+            BookingPlayer.player_id == current_user.id,
+            Booking.end_at > datetime.utcnow(),
+            Booking.status != "cancelled",
+        ).order_by(Booking.start_at).first()
+        if booking is None:
+            return MatchmakingStatus(status="idle")
+        player_ids = session.query(BookingPlayer.player_id).filter(BookingPlayer.booking_id == booking.id)
+        return MatchmakingStatus(
+            status="matched",
+            court_id=booking.court_id,
+            booking_id=booking.id,
+            time_slot=booking.time_slot,
+            player_ids=sorted(row.player_id for row in player_ids),
+        )
+
+    return await db.run(next_match)
+
+
+@app.delete("/matchmaking/queue", response_model=MatchmakingStatus)
+async def leave_matchmaking(current_user: CurrentUser = Depends(get_current_user)):
+    """Leave the matchmaking queue (requires authentication)"""
+    if matchmaker.dequeue(current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Not in the matchmaking queue")
+    return MatchmakingStatus(status="idle")
+
+
+# Owner Analytics Routes
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+
+def require_owner(current_user: CurrentUser):
+    if current_user.role != "owner":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only court owners can view analytics")
+
+
+def occupancy(booked_hours: int, open_hours_total: int) -> float:
+    return round(booked_hours / open_hours_total, 4) if open_hours_total else 0.0
+
+
+@app.get("/owner/analytics", response_model=OwnerAnalyticsResponse)
+async def get_owner_analytics(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    court_id: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Occupancy and revenue per court and day for the caller's courts (owners only).
+
+    Served from the daily usage rollup: one indexed range read per request,
+    however many bookings the period holds. Defaults to the last 30 days.
+    """
+    require_owner(current_user)
+    end = to_date or datetime.utcnow().date()
+    start = from_date or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if not 0 <= (end - start).days < ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=422, detail=f"Date range must be 1 to {ANALYTICS_MAX_DAYS} days")
+
+    def load(session: Session):
+        query = session.query(Court.id, Court.name, Court.operating_hours).filter(Court.owner_id == current_user.id)
+        if court_id is not None:
+            query = query.filter(Court.id == court_id)
+        courts = query.order_by(Court.id).all()
+        if court_id is not None and not courts:
+            raise HTTPException(status_code=404, detail="Court not found")
+        usage = session.execute(
+            select(CourtDailyUsage.court_id, CourtDailyUsage.day, CourtDailyUsage.bookings, CourtDailyUsage.revenue).where(
+                CourtDailyUsage.court_id.in_([court.id for court in courts]),
+                CourtDailyUsage.day.between(start, end),
+            )
+        ).all() if courts else []
+        return courts, usage
+
+    courts, usage = await db.run(load)
+    by_court_day = {(row.court_id, row.day): row for row in usage}
+    days = date_range(start, end)
+    result = []
+    for court in courts:
+        hours_open = len(open_hours(court.operating_hours))
+        daily = []
+        for day in days:
+            row = by_court_day.get((court.id, day))
+            booked, revenue = (row.bookings, row.revenue) if row else (0, 0)
+            daily.append(DailyUsage(date=day, booked_hours=booked, revenue=revenue, occupancy=occupancy(booked, hours_open)))
+        booked = sum(d.booked_hours for d in daily)
+        result.append(CourtUsage(
+            court_id=court.id,
+            name=court.name,
+            open_hours_per_day=hours_open,
+            booked_hours=booked,
+            revenue=sum(d.revenue for d in daily),
+            occupancy=occupancy(booked, hours_open * len(days)),
+            days=daily,
+        ))
+    return OwnerAnalyticsResponse(
+        start=start,
+        end=end,
+        booked_hours=sum(c.booked_hours for c in result),
+        revenue=sum(c.revenue for c in result),
+        courts=result,
+    )
+
+
+@app.get("/owner/analytics/courts/{court_id:int}/heatmap", response_model=HeatmapResponse)
+async def get_court_heatmap(
+    court_id: int,
+    from_date: Optional[date] = Query(None, alias="from"),
+    days: int = Query(365, ge=1, le=ANALYTICS_MAX_DAYS),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Bookings per day and open hour for one of the caller's courts (owners only).
+
+    Defaults to the year ending today.
+    """
+    require_owner(current_user)
+    start = from_date or datetime.utcnow().date() - timedelta(days=days - 1)
+
+    def load(session: Session):
+        court = session.query(Court.operating_hours).filter(
+            Court.id == court_id, Court.owner_id == current_user.id
+        ).first()
+        if court is None:
+            raise HTTPException(status_code=404, detail="Court not found")
+        cells = session.execute(
+            select(CourtHourlyUsage.day, CourtHourlyUsage.hour, CourtHourlyUsage.bookings).where(
+                CourtHourlyUsage.court_id == court_id,
+                CourtHourlyUsage.day.between(start, start + timedelta(days=days - 1)),
+            )
+        ).all()
+        return court, cells
+
+    court, cells = await db.run(load)
+    hours = open_hours(court.operating_hours)
+    return HeatmapResponse(
+        court_id=court_id,
+        start=start,
+        days=days,
+        hours=list(hours),
+        bookings=heatmap(cells, start, days, hours),
+    )
+
+
+# Messaging Routes
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+message_columns = (
+    Message.id,
+    Message.sender_id,
+    Message.receiver_id,
+    Message.content,
+    Message.created_at,
+)
+
+
+def touch_conversation(db: Session, user_id: int, peer_id: int, message: Message, unread: int):
+    """Point user_id's summary of the thread at a new message, creating it if needed"""
+    updated = db.query(Conversation).filter(
+        Conversation.user_id == user_id,
+        Conversation.peer_id == peer_id,
+    ).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.created_at,
+        Conversation.unread_count: Conversation.unread_count + unread,
+    }, synchronize_session=False)
+    if not updated:
+        db.add(Conversation(
+            user_id=user_id,
+            peer_id=peer_id,
+            last_message_id=message.id,
+            last_message_at=message.created_at,
+            unread_count=unread,
+        ))
+
+
+def page_headers(response: Response, rows: list, limit: int, key=lambda row: (row.created_at, row.id)) -> list:
+    """Trim a limit+1 keyset query result and set X-Next-Cursor if there is more"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(*key(rows[-1]))
+    return rows
+
+
+def reject_self(peer_id: int, current_user: CurrentUser):
+    if peer_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot message yourself")
+
+
+@app.post("/messages", response_model=MessageResponse)
+async def send_message(
+    message_data: MessageCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Send a direct message (requires authentication)"""
+    reject_self(message_data.receiver_id, current_user)
+
+    def insert_message(session: Session):
+        if not session.query(User.id).filter(User.id == message_data.receiver_id).first():
+            raise HTTPException(status_code=404, detail="Recipient not found")
+        for attempt in range(2):
+            message = Message(
+                sender_id=current_user.id,
+                receiver_id=message_data.receiver_id,
+                content=message_data.content,
+                created_at=datetime.utcnow(),
+            )
+            session.add(message)
+            try:
+                session.flush()
+                touch_conversation(session, current_user.id, message.receiver_id, message, unread=0)
+                touch_conversation(session, message.receiver_id, current_user.id, message, unread=1)
+                sent = MessageResponse.model_validate(message).model_copy(update={"sender_name": current_user.name})
+                session.commit()
+                return sent
+            except IntegrityError:
+                # Both sides started the conversation at once; the retry updates
+                # the summary row the other request created.
+                session.rollback()
+                if attempt:
+                    raise
+
+    message = await db.run(insert_message)
+    try:
+        await pubsub.publish(user_channel(message.receiver_id), {"type": "message", **jsonable_encoder(message)})
+    except Exception as e:
+        print(f"⚠️ Live delivery failed for user {message.receiver_id}: {str(e)}")
+    return message
+
+
+@app.get("/messages", response_model=list[MessageResponse])
+async def get_inbox(
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Messages received by the caller, newest first (requires authentication).
+
+    Keyset-paginated on (created_at, id); the next page's cursor is returned
+    in the X-Next-Cursor header.
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    def list_inbox(session: Session):
+        query = session.query(*message_columns, User.name.label("sender_name")).outerjoin(
+            User, User.id == Message.sender_id
+        ).filter(Message.receiver_id == current_user.id)
+        if after:
+            query = query.filter(older_than(Message.created_at, Message.id, after))
+        return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+
+    rows = page_headers(response, await db.run(list_inbox), limit)
+    return [MessageResponse.model_validate(row) for row in rows]
+
+
+@app.get("/messages/unread", response_model=UnreadResponse)
+async def get_unread_count(current_user: CurrentUser = Depends(get_current_user), db: Database = Depends(get_db)):
+    """Total unread messages across the caller's conversations (requires authentication)"""
+    total = await db.run(lambda session: session.query(func.sum(Conversation.unread_count)).filter(
+        Conversation.user_id == current_user.id
+    ).scalar())
+    return UnreadResponse(total=total or 0)
+
+
+def decode_stream_token(token: str) -> Optional[int]:
+    """Return the user id a GET /messages/events token was issued for, or None"""
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        if payload.get("scope") != STREAM_TOKEN_SCOPE:
+            return None
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+async def get_stream_user_id(
+    token: Optional[str] = Query(None, description="Stream token from POST /messages/events/token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Database = Depends(get_db),
+) -> int:
+    """The caller of an event stream, by stream token or by the usual bearer token"""
+    if token is not None:
+        user_id = decode_stream_token(token)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream token")
+        return user_id
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return (await get_current_user(credentials, db)).id
+
+
+@app.post("/messages/events/token", response_model=StreamTokenResponse)
+async def create_message_events_token(current_user: CurrentUser = Depends(get_current_user)):
+    """Short-lived token for GET /messages/events?token=, for EventSource, which can't send headers.
+
+    It only opens that stream, and expires quickly because URLs end up in logs.
+    """
+    token = create_access_token(
+        data={"sub": str(current_user.id), "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS),
+    )
+    return StreamTokenResponse(token=token, expires_in=STREAM_TOKEN_EXPIRE_SECONDS)
+
+
+@app.get("/messages/events")
+async def message_events(request: Request, user_id: int = Depends(get_stream_user_id)):
+    """Server-Sent Events stream of messages as they arrive.
+
+    Authenticate with the Authorization header, or from a browser's
+    EventSource with ?token= from POST /messages/events/token.
+    """
+    return event_stream(user_channel(user_id), request, {"type": "subscribed", "user_id": user_id})
+
+
+@app.get("/messages/threads", response_model=list[ConversationResponse])
+async def get_conversations(
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """The caller's conversations, most recently active first (requires authentication)"""
+    after = decode_cursor(cursor) if cursor else None
+
+    def list_conversations(session: Session):
+        query = session.query(
+            Conversation.peer_id,
+            User.name.label("peer_name"),
+            Conversation.last_message_id,
+            Conversation.last_message_at,
+            Conversation.last_read_at,
+            Conversation.unread_count,
+        ).outerjoin(User, User.id == Conversation.peer_id).filter(Conversation.user_id == current_user.id)
+        if after:
+            query = query.filter(older_than(Conversation.last_message_at, Conversation.peer_id, after))
+        return query.order_by(
+            Conversation.last_message_at.desc(), Conversation.peer_id.desc()
+        ).limit(limit + 1).all()
+
+    rows = page_headers(response, await db.run(list_conversations), limit, key=lambda row: (row.last_message_at, row.peer_id))
+    return [ConversationResponse.model_validate(row) for row in rows]
+
+
+def thread_query(user_id: int, peer_id: int, limit: int, after=None):
+    """Newest limit+1 messages between two users.
+
+    Each direction is its own LIMITed range scan on
+    ix_messages_sender_receiver_created, and only those two short lists are
+    merged, so the cost tracks the page size rather than the thread length.
+    """
+    def direction(sender_id: int, receiver_id: int):
+        query = select(*message_columns).where(
+            Message.sender_id == sender_id,
+            Message.receiver_id == receiver_id,
+        )
+        if after:
+            query = query.where(older_than(Message.created_at, Message.id, after))
+        return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).subquery()
+
+    merged = union_all(
+        select(direction(user_id, peer_id)),
+        select(direction(peer_id, user_id)),
+    ).subquery()
+    return select(merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit + 1)
+
+
+@app.get("/messages/threads/{peer_id:int}", response_model=list[MessageResponse])
+async def get_thread(
+    peer_id: int,
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Messages exchanged with one user, newest first (requires authentication)"""
+    reject_self(peer_id, current_user)
+    after = decode_cursor(cursor) if cursor else None
+    query = thread_query(current_user.id, peer_id, limit, after)
+    rows = page_headers(response, await db.run(lambda session: session.execute(query).all()), limit)
+    return [MessageResponse.model_validate(row) for row in rows]
+
+
+@app.post("/messages/threads/{peer_id:int}/read", response_model=UnreadResponse)
+async def mark_thread_read(
+    peer_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Database = Depends(get_db),
+):
+    """Mark a conversation read; returns the caller's remaining unread total (requires authentication)"""
+    def mark_read(session: Session):
+        updated = session.query(Conversation).filter(
+            Conversation.user_id == current_user.id,
+            Conversation.peer_id == peer_id,
+        ).update({
+            Conversation.unread_count: 0,
+            Conversation.last_read_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        if not updated:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        session.commit()
+        return session.query(func.sum(Conversation.unread_count)).filter(
+            Conversation.user_id == current_user.id
+        ).scalar()
+
+    return UnreadResponse(total=await db.run(mark_read) or 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+"""
+Skill-based matchmaking for open play.
+
+Players queue for a court and a window of start hours on one day. Every
+tick the matcher turns each (court, start hour) that changed into at most
+one doubles group of four players with the same skill level, taken first
+come, first served. Queued players are kept in buckets keyed by court,
+start hour and skill, so a tick only looks at the buckets that changed
+since the last one and never compares players with each other. A player
+who has waited widen_after ticks may also be grouped with the adjacent
+skill level, so a thin bucket still gets a game.
+
+Usage:
+    python matchmaking.py simulate [--players 5000] [--courts 50] [--ticks 20] [--seed 42]
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import count, islice
+from typing import Callable, Iterable, Optional
+
+SKILL_LEVELS = ("beginner", "intermediate", "advanced")
+GROUP_SIZE = 4  # doubles
+WIDEN_AFTER_TICKS = 12  # one minute at the default 5 second tick
+
+
+def skill_rank(skill_level: Optional[str]) -> Optional[int]:
+    try:
+        return SKILL_LEVELS.index((skill_level or "").strip().lower())
+    except ValueError:
+        return None
+
+
+class QueueEntry:
+    """A player waiting for a game on one court at any of the given start times."""
+
+    __slots__ = ("player_id", "court_id", "starts", "skill", "seq", "queued_tick")
+
+    def __init__(self, player_id: int, court_id: int, starts: Iterable[datetime], skill: int):
+        self.player_id = player_id
+        self.court_id = court_id
+        self.starts = tuple(sorted(set(starts)))
+        self.skill = skill
+        self.seq = 0  # queue order, assigned by the matchmaker
+        self.queued_tick = 0
+
+    def __repr__(self):
+        return f"QueueEntry(player_id={self.player_id}, court_id={self.court_id}, skill={self.skill})"
+
+
+class Match:
+    def __init__(self, court_id: int, start_at: datetime, entries: list[QueueEntry]):
+        self.court_id = court_id
+        self.start_at = start_at
+        self.entries = entries
+
+    @property
+    def player_ids(self) -> list[int]:
+        return [entry.player_id for entry in self.entries]
+
+    @property
+    def skill_level(self) -> str:
+        """The group's level; a widened group is labelled by its lower level"""
+        return SKILL_LEVELS[min(entry.skill for entry in self.entries)]
+
+    def __repr__(self):
+        return f"Match(court_id={self.court_id}, start_at={self.start_at}, player_ids={self.player_ids})"
+
+
+class Matchmaker:
+    """Thread-safe queue of players and the incremental matcher over it."""
+
+    def __init__(self, group_size: int = GROUP_SIZE, widen_after: int = WIDEN_AFTER_TICKS):
+        self.group_size = group_size
+        self.widen_after = widen_after
+        self.ticks = 0
+        self._lock = threading.Lock()
+        self._seq = count(1)
+        self._entries: dict[int, QueueEntry] = {}
+        # (court_id, start_at, skill) -> {player_id: entry}, in queue order
+        self._buckets: dict[tuple, dict[int, QueueEntry]] = {}
+        self._dirty: set[tuple] = set()  # (court_id, start_at) cells changed since the last tick
+        self._revisits: list[tuple] = []  # heap of (tick, court_id, start_at) for widening
+        self._expiry: list[tuple] = []  # heap of (last start, seq, player_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self._entries
+
+    def get(self, player_id: int) -> Optional[QueueEntry]:
+        return self._entries.get(player_id)
+
+    def enqueue(self, entry: QueueEntry):
+        """Queue a player, replacing any earlier request of theirs"""
+        with self._lock:
+            self._remove(entry.player_id)
+            entry.seq = next(self._seq)
+            entry.queued_tick = self.ticks
+            self._add(entry)
+
+    def requeue(self, entries: Iterable[QueueEntry]):
+        """Put players back with their original place in line, e.g. after a failed booking"""
+        with self._lock:
+            for entry in entries:
+                if entry.player_id not in self._entries:
+                    self._add(entry)
+
+    def dequeue(self, player_id: int) -> Optional[QueueEntry]:
+        with self._lock:
+            return self._remove(player_id)
+
+    def expire(self, now: datetime) -> list[QueueEntry]:
+        """Drop players whose every start time is before now"""
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] < now:
+                _, seq, player_id = heapq.heappop(self._expiry)
+                entry = self._entries.get(player_id)
+                if entry is not None and entry.seq == seq:
+                    expired.append(self._remove(player_id))
+        return expired
+
+    def pending_courts(self) -> set[int]:
+        """Courts the next tick will look at"""
+        with self._lock:
+            due = {court_id for tick, court_id, _ in self._revisits if tick <= self.ticks + 1}
+            return {court_id for court_id, _ in self._dirty} | due
+
+    def tick(self, slot_free: Callable[[int, datetime], bool] = lambda court_id, start_at: True,
+             now: Optional[datetime] = None) -> list[Match]:
+        """Form groups in every cell that changed or is due for widening.
+
+        slot_free(court_id, start_at) is asked before a cell is matched, so
+        hours that are already booked are left alone. Matched players leave
+        the queue; the caller books each match and requeues it on failure.
+        """
+        with self._lock:
+            self.ticks += 1
+            cells = self._dirty
+            self._dirty = set()
+            while self._revisits and self._revisits[0][0] <= self.ticks:
+                _, court_id, start_at = heapq.heappop(self._revisits)
+                cells.add((court_id, start_at))
+            matches = []
+            for court_id, start_at in sorted(cells):
+                if now is not None and start_at < now:
+                    continue
+                group = self._group_for(court_id, start_at)
+                if group is None or not slot_free(court_id, start_at):
+                    continue
+                for entry in group:
+                    self._remove(entry.player_id)
+                matches.append(Match(court_id, start_at, group))
+            return matches
+
+    def _add(self, entry: QueueEntry):
+        self._entries[entry.player_id] = entry
+        for start_at in entry.starts:
+            self._buckets.setdefault((entry.court_id, start_at, entry.skill), {})[entry.player_id] = entry
+            self._dirty.add((entry.court_id, start_at))
+        if entry.starts:
+            heapq.heappush(self._expiry, (entry.starts[-1], entry.seq, entry.player_id))
+
+    def _remove(self, player_id: int) -> Optional[QueueEntry]:
+        entry = self._entries.pop(player_id, None)
+        if entry is None:
+            return None
+        for start_at in entry.starts:
+            key = (entry.court_id, start_at, entry.skill)
+            bucket = self._buckets[key]
+            del bucket[player_id]
+            if not bucket:
+                del self._buckets[key]
+        return entry
+
+    def _group_for(self, court_id: int, start_at: datetime) -> Optional[list[QueueEntry]]:
+        """The group that has waited longest among those this cell can form, if any"""
+        buckets = [self._buckets.get((court_id, start_at, skill), {}) for skill in range(len(SKILL_LEVELS))]
+        best = None
+        for bucket in buckets:
+            if len(bucket) >= self.group_size:
+                group = list(islice(bucket.values(), self.group_size))
+                if best is None or group[0].seq < best[0].seq:
+                    best = group
+        if best is not None:
+            return best
+
+        for lower, upper in zip(buckets, buckets[1:]):
+            if not lower or not upper or len(lower) + len(upper) < self.group_size:
+                continue
+            group = list(islice(heapq.merge(lower.values(), upper.values(), key=lambda e: e.seq), self.group_size))
+            if self.ticks - group[0].queued_tick >= self.widen_after and (best is None or group[0].seq < best[0].seq):
+                best = group
+        if best is None:
+            # Come back once the longest-waiting player here may be widened
+            waiting = [next(iter(bucket.values())) for bucket in buckets if bucket]
+            if waiting:
+                due = min(entry.queued_tick for entry in waiting) + self.widen_after
+                heapq.heappush(self._revisits, (max(due, self.ticks + 1), court_id, start_at))
+        return best
+
+
+def simulate(players: int = 5000, courts: int = 50, ticks: int = 20, seed: int = 42,
+             widen_after: int = WIDEN_AFTER_TICKS) -> dict:
+    """Feed a seeded stream of players through a matchmaker and report how it did.
+
+    Arrivals are spread evenly over the ticks; each player picks a court, a
+    skill level and a window of one to four start hours within the day.
+    Every court hour can host one game. The result includes a digest of
+    every match, so two runs with the same arguments can be compared.
+    """
+    rng = random.Random(seed)
+    day = datetime(2030, 1, 1)
+    matchmaker = Matchmaker(widen_after=widen_after)
+    booked: set[tuple] = set()
+    arrivals = [[] for _ in range(ticks)]
+    for player_id in range(1, players + 1):
+        first = rng.randrange(6, 20)
+        starts = [day + timedelta(hours=h) for h in range(first, min(22, first + rng.randint(1, 4)))]
+        skill = rng.choices(range(len(SKILL_LEVELS)), weights=(3, 5, 2))[0]
+        arrivals[rng.randrange(ticks)].append(QueueEntry(player_id, rng.randrange(1, courts + 1), starts, skill))
+
+    digest = hashlib.sha256()
+    tick_seconds, matched, widened = [], 0, 0
+    for arriving in arrivals:
+        for entry in arriving:
+            matchmaker.enqueue(entry)
+        started = time.perf_counter()
+        matches = matchmaker.tick(lambda court_id, start_at: (court_id, start_at) not in booked)
+        tick_seconds.append(time.perf_counter() - started)
+        for match in matches:
+            booked.add((match.court_id, match.start_at))
+            matched += len(match.entries)
+            widened += len({entry.skill for entry in match.entries}) > 1
+            digest.update(f"{match.court_id} {match.start_at:%H} {match.player_ids}\n".encode())
+
+    tick_seconds.sort()
+    return {
+        "players": players,
+        "courts": courts,
+        "ticks": ticks,
+        "seed": seed,
+        "games": len(booked),
+        "matched_players": matched,
+        "still_queued": len(matchmaker),
+        "widened_games": widened,
+        "tick_ms_p50": round(tick_seconds[len(tick_seconds) // 2] * 1000, 3),
+        "tick_ms_max": round(tick_seconds[-1] * 1000, 3),
+        "digest": digest.hexdigest()[:16],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic matchmaking simulation")
+    parser.add_argument("command", choices=["simulate"])
+    parser.add_argument("--players", type=int, default=5000)
+    parser.add_argument("--courts", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--widen-after", type=int, default=WIDEN_AFTER_TICKS)
+    args = parser.parse_args()
+    print(json.dumps(simulate(args.players, args.courts, args.ticks, args.seed, args.widen_after), indent=2))
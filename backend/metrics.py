@@ -0,0 +1,282 @@
+"""
+Request and database instrumentation, exposed in Prometheus text format.
+
+RequestMetricsMiddleware times every HTTP request by route template.
+Instrumentation.instrument_engine() hooks SQLAlchemy so the statements a request issues,
+the time spent in them and the pool checkout wait are attributed to that
+request through a context variable. That variable follows the request
+into the threadpool and the async engine's greenlets.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("pickleball.slow_requests")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+MAX_RECORDED_STATEMENTS = 50  # per request, for the slow-request log
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, series):
+                    cumulative += n
+                    le = _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _format_labels(self.label_names, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {series[-1]}")
+                plain = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{plain} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{plain} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Values read from a callback at scrape time; the callback returns {labels: value}.
+
+    For state that already lives elsewhere, like cache hit counters or pool size.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str], collect: Callable[[], dict], kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def callback(self, *args, **kwargs) -> CallbackMetric:
+        return self.register(CallbackMetric(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Database work attributed to one request."""
+
+    __slots__ = ("queries", "sql_seconds", "checkout_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.checkout_seconds = 0.0
+        self.statements: list[tuple[float, str]] = []
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Instrumentation:
+    """The metric families the app exports."""
+
+    def __init__(self, slow_request_seconds: float):
+        self.slow_request_seconds = slow_request_seconds
+        self.registry = Registry()
+        self.requests = self.registry.counter(
+            "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+        self.latency = self.registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+        self.request_queries = self.registry.histogram(
+            "http_request_db_queries", "SQL statements issued per request.", ("method", "route"),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.request_sql = self.registry.histogram(
+            "http_request_db_seconds", "Time spent executing SQL per request.", ("method", "route"))
+        self.queries = self.registry.counter("db_queries_total", "SQL statements executed.")
+        self.query_seconds = self.registry.histogram("db_query_duration_seconds", "SQL statement latency.")
+        self.checkout_wait = self.registry.histogram(
+            "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.")
+        self.slow_requests = self.registry.counter(
+            "http_slow_requests_total", "Requests slower than the slow-request threshold.", ("method", "route"))
+
+    def record_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats):
+        self.requests.inc(method, route, str(status_code))
+        self.latency.observe(seconds, method, route)
+        self.request_queries.observe(stats.queries, method, route)
+        self.request_sql.observe(stats.sql_seconds, method, route)
+        if seconds >= self.slow_request_seconds:
+            self.slow_requests.inc(method, route)
+            statements = "\n".join(f"  [{elapsed * 1000:.1f} ms] {sql}" for elapsed, sql in stats.statements)
+            logger.warning(
+                "Slow request %s %s -> %s in %.1f ms (%d queries, %.1f ms SQL, %.1f ms pool wait)\n%s",
+                method, route, status_code, seconds * 1000, stats.queries,
+                stats.sql_seconds * 1000, stats.checkout_seconds * 1000, statements,
+            )
+
+    def instrument_engine(self, engine):
+        """Count and time statements and pool checkouts on a (sync) Engine."""
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            self.queries.inc()
+            self.query_seconds.observe(elapsed)
+            stats = current_request.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.sql_seconds += elapsed
+                if len(stats.statements) < MAX_RECORDED_STATEMENTS:
+                    stats.statements.append((elapsed, statement))
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            started = context.connection.info.get("query_started") if context.connection is not None else None
+            if started:
+                started.pop()
+
+        # The pool has no "before checkout" event, so time the call the engine
+        # makes to get a connection; this covers both the sync and async engines.
+        raw_connection = engine.raw_connection
+
+        def timed_raw_connection():
+            started = time.perf_counter()
+            try:
+                return raw_connection()
+            finally:
+                waited = time.perf_counter() - started
+                self.checkout_wait.observe(waited)
+                stats = current_request.get()
+                if stats is not None:
+                    stats.checkout_seconds += waited
+
+        engine.raw_connection = timed_raw_connection
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording latency and database work per route template."""
+
+    def __init__(self, app, instrumentation: Instrumentation):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Event streams stay open for minutes; their duration isn't latency
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            if not streaming:
+                route = scope.get("route")
+                label = getattr(route, "path_format", None) or "unmatched"
+                self.instrumentation.record_request(
+                    scope["method"], label, status_code, time.perf_counter() - started, stats,
+                )
@@ -0,0 +1,186 @@
+"""
+Schema migrations.
+
+Each migration has an id, runs once and is recorded in schema_migrations.
+Ordinary migrations run a function inside a transaction. Online migrations
+only build indexes. On PostgreSQL they use CREATE INDEX CONCURRENTLY
+outside a transaction, so bookings keep being written while a large
+table is indexed.
+
+The migrations themselves live next to the models in main.MIGRATIONS.
+Fresh databases run them all, starting from the frozen baseline schema.
+Databases from before migrations already have some of their changes, so
+every migration has to be safe to run against a schema that has them.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # list applied and pending migrations
+"""
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+
+# Arbitrary keys for pg_advisory_lock, shared by every app process
+MIGRATION_LOCK_ID = 72_610_001
+ONLINE_INDEX_LOCK_ID = 72_610_002
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("id", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration:
+    """A schema change: upgrade(conn) in a transaction, or indexes built online."""
+
+    def __init__(self, id: str, upgrade: Optional[Callable] = None, indexes: tuple = ()):
+        if (upgrade is None) == (not indexes):
+            raise ValueError(f"Migration {id} needs either an upgrade function or indexes")
+        self.id = id
+        self.upgrade = upgrade
+        self.indexes = tuple(indexes)
+
+    @property
+    def online(self) -> bool:
+        return bool(self.indexes)
+
+    def __repr__(self):
+        return f"Migration({self.id!r})"
+
+
+def applied_migrations(conn) -> set[str]:
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.id)).scalars())
+
+
+def pending_migrations(engine, migrations: list[Migration]) -> list[Migration]:
+    with engine.connect() as conn:
+        applied = applied_migrations(conn)
+    return [m for m in migrations if m.id not in applied]
+
+
+def online_index_ddl(index, dialect_name: str) -> str:
+    """CREATE INDEX for an index that must not block writes while it builds."""
+    unique = "UNIQUE " if index.unique else ""
+    concurrently = "CONCURRENTLY " if dialect_name == "postgresql" else ""
+    columns = ", ".join(column.name for column in index.columns)
+    ddl = f"CREATE {unique}INDEX {concurrently}IF NOT EXISTS {index.name} ON {index.table.name} ({columns})"
+    where = index.dialect_kwargs.get(f"{dialect_name}_where")
+    if where is not None:  # a partial index
+        ddl += f" WHERE {where.compile(compile_kwargs={'literal_binds': True})}"
+    return ddl
+
+
+@contextmanager
+def advisory_lock(engine, lock_id: int, wait: bool = True):
+    """Serialize migration runs across processes on PostgreSQL.
+
+    Yields False when wait=False and another process holds the lock. Other
+    databases rely on their own DDL locking and always get the lock.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if wait:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+            acquired = True
+        else:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+
+
+def record(conn, migration: Migration):
+    conn.execute(schema_migrations.insert().values(id=migration.id, applied_at=datetime.utcnow()))
+
+
+def build_indexes_online(engine, migration: Migration):
+    dialect = engine.dialect.name
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in migration.indexes:
+            if dialect == "postgresql":
+                # An interrupted concurrent build leaves an INVALID index behind
+                # that IF NOT EXISTS would mistake for a finished one
+                invalid = conn.execute(text(
+                    "SELECT NOT i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+                ), {"name": index.name}).scalar()
+                if invalid:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+            conn.execute(text(online_index_ddl(index, dialect)))
+    with engine.begin() as conn:
+        if migration.id not in applied_migrations(conn):
+            record(conn, migration)
+
+
+def apply_online(engine, migrations: list[Migration]) -> list[str]:
+    """Build pending online migrations unless another process is already at it."""
+    done = []
+    with advisory_lock(engine, ONLINE_INDEX_LOCK_ID, wait=False) as acquired:
+        if not acquired:
+            return done
+        with engine.connect() as conn:
+            applied = applied_migrations(conn)
+        for migration in migrations:
+            if migration.id not in applied:
+                build_indexes_online(engine, migration)
+                done.append(migration.id)
+                print(f"✅ Applied migration {migration.id}")
+    return done
+
+
+def migrate(engine, migrations: list[Migration], background_online: bool = False) -> list[str]:
+    """Apply pending migrations; returns the ids applied in the foreground.
+
+    Transactional migrations run first, in order. Online index builds can't
+    be something later code depends on for correctness, so they run after
+    them; with background_online=True on PostgreSQL they continue on a
+    thread while the app starts serving.
+    """
+    if not pending_migrations(engine, migrations):
+        return []
+
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+
+    applied_now = []
+    with advisory_lock(engine, MIGRATION_LOCK_ID):
+        with engine.connect() as conn:
+            applied = applied_migrations(conn)
+        for migration in migrations:
+            if migration.online or migration.id in applied:
+                continue
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                record(conn, migration)
+            applied_now.append(migration.id)
+            print(f"✅ Applied migration {migration.id}")
+
+    online = [m for m in migrations if m.online]
+    if background_online and engine.dialect.name == "postgresql":
+        threading.Thread(target=apply_online, args=(engine, online), daemon=True).start()
+    else:
+        applied_now += apply_online(engine, online)
+    return applied_now
+
+
+if __name__ == "__main__":
+    import main
+
+    if sys.argv[1:] == ["status"]:
+        pending = {m.id for m in pending_migrations(main.engine, main.MIGRATIONS)}
+        for m in main.MIGRATIONS:
+            print(f"{'pending' if m.id in pending else 'applied'}  {m.id}{'  (online)' if m.online else ''}")
+    else:
+        applied = migrate(main.engine, main.MIGRATIONS)
+        print(f"✅ {len(applied)} migration(s) applied" if applied else "✅ Database schema up to date")
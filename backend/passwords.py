@@ -0,0 +1,109 @@
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow (~250 ms at cost 12), so hashing and
+verification run in a small, dedicated process pool. The pool only accepts
+a bounded number of pending jobs; beyond that callers get PasswordHasherBusy
+and should shed the request instead of queueing behind a login storm.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool already has max_pending jobs queued."""
+
+
+@lru_cache(maxsize=None)
+def get_context(rounds: int):
+    # passlib and bcrypt are imported on first use to keep app startup fast
+    import bcrypt as _bcrypt
+    # Fix passlib + bcrypt>=4.1 compatibility
+    if not hasattr(_bcrypt, '__about__'):
+        class _About:
+            __version__ = _bcrypt.__version__
+        _bcrypt.__about__ = _About()
+
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost factor of a "$2b$12$..." bcrypt hash."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str, rounds: int):
+    """Verify a password; return (ok, new_hash) where new_hash is set if the cost changed."""
+    if not get_context(rounds).verify(password, hashed_password):
+        return False, None
+    if hash_rounds(hashed_password) != rounds:
+        return True, hash_password(password, rounds)
+    return True, None
+
+
+class PasswordHasher:
+    """Bounded process pool for bcrypt work.
+
+    With workers=0 the work runs on the event loop's default thread pool
+    instead, which keeps single-process setups (tests, scripts) simple.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 32):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the server process has threads running
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        return await self._submit(verify_and_update, password, hashed_password, self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
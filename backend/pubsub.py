@@ -0,0 +1,141 @@
+"""
+Publish/subscribe fan-out for live court updates.
+
+Route handlers publish small JSON-able events to a channel per court and
+every connected client subscribed to that channel receives them. The
+in-memory backend fans out within one process; the Redis backend shares
+channels between workers.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+SUBSCRIBER_QUEUE_SIZE = 100
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """Messages for one subscriber, consumed with `async for`."""
+
+    def __init__(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, message: dict):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A slow client has fallen behind; drop its backlog and tell it
+            # to refetch rather than blocking publishers.
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next message, or None if nothing arrived within timeout."""
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __aiter__(self) -> AsyncIterator[dict]:
+        return self
+
+    async def __anext__(self) -> dict:
+        return await self._queue.get()
+
+
+class InMemoryPubSub:
+    """Single-process backend; also the stand-in used by tests."""
+
+    def __init__(self):
+        self._channels: dict[str, set[Subscription]] = {}
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._channels.get(channel, ()))
+
+    async def publish(self, channel: str, message: dict) -> int:
+        subscribers = self._channels.get(channel, ())
+        for subscription in list(subscribers):
+            subscription.put(message)
+        return len(subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        subscription = Subscription()
+        self._channels.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+
+    async def close(self):
+        self._channels.clear()
+
+
+class RedisPubSub:
+    """Redis-backed channels so every worker's subscribers see every event.
+
+    Requires the optional `redis` package (redis>=4.2 for redis.asyncio).
+    """
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as exc:
+            raise RuntimeError("PUBSUB_URL uses redis:// but the 'redis' package is not installed") from exc
+        self._redis = redis_asyncio.from_url(url)
+        self._local = InMemoryPubSub()
+        self._listeners: dict[str, asyncio.Task] = {}
+
+    def subscriber_count(self, channel: str) -> int:
+        return self._local.subscriber_count(channel)
+
+    async def publish(self, channel: str, message: dict) -> int:
+        return await self._redis.publish(channel, json.dumps(message))
+
+    async def _listen(self, channel: str):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for raw in pubsub.listen():
+                if raw.get("type") == "message":
+                    await self._local.publish(channel, json.loads(raw["data"]))
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        # One Redis subscription per channel per worker, shared by local clients
+        if channel not in self._listeners:
+            self._listeners[channel] = asyncio.create_task(self._listen(channel))
+        try:
+            async with self._local.subscribe(channel) as subscription:
+                yield subscription
+        finally:
+            if not self._local.subscriber_count(channel):
+                task = self._listeners.pop(channel, None)
+                if task:
+                    task.cancel()
+
+    async def close(self):
+        for task in self._listeners.values():
+            task.cancel()
+        self._listeners.clear()
+        await self._redis.close()
+
+
+def create_pubsub(url: Optional[str]):
+    """Backend for PUBSUB_URL: unset or memory:// for in-process, redis://... for Redis."""
+    if not url or url.startswith("memory://"):
+        return InMemoryPubSub()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisPubSub(url)
+    raise ValueError(f"Unsupported PUBSUB_URL: {url}")
@@ -0,0 +1,236 @@
+"""
+Rate limiting and admission control.
+
+Token buckets throttle the expensive or contended routes (bcrypt-backed
+auth, bookings at slot-release time) per client IP and per user. A cap on
+requests in flight sheds load before it queues up in the worker. Both
+reject early, in ASGI middleware, so a burst of scripted clients never
+reaches a handler or the database.
+
+The in-memory backend keeps buckets per process; the Redis backend shares
+them between workers.
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+MAX_TRACKED_KEYS = 100_000  # in-memory buckets kept before the least recently used are dropped
+BUSY_RETRY_AFTER = 1  # seconds, for requests shed by the concurrency cap
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+def parse_rate(limit: str) -> tuple[int, float]:
+    """'20/minute' -> (capacity 20, refill rate in tokens per second)"""
+    try:
+        count, period = limit.strip().split("/")
+        capacity = int(count)
+        seconds = _PERIODS[period.strip().rstrip("s")]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit {limit!r}, expected e.g. '20/minute'")
+    if capacity <= 0:
+        raise ValueError(f"Invalid rate limit {limit!r}, count must be positive")
+    return capacity, capacity / seconds
+
+
+class InMemoryRateLimitBackend:
+    """Token buckets in a dict; one process's view only."""
+
+    def __init__(self, max_keys: int = MAX_TRACKED_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        """Take a token; returns 0 if allowed, else seconds until one is available."""
+        now = self.clock()
+        bucket = self._buckets.pop(key, None)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self):
+        self._buckets.clear()
+
+
+# Refill and take in one atomic step; the server clock keeps workers consistent
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets in Redis so every worker draws from the same bucket.
+
+    Requires the optional `redis` package (redis>=4.2 for redis.asyncio).
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as exc:
+            raise RuntimeError("RATE_LIMIT_URL uses redis:// but the 'redis' package is not installed") from exc
+        self._redis = redis_asyncio.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[capacity, rate]))
+
+    async def close(self):
+        await self._redis.close()
+
+
+def create_rate_limit_backend(url: Optional[str]):
+    """Backend for RATE_LIMIT_URL: unset or memory:// for in-process, redis://... for Redis."""
+    if not url or url.startswith("memory://"):
+        return InMemoryRateLimitBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitBackend(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+
+
+class RateLimitRule:
+    """A token bucket per client IP, and per user when per_user is set, for some routes."""
+
+    def __init__(self, name: str, limit: str, routes: Iterable[tuple[str, str]], per_user: bool = False):
+        self.name = name
+        self.limit = limit
+        self.capacity, self.rate = parse_rate(limit)
+        self.routes = frozenset(routes)  # (method, path)
+        self.per_user = per_user
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        backend,
+        rules: Iterable[RateLimitRule],
+        identify_user: Callable[[str], Optional[int]] = lambda token: None,
+        trusted_proxies: int = 0,
+        enabled: bool = True,
+    ):
+        self.backend = backend
+        self.identify_user = identify_user
+        self.trusted_proxies = trusted_proxies
+        self.enabled = enabled
+        self._routes: dict[tuple[str, str], RateLimitRule] = {}
+        for rule in rules:
+            for route in rule.routes:
+                self._routes[route] = rule
+
+    def client_ip(self, scope) -> str:
+        """The address the outermost trusted proxy saw the request come from.
+
+        Each proxy appends the address it received the request from to
+        X-Forwarded-For, so with N trusted proxies that is the Nth entry from
+        the right. Entries further left come from the client and can be forged.
+        """
+        if self.trusted_proxies:
+            forwarded = [
+                entry.strip()
+                for name, value in scope.get("headers", ())
+                if name == b"x-forwarded-for"
+                for entry in value.decode("latin-1").split(",")
+            ]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def user_id(self, scope) -> Optional[int]:
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                return self.identify_user(token) if scheme.lower() == "bearer" and token else None
+        return None
+
+    async def check(self, scope) -> float:
+        """0 if the request may proceed, else seconds the client should wait."""
+        if not self.enabled:
+            return 0.0
+        rule = self._routes.get((scope["method"], scope["path"]))
+        if rule is None:
+            return 0.0
+        keys = [f"{rule.name}:ip:{self.client_ip(scope)}"]
+        if rule.per_user:
+            user_id = self.user_id(scope)
+            if user_id is not None:
+                keys.append(f"{rule.name}:user:{user_id}")
+        wait = 0.0
+        for key in keys:
+            wait = max(wait, await self.backend.take(key, rule.capacity, rule.rate))
+        return wait
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware: 503 past max_concurrent requests in flight, 429 past a rate limit.
+
+    max_concurrent=0 disables the cap. Requests for which exempt(path) is
+    true (health checks, long-lived event streams) bypass the cap.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, max_concurrent: int = 0, exempt: Callable[[str], bool] = lambda path: False):
+        self.app = app
+        self.limiter = limiter
+        self.max_concurrent = max_concurrent
+        self.exempt = exempt
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        capped = self.max_concurrent and not self.exempt(scope["path"])
+        if capped and self.in_flight >= self.max_concurrent:
+            await _reject(send, 503, "Server busy, please retry", BUSY_RETRY_AFTER)
+            return
+        wait = await self.limiter.check(scope)
+        if wait > 0:
+            await _reject(send, 429, "Too many requests, please slow down", math.ceil(wait))
+            return
+
+        if not capped:
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,84 @@
+"""
+Read-replica routing with read-your-writes.
+
+Read-only routes can be served from a replica (DATABASE_READ_URL). A
+replica trails the primary a little, so a client that has just booked
+would not find its booking if its next read went there. ReadYourWrites
+pins such clients to the primary for a short window after any successful
+write.
+
+A client is recognised in two ways. Each worker remembers the
+Authorization header of recent writers. Writes also return the end of the
+window in an X-Read-Primary-Until header. Clients echo it back, so a read
+that lands on another worker still goes to the primary. The header can
+only send a client to the primary, so clients gain nothing by forging it.
+"""
+import time
+from typing import Optional
+
+from cache import TTLCache
+
+PRIMARY_UNTIL_HEADER = "X-Read-Primary-Until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadYourWrites:
+    """Decides per request whether reads may go to the replica."""
+
+    def __init__(self, window: float = 5.0, max_entries: int = 10000, enabled: bool = True):
+        self.window = window
+        self.enabled = enabled
+        self._writers = TTLCache(maxsize=max_entries, ttl=window)
+
+    def wrote(self, authorization: Optional[str], now: Optional[float] = None) -> float:
+        """Start a client's window; returns its end as a Unix timestamp"""
+        until = (time.time() if now is None else now) + self.window
+        if authorization:
+            self._writers.set(authorization, until)
+        return until
+
+    def pinned(self, authorization: Optional[str], primary_until: Optional[str],
+               now: Optional[float] = None) -> bool:
+        """True if this client wrote within the window and must read from the primary"""
+        now = time.time() if now is None else now
+        try:
+            if primary_until and float(primary_until) > now:
+                return True
+        except ValueError:
+            pass
+        return bool(authorization) and self._writers.get(authorization, 0) > now
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that flags pinned requests and starts windows on writes.
+
+    Routes read the flag as request.state.read_primary.
+    """
+
+    def __init__(self, app, policy: ReadYourWrites):
+        self.app = app
+        self.policy = policy
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.policy.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"").decode("latin-1") or None
+        if scope["method"] in SAFE_METHODS:
+            primary_until = headers.get(PRIMARY_UNTIL_HEADER.lower().encode(), b"").decode("latin-1")
+            scope.setdefault("state", {})["read_primary"] = self.policy.pinned(authorization, primary_until)
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = self.policy.wrote(authorization)
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (PRIMARY_UNTIL_HEADER.lower().encode(), f"{until:.3f}".encode()),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
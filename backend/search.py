@@ -0,0 +1,154 @@
+"""
+In-process full-text index over courts.
+
+Used when the database has no full-text search of its own (SQLite); on
+PostgreSQL the API queries a weighted tsvector column instead. Documents
+are tokenized per field, and each field carries a weight, so a word in a
+court's name outranks the same word in its amenities. Every query term
+has to match (AND), and the last one also matches as a prefix, for
+search-as-you-type.
+"""
+import bisect
+import math
+import re
+import threading
+from typing import Optional
+
+FIELD_WEIGHTS = {"name": 1.0, "city": 0.6, "amenities": 0.6, "location": 0.3}  # like tsvector weights A, B, B, C
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """Crude plural folding so 'lights' finds 'light' and 'courts' finds 'court'."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def words(text: Optional[str]) -> list[str]:
+    """Lowercased alphanumeric runs; everything else separates words"""
+    return _WORD_RE.findall((text or "").lower())
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    return [stem(word) for word in words(text)]
+
+
+class InvertedIndex:
+    """term -> {doc id: field weight}, scored by field weight times idf."""
+
+    def __init__(self):
+        self._postings: dict[str, dict[int, float]] = {}
+        self._doc_terms: dict[int, set[str]] = {}
+        self._vocabulary: list[str] = []  # sorted, for prefix lookups
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, doc_id: int, fields: dict[str, Optional[str]]):
+        """Index a document, replacing any previous version of it."""
+        if doc_id in self._doc_terms:
+            self.remove(doc_id)
+        terms: dict[str, float] = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 0.3)
+            for term in tokenize(text):
+                terms[term] = max(terms.get(term, 0.0), weight)
+        for term, weight in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[doc_id] = weight
+        self._doc_terms[doc_id] = set(terms)
+
+    def remove(self, doc_id: int):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                self._vocabulary.pop(bisect.bisect_left(self._vocabulary, term))
+
+    def _matches(self, term: str, prefix: bool) -> dict[int, float]:
+        """Best weight per document among the terms matching a query term."""
+        if not prefix:
+            return self._postings.get(term, {})
+        matches: dict[int, float] = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            factor = 1.0 if candidate == term else 0.8  # exact words beat completions
+            for doc_id, weight in self._postings[candidate].items():
+                matches[doc_id] = max(matches.get(doc_id, 0.0), weight * factor)
+        return matches
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> tuple[int, list[tuple[int, float]]]:
+        """(total matches, [(doc id, score)]) for documents matching every query term.
+
+        Ranked by score, newest (highest id) first among equal scores.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        scores: Optional[dict[int, float]] = None
+        for i, term in enumerate(terms):
+            matches = self._matches(term, prefix=i == len(terms) - 1)
+            if not matches:
+                return 0, []
+            idf = math.log(1 + len(self._doc_terms) / len(matches))
+            if scores is None:
+                scores = {doc_id: weight * idf for doc_id, weight in matches.items()}
+            else:
+                scores = {doc_id: score + matches[doc_id] * idf for doc_id, score in scores.items() if doc_id in matches}
+            if not scores:
+                return 0, []
+        ranked = sorted(scores.items(), key=lambda hit: (-hit[1], -hit[0]))
+        return len(ranked), [(doc_id, round(score, 4)) for doc_id, score in ranked[offset:offset + limit]]
+
+
+class LazyTextIndex:
+    """InvertedIndex built from the database on first use, then kept current in place.
+
+    Like LazySpatialIndex it remembers the shared courts version it was built
+    at, and is rebuilt once a search reads a later one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[InvertedIndex] = None
+        self._version = 0
+
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def invalidate(self):
+        self._index = None
+
+    def add(self, doc_id: int, fields: dict[str, Optional[str]], version: int):
+        """Index a court this process created, whose insert bumped the version to `version`"""
+        with self._lock:
+            if self._index is None:
+                return
+            if self._version != version - 1:
+                # Another worker changed the catalog too; rebuild on the next search
+                self._index = None
+                return
+            self._index.add(doc_id, fields)
+            self._version = version
+
+    def search(self, load_documents, query: str, limit: int, offset: int,
+               version: int = 0) -> tuple[int, list[tuple[int, float]]]:
+        """load_documents() yields (doc id, fields) and is only called to build the index.
+
+        It must read the courts after `version` was read.
+        """
+        with self._lock:
+            if self._index is None or self._version < version:
+                index = InvertedIndex()
+                for doc_id, fields in load_documents():
+                    index.add(doc_id, fields)
+                self._index, self._version = index, version
+            return self._index.search(query, limit, offset)
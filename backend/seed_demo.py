@@ -0,0 +1,61 @@
+"""
+Load the demo users and courts into an empty database.
+
+Usage:
+    python seed_demo.py
+
+Creates or upgrades the schema first. Running it again is a no-op once
+the demo users exist. The app no longer seeds on startup, so fresh local
+and test databases need this once.
+"""
+from main import Court, SessionLocal, User, bump_cache_version, init_db
+
+# bcrypt (cost 12) hashes of the demo password "password", computed ahead of
+# time so seeding doesn't spend ~250 ms of CPU per user
+DEMO_PASSWORD_HASHES = (
+    "$2b$12$uYsa/hAdEjm4/vBmgS.74um59YtTKfufffvOMGZXjElgyWLGc1yC6",
+    "$2b$12$9ETbkoS/HXZ5oBsZr9j7yel1hRG4RsHt1Yrg9pr/AfH1oTXk8aitW",
+    "$2b$12$1uNDrYHlzck1F3wOZ5tkSuV9k19oesm.t67mhgboIgkZq6b829gHW",
+)
+
+
+def seed_demo_data() -> bool:
+    """Insert the demo data unless it is already there; returns whether it seeded"""
+    db = SessionLocal()
+    try:
+        if db.query(User.id).filter(User.email == "alice@test.com").first():
+            return False
+
+        alice = User(email="alice@test.com", password=DEMO_PASSWORD_HASHES[0], name="Alice Demo", role="player", skill_level="intermediate")
+        bob = User(email="bob@test.com", password=DEMO_PASSWORD_HASHES[1], name="Bob Smith", role="player", skill_level="beginner")
+        carol = User(email="carol@test.com", password=DEMO_PASSWORD_HASHES[2], name="Carol Owner", role="owner", skill_level="advanced")
+        db.add_all([alice, bob, carol])
+        db.flush()
+
+        # Demo courts (10 realistic courts across US cities)
+        courts = [
+            Court(owner_id=carol.id, name="Sunset Pickleball Club", location="123 Sunset Blvd, San Jose, CA", surface_type="hardcourt", amenities="Lights, Restrooms, Water fountain, Ball machine rental", price_per_hour=25, operating_hours="6:00 AM - 10:00 PM daily", photo_url="https://images.unsplash.com/photo-1626224583764-f87db24ac4ea?w=800"),
+            Court(owner_id=carol.id, name="Bay Area Courts", location="456 Marina Dr, San Francisco, CA", surface_type="hardcourt", amenities="Covered courts, Pro shop, Parking, Coaching available", price_per_hour=35, operating_hours="7:00 AM - 9:00 PM daily", photo_url="https://images.unsplash.com/photo-1554068865-24cecd4e34b8?w=800"),
+            Court(owner_id=carol.id, name="Golden Gate Pickleball", location="789 Park Ave, Oakland, CA", surface_type="other", amenities="Indoor, Climate controlled, Locker rooms, Showers", price_per_hour=45, operating_hours="6:00 AM - 11:00 PM daily", photo_url="https://images.unsplash.com/photo-1558618666-fcd25c85f82e?w=800"),
+            Court(owner_id=carol.id, name="Peninsula Paddle Center", location="321 El Camino Real, Palo Alto, CA", surface_type="hardcourt", amenities="Lights, Seating, Vending machines, Free Wi-Fi", price_per_hour=30, operating_hours="7:00 AM - 10:00 PM daily"),
+            Court(owner_id=carol.id, name="South Bay Smash Courts", location="555 Stevens Creek, Cupertino, CA", surface_type="other", amenities="Outdoor, Shaded seating, Free parking, Picnic area", price_per_hour=20, operating_hours="6:00 AM - 9:00 PM daily"),
+            Court(owner_id=carol.id, name="Desert Dink Pickleball", location="2100 E Camelback Rd, Scottsdale, AZ", surface_type="hardcourt", amenities="Shaded courts, Misting system, Pro shop, Tournament hosting", price_per_hour=28, operating_hours="5:00 AM - 9:00 PM daily", photo_url="https://images.unsplash.com/photo-1622279457486-62dcc4a431d6?w=800"),
+            Court(owner_id=carol.id, name="Lone Star Paddle Club", location="800 Congress Ave, Austin, TX", surface_type="clay", amenities="Clay courts, Clubhouse, Bar & grill, Lessons", price_per_hour=40, operating_hours="7:00 AM - 10:00 PM Mon-Sat, 8:00 AM - 8:00 PM Sun", photo_url="https://images.unsplash.com/photo-1551698618-1dfe5d97d256?w=800"),
+            Court(owner_id=carol.id, name="Peach State Pickleball", location="450 Peachtree St NE, Atlanta, GA", surface_type="hardcourt", amenities="Lights, Restrooms, Water stations, Beginner clinics", price_per_hour=22, operating_hours="6:00 AM - 10:00 PM daily"),
+            Court(owner_id=carol.id, name="Mile High Dinks", location="1550 Court Pl, Denver, CO", surface_type="other", amenities="Indoor, Heated, Altitude training, Equipment rental", price_per_hour=38, operating_hours="6:00 AM - 11:00 PM daily", photo_url="https://images.unsplash.com/photo-1574629810360-7efbbe195018?w=800"),
+            Court(owner_id=carol.id, name="Emerald City Courts", location="305 Harrison St, Seattle, WA", surface_type="hardcourt", amenities="Covered outdoor, Rain shelters, Coffee bar, Open play sessions", price_per_hour=15, operating_hours="7:00 AM - 9:00 PM daily"),
+        ]
+        db.add_all(courts)
+        bump_cache_version(db, "courts")
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    init_db()
+    if seed_demo_data():
+        print("✅ Demo data seeded: 3 users, 10 courts")
+    else:
+        print("ℹ️ Demo data already present")
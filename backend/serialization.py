@@ -0,0 +1,49 @@
+"""
+Fast JSON for list endpoints.
+
+Normally a list handler builds a Pydantic model per row, FastAPI validates
+the list again against the response_model, and jsonable_encoder plus json
+turn it into bytes. The fast path skips all of that. The column
+projections behind GET /courts and GET /bookings already match their
+response schemas field for field, so the rows are encoded directly, with
+orjson (in requirements.txt) and the standard library if it is missing.
+"""
+import json
+from datetime import date, datetime
+from typing import Iterable
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # the fast path falls back to json; the app warns at startup
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Compact JSON; datetimes as ISO 8601, as FastAPI's own encoder writes them"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+def row_dicts(rows: Iterable) -> list[dict]:
+    """Column-projection rows (anything with _asdict) as plain dicts"""
+    return [row._asdict() for row in rows]
+
+
+class FastJSONResponse(Response):
+    """JSON response that encodes its content as-is, without validation or jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
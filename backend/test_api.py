@@ -0,0 +1,1466 @@
+"""
+In-process API tests that need access to the app internals (engine, caches).
+
+Usage:
+    pytest test_api.py -v
+    DB_ASYNC=true pytest test_api.py -v     # through the async engine
+
+Runs the FastAPI app against a throwaway SQLite database; no server needed.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+_DB_DIR = tempfile.mkdtemp(prefix="pickleball-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["CATALOG_VERSION_TTL_SECONDS"] = "60"
+os.environ["RATE_LIMIT_ENABLED"] = "false"  # every test registers from the same client IP
+os.environ["MATCHMAKING_TICK_SECONDS"] = "0"  # tests run matchmaking ticks themselves
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from sqlalchemy import create_engine, event, inspect, text
+
+import analytics
+import bulk
+from availability import SlotBitmapIndex
+import benchmark
+import main
+import matchmaking
+import migrations
+from geocode_courts import geocode_courts
+import serialization
+from geo import GridIndex, haversine_km
+from passwords import hash_password, hash_rounds
+from pubsub import SUBSCRIBER_QUEUE_SIZE, InMemoryPubSub
+from replicas import PRIMARY_UNTIL_HEADER, ReadYourWrites
+from search import InvertedIndex
+from ratelimit import AdmissionControlMiddleware, InMemoryRateLimitBackend, RateLimiter, RateLimitRule, parse_rate
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+def register(client, **overrides):
+    run_id = uuid.uuid4().hex[:8]
+    payload = {
+        "email": f"api_{run_id}@example.com",
+        "password": "ApiPass123!",
+        "name": f"API User {run_id}",
+        "role": "player",
+        "skill_level": "intermediate",
+    }
+    payload.update(overrides)
+    resp = client.post("/auth/register", json=payload)
+    assert resp.status_code == 200, resp.text
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def auth_headers(client):
+    return register(client)
+
+
+@pytest.fixture(scope="module")
+def court_id(client, auth_headers):
+    resp = client.post("/courts", json={
+        "name": "Query Count Court",
+        "location": "1 Index Way, Austin, TX",
+        "surface_type": "hardcourt",
+    }, headers=auth_headers)
+    assert resp.status_code == 200
+    return resp.json()["id"]
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements issued on the engine serving requests."""
+    statements = []
+    engine = main.async_engine.sync_engine if main.async_engine is not None else main.engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# ── Database layer ──────────────────────────────────────────────
+
+class TestDatabaseLayer:
+    def test_async_database_url(self):
+        assert main.async_database_url("sqlite:///./pickleball.db") == "sqlite+aiosqlite:///./pickleball.db"
+        assert main.async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+        assert main.async_database_url("postgres://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+        assert main.async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+
+    def test_server_pool_settings_from_env(self):
+        options = main.engine_options("postgresql://u:p@db/app")
+        assert options["pool_size"] == main.DB_POOL_SIZE
+        assert options["max_overflow"] == main.DB_MAX_OVERFLOW
+        assert options["pool_pre_ping"] is main.DB_POOL_PRE_PING
+        assert "pool_size" not in main.engine_options("sqlite:///./x.db")
+
+
+# ── Read replica ────────────────────────────────────────────────
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Send reads to a second, empty SQLite file: a replica that is far behind"""
+    url = f"sqlite:///{os.path.join(_DB_DIR, f'replica-{uuid.uuid4().hex[:8]}.db')}"
+    engine = main.create_sync_engine(url)
+    main.Base.metadata.create_all(engine)
+    monkeypatch.setattr(main, "DATABASE_READ_URL", url)
+    monkeypatch.setattr(main, "ReadSessionLocal", main.sessionmaker(autoflush=False, bind=engine))
+    if main.AsyncSessionLocal is not None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        monkeypatch.setattr(main, "AsyncReadSessionLocal", async_sessionmaker(
+            create_async_engine(main.async_database_url(url)), autoflush=False, expire_on_commit=False))
+    monkeypatch.setattr(main.read_your_writes, "enabled", True)
+    # Replica reads fill the catalog caches; keep them away from other tests
+    monkeypatch.setattr(main, "catalog_version", main.CachedCounter(ttl=60))
+    monkeypatch.setattr(main, "catalog_cache", main.TTLCache(maxsize=64, ttl=60))
+    yield
+    engine.dispose()
+
+
+class TestReadReplica:
+    def test_writer_reads_its_own_booking(self, client, court_id, replica):
+        headers = register(client)
+        assert client.get("/bookings", headers=headers).json() == []  # the replica hasn't got it
+
+        resp = client.post("/bookings", json={"court_id": court_id, "time_slot": future_slot()}, headers=headers)
+        assert resp.status_code == 200
+        assert float(resp.headers[PRIMARY_UNTIL_HEADER]) > time.time()
+        assert [b["id"] for b in client.get("/bookings", headers=headers).json()] == [resp.json()["id"]]
+        assert client.get("/bookings", headers=register(client)).json() == []
+
+    def test_primary_until_header_pins_reads_on_any_worker(self, client, court_id, replica):
+        pinned = {PRIMARY_UNTIL_HEADER: f"{time.time() + 5:.3f}"}
+        expired = {PRIMARY_UNTIL_HEADER: f"{time.time() - 1:.3f}"}
+        assert client.get(f"/courts/{court_id}/availability").status_code == 404
+        assert client.get(f"/courts/{court_id}/availability", headers=expired).status_code == 404
+        assert client.get(f"/courts/{court_id}/availability", headers=pinned).status_code == 200
+        assert client.get("/courts", params={"all": "true"}).json() == []
+        listed = client.get("/courts", params={"all": "true"}, headers=pinned).json()
+        assert court_id in [c["id"] for c in listed]
+
+    def test_replica_rows_not_cached_under_a_newer_version(self, client, auth_headers, replica, monkeypatch):
+        created = client.post("/courts", json={
+            "name": "Replica Lag Court", "location": "9 Lag Lane, Austin, TX", "surface_type": "hardcourt",
+        }, headers=auth_headers)
+        assert created.status_code == 200
+        # This worker now knows the primary's version; the replica is still at 0
+        assert client.get("/courts", params={"all": "true"}).json() == []
+        monkeypatch.setattr(main, "DATABASE_READ_URL", None)
+        listed = client.get("/courts", params={"all": "true"}).json()
+        assert created.json()["id"] in [c["id"] for c in listed]
+
+    def test_sticky_window(self):
+        policy = ReadYourWrites(window=5)
+        until = policy.wrote("Bearer a", now=time.time())
+        assert policy.pinned("Bearer a", None)
+        assert not policy.pinned("Bearer b", None)
+        assert policy.pinned(None, f"{until:.3f}")
+        assert not policy.pinned("Bearer a", None, now=until + 1)
+        assert not policy.pinned(None, "not-a-timestamp")
+
+
+# ── Migrations ──────────────────────────────────────────────────
+
+class TestMigrations:
+    def test_app_database_is_fully_migrated(self, client):
+        assert migrations.pending_migrations(main.engine, main.MIGRATIONS) == []
+        indexes = {index["name"] for index in inspect(main.engine).get_indexes("bookings")}
+        assert "ix_bookings_player_created" in indexes
+
+    def test_upgrades_database_from_before_migrations(self):
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pickleball-legacy-'), 'legacy.db')}"
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(255), name VARCHAR(255))"))
+            conn.execute(text("CREATE TABLE courts (id INTEGER PRIMARY KEY, name VARCHAR(255), location VARCHAR(255))"))
+            conn.execute(text(
+                "CREATE TABLE bookings (id INTEGER PRIMARY KEY, court_id INTEGER, player_id INTEGER, "
+                "time_slot VARCHAR(100), status VARCHAR(50), created_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO courts (id, name, location) VALUES (1, 'Old', '1 Main St, Austin, TX')"))
+            conn.execute(text(
+                "INSERT INTO bookings (court_id, player_id, time_slot, status) "
+                "VALUES (1, 1, '2024-06-01 09:00-10:00', 'confirmed'), (1, 2, '2024-06-01 2:00 PM-4:00 PM', 'confirmed')"
+            ))
+
+        applied = migrations.migrate(engine, main.MIGRATIONS)
+        assert sorted(applied) == sorted(m.id for m in main.MIGRATIONS)
+        assert migrations.migrate(engine, main.MIGRATIONS) == []
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT city FROM courts")).scalar() == "austin"
+            assert conn.execute(text("SELECT start_at FROM bookings")).scalar() is not None
+            assert conn.execute(text("SELECT hour FROM court_hourly_usage ORDER BY hour")).scalars().all() == [9, 14, 15]
+            # The two-hour booking became one booking per hour
+            assert conn.execute(text("SELECT player_id, time_slot FROM bookings ORDER BY start_at")).all() == [
+                (1, "2024-06-01 09:00-10:00"), (2, "2024-06-01 14:00-15:00"), (2, "2024-06-01 15:00-16:00"),
+            ]
+            plan = " ".join(str(row[-1]) for row in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM bookings WHERE player_id = 1 ORDER BY created_at DESC"
+            )))
+        assert "ix_bookings_player_created" in plan
+        engine.dispose()
+
+    def test_old_migrations_ignore_later_model_columns(self, monkeypatch):
+        """0001-0008 read and write only the columns they knew about."""
+        for model in (main.Booking, main.Court):
+            later = model.__table__.to_metadata(main.MetaData())
+            later.append_column(main.Column("added_later", main.Integer))
+            monkeypatch.setattr(model, "__table__", later)
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pickleball-legacy-'), 'legacy.db')}"
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE courts (id INTEGER PRIMARY KEY, name VARCHAR(255), location VARCHAR(255))"))
+            conn.execute(text(
+                "CREATE TABLE bookings (id INTEGER PRIMARY KEY, court_id INTEGER, player_id INTEGER, "
+                "time_slot VARCHAR(100), status VARCHAR(50), created_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO courts (id, name, location) VALUES (1, 'Old', '1 Main St, Austin, TX')"))
+            conn.execute(text(
+                "INSERT INTO bookings (court_id, player_id, time_slot, status) "
+                "VALUES (1, 2, '2024-06-01 2:00 PM-4:00 PM', 'confirmed')"
+            ))
+        early = [m for m in main.MIGRATIONS if m.id < "0009" and not m.indexes]
+        assert "0008_hourly_bookings" in migrations.migrate(engine, early)
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM bookings")).scalar() == 2
+            assert conn.execute(text("SELECT sum(bookings) FROM court_daily_usage")).scalar() == 2
+        engine.dispose()
+
+    def test_postgres_indexes_build_concurrently(self):
+        index = main.model_index(main.Booking, "ix_bookings_player_created")
+        assert migrations.online_index_ddl(index, "postgresql") == (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_player_created ON bookings (player_id, created_at)"
+        )
+        assert "CONCURRENTLY" not in migrations.online_index_ddl(index, "sqlite")
+
+    def test_partial_unique_index_builds_online(self):
+        index = main.model_index(main.Booking, "uq_bookings_court_start_active")
+        assert migrations.online_index_ddl(index, "postgresql") == (
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_bookings_court_start_active "
+            "ON bookings (court_id, start_at) WHERE status <> 'cancelled'"
+        )
+
+    def test_busy_table_indexes_are_built_online(self):
+        """The baseline builds no index on a table that already exists; each has an online migration."""
+        online = {index.name for m in main.MIGRATIONS for index in m.indexes}
+        for name in ("bookings", "courts", "messages", "conversations"):
+            composite = {index.name for index in main.Base.metadata.tables[name].indexes if len(index.columns) > 1}
+            assert composite <= online, composite - online
+            assert not {index.name for index in main.baseline.tables[name].indexes} & composite
+
+    def test_fresh_database_matches_the_models(self):
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pickleball-fresh-'), 'fresh.db')}"
+        engine = create_engine(url)
+        migrations.migrate(engine, main.MIGRATIONS)
+        inspector = inspect(engine)
+        for table in main.Base.metadata.sorted_tables:
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            assert {column.name for column in table.columns} <= columns, table.name
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            assert {index.name for index in table.indexes} <= indexes, table.name
+        engine.dispose()
+
+
+# ── Password hashing ────────────────────────────────────────────
+
+class TestPasswordHashing:
+    def test_login_rehashes_when_cost_changes(self, client):
+        email = f"rehash_{uuid.uuid4().hex[:8]}@example.com"
+        with main.SessionLocal() as db:
+            db.add(main.User(email=email, password=hash_password("OldCost1!", 5), name="Rehash", role="player"))
+            db.commit()
+
+        resp = client.post("/auth/login", json={"email": email, "password": "OldCost1!"})
+        assert resp.status_code == 200
+        with main.SessionLocal() as db:
+            stored = db.query(main.User.password).filter(main.User.email == email).scalar()
+        assert hash_rounds(stored) == main.BCRYPT_ROUNDS
+        # The upgraded hash still verifies
+        assert client.post("/auth/login", json={"email": email, "password": "OldCost1!"}).status_code == 200
+
+    def test_saturated_pool_sheds_with_503(self, client, monkeypatch):
+        email = f"busy_{uuid.uuid4().hex[:8]}@example.com"
+        register(client, email=email)
+        monkeypatch.setattr(main.password_hasher, "max_pending", 0)
+        resp = client.post("/auth/login", json={"email": email, "password": "ApiPass123!"})
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == str(main.PASSWORD_HASH_RETRY_AFTER)
+
+
+# ── Auth cache ──────────────────────────────────────────────────
+
+class TestAuthCache:
+    def test_repeat_requests_skip_user_query(self, client):
+        headers = register(client)
+        assert client.get("/bookings", headers=headers).status_code == 200
+        hits = main.user_cache.hits
+        with count_queries() as statements:
+            assert client.get("/bookings", headers=headers).status_code == 200
+        assert main.user_cache.hits == hits + 1
+        assert not any("FROM users" in s for s in statements), statements
+
+    def test_user_update_invalidates_cache(self, client):
+        headers = register(client, name="Before Rename")
+        client.get("/bookings", headers=headers)
+        user_id = main.decode_token_subject(headers["Authorization"].split()[1])
+        assert main.user_cache.get(user_id).name == "Before Rename"
+
+        with main.SessionLocal() as db:
+            db.query(main.User).filter(main.User.id == user_id).first().name = "After Rename"
+            db.commit()
+        assert main.user_cache.get(user_id) is None
+
+    def test_tampered_token_rejected(self, client):
+        headers = register(client)
+        token = headers["Authorization"].split()[1]
+        resp = client.get("/bookings", headers={"Authorization": f"Bearer {token[:-2]}xx"})
+        assert resp.status_code == 401
+
+    def test_health_reports_cache_counters(self, client):
+        caches = client.get("/health").json()["caches"]
+        assert {"hits", "misses", "size"} <= caches["users"].keys()
+
+
+# ── Rate limiting ───────────────────────────────────────────────
+
+def http_scope(path, method="POST", ip="10.0.0.1", headers=()):
+    return {"type": "http", "method": method, "path": path, "client": (ip, 5000), "headers": list(headers)}
+
+
+class TestRateLimiting:
+    def test_token_bucket_refills_over_time(self):
+        now = [0.0]
+        backend = InMemoryRateLimitBackend(clock=lambda: now[0])
+        capacity, rate = parse_rate("2/minute")
+
+        async def takes(n):
+            return [await backend.take("k", capacity, rate) for _ in range(n)]
+
+        assert asyncio.run(takes(3)) == [0, 0, 30.0]
+        now[0] = 30.0
+        assert asyncio.run(takes(2)) == [0, 30.0]
+
+    def test_bookings_are_limited_per_user_across_ips(self):
+        limiter = RateLimiter(
+            InMemoryRateLimitBackend(),
+            [RateLimitRule("bookings", "2/minute", [("POST", "/bookings")], per_user=True)],
+            identify_user={"alice": 1, "bob": 2}.get,
+        )
+        bearer = lambda token: [(b"authorization", f"Bearer {token}".encode())]
+
+        async def scenario():
+            waits = [await limiter.check(http_scope("/bookings", ip=f"10.0.0.{n}", headers=bearer("alice"))) for n in range(3)]
+            other = await limiter.check(http_scope("/bookings", ip="10.0.0.9", headers=bearer("bob")))
+            unlimited = await limiter.check(http_scope("/bookings", method="GET", ip="10.0.0.9"))
+            return waits, other, unlimited
+
+        waits, other, unlimited = asyncio.run(scenario())
+        assert waits[:2] == [0, 0] and waits[2] > 0
+        assert other == 0 and unlimited == 0
+
+    def test_client_ip_is_what_the_trusted_proxy_saw(self):
+        forwarded = lambda value: [(b"x-forwarded-for", value.encode())]
+        direct = RateLimiter(InMemoryRateLimitBackend(), [])
+        proxied = RateLimiter(InMemoryRateLimitBackend(), [], trusted_proxies=1)
+        two_hops = RateLimiter(InMemoryRateLimitBackend(), [], trusted_proxies=2)
+        scope = http_scope("/auth/login", ip="10.0.0.1", headers=forwarded("6.6.6.6, 203.0.113.7"))
+        assert direct.client_ip(scope) == "10.0.0.1"
+        assert proxied.client_ip(scope) == "203.0.113.7"  # the forged leftmost entry is ignored
+        assert two_hops.client_ip(scope) == "6.6.6.6"
+        assert proxied.client_ip(http_scope("/auth/login", ip="10.0.0.1")) == "10.0.0.1"
+
+    def test_login_burst_gets_429(self, client, monkeypatch):
+        monkeypatch.setattr(main.rate_limiter, "enabled", True)
+        monkeypatch.setattr(main.rate_limiter, "backend", InMemoryRateLimitBackend())
+        capacity, _ = parse_rate(main.RATE_LIMIT_AUTH)
+        payload = {"email": "nobody@example.com", "password": "wrong"}
+        statuses = [client.post("/auth/login", json=payload).status_code for _ in range(capacity)]
+        assert set(statuses) == {401}
+        resp = client.post("/auth/login", json=payload)
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) >= 1
+        assert client.get("/courts").status_code == 200
+
+    def test_concurrency_cap_sheds_with_503(self):
+        release = asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionControlMiddleware(
+            slow_app, RateLimiter(InMemoryRateLimitBackend(), []), max_concurrent=2,
+            exempt=lambda path: path == "/health",
+        )
+
+        async def request(path):
+            statuses = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+
+            await middleware(http_scope(path, method="GET"), None, send)
+            return statuses[0]
+
+        async def scenario():
+            admitted = [asyncio.create_task(request("/courts")) for _ in range(2)]
+            health = asyncio.create_task(request("/health"))
+            await asyncio.sleep(0)
+            shed = await request("/courts")
+            release.set()
+            return shed, await asyncio.gather(*admitted, health), middleware.in_flight
+
+        shed, completed, in_flight = asyncio.run(scenario())
+        assert shed == 503
+        assert completed == [200, 200, 200]
+        assert in_flight == 0
+
+
+# ── Query counts ────────────────────────────────────────────────
+
+class TestQueryCounts:
+    def test_get_bookings_query_count_is_constant(self, client, court_id):
+        """GET /bookings issues the same number of statements for 1 or 20 bookings."""
+        counts = []
+        for n in (1, 20):
+            headers = register(client)
+            for hour in range(n):
+                resp = client.post("/bookings", json={
+                    "court_id": court_id,
+                    "time_slot": f"2027-0{n % 9 + 1}-{hour + 1:02d} 10:00-11:00",
+                }, headers=headers)
+                assert resp.status_code == 200, resp.text
+            with count_queries() as statements:
+                resp = client.get("/bookings", headers=headers)
+            assert resp.status_code == 200
+            assert len(resp.json()) == n
+            assert all(b["court_name"] == "Query Count Court" for b in resp.json())
+            counts.append(len(statements))
+        assert 0 < counts[0] == counts[1], counts
+
+    def test_create_booking_reads_back_once(self, client, auth_headers, court_id):
+        with count_queries() as statements:
+            resp = client.post("/bookings", json={
+                "court_id": court_id,
+                "time_slot": "2027-12-01 8:00 AM-9:00 AM",
+            }, headers=auth_headers)
+        assert resp.status_code == 200
+        assert resp.json()["location"] == "1 Index Way, Austin, TX"
+        selects = [
+            s for s in statements
+            if s.lstrip().upper().startswith("SELECT") and "FROM users" not in s
+        ]
+        # A single joined read-back of the booking and its court
+        assert len(selects) == 1, selects
+
+
+    def test_batch_booking_query_count_is_constant(self, client, auth_headers, court_id):
+        """POST /bookings/batch validates and inserts every slot in a fixed number of statements."""
+        counts = []
+        for year, count in ((2028, 5), (2029, 40)):
+            with count_queries() as statements:
+                resp = client.post("/bookings/batch", json={
+                    "court_id": court_id,
+                    "recurrence": {"start": f"{year}-01-04T10:00:00", "frequency": "daily", "count": count},
+                }, headers=auth_headers)
+            assert resp.status_code == 200
+            assert resp.json()["created"] == count
+            counts.append(len(statements))
+        assert counts[0] == counts[1], counts
+
+
+# ── Booking slots ───────────────────────────────────────────────
+
+class TestBookingSlots:
+    def test_bookings_are_one_hour(self, client, auth_headers, court_id):
+        day = future_slot().split()[0]
+        resp = client.post("/bookings", json={"court_id": court_id, "time_slot": f"{day} 10:00-12:00"}, headers=auth_headers)
+        assert resp.status_code == 422
+        first = client.post("/bookings", json={"court_id": court_id, "time_slot": f"{day} 11:00-12:00"}, headers=auth_headers)
+        assert first.status_code == 200
+        again = client.post("/bookings", json={"court_id": court_id, "time_slot": f"{day} 11:00-12:00"}, headers=register(client))
+        assert again.status_code == 409
+
+    def test_batch_rejects_multi_hour_slots(self, client, auth_headers, court_id):
+        day = future_slot().split()[0]
+        resp = client.post("/bookings/batch", json={
+            "court_id": court_id, "time_slots": [f"{day} 10:00-12:00", f"{day} 11:00-12:00"],
+        }, headers=auth_headers)
+        assert [r["status"] for r in resp.json()["results"]] == ["invalid", "created"]
+
+    def test_recurring_block_books_every_hour(self, client, auth_headers, court_id):
+        day = future_slot().split()[0]
+        rule = {"start": f"{day}T10:00:00", "hours": 3, "frequency": "weekly", "count": 2}
+        resp = client.post("/bookings/batch", json={"court_id": court_id, "recurrence": rule}, headers=auth_headers)
+        assert resp.status_code == 200, resp.text
+        assert [r["time_slot"] for r in resp.json()["results"][:3]] == [
+            f"{day} 10:00-11:00", f"{day} 11:00-12:00", f"{day} 12:00-13:00",
+        ]
+        assert resp.json()["created"] == 6
+        inside = client.post("/bookings/batch", json={
+            "court_id": court_id, "time_slots": [f"{day} 11:00-12:00"],
+        }, headers=register(client))
+        assert inside.json()["results"][0]["status"] == "conflict"
+
+    def test_recurrence_start_must_be_on_the_hour_in_utc(self, client, auth_headers, court_id):
+        day = future_slot().split()[0]
+        for start in (f"{day}T10:30:00", f"{day}T10:00:05", f"{day}T10:00:00+02:00"):
+            rule = {"start": start, "count": 1}
+            resp = client.post("/bookings/batch", json={"court_id": court_id, "recurrence": rule}, headers=auth_headers)
+            assert resp.status_code == 422, start
+
+
+# ── Idempotency keys ────────────────────────────────────────────
+
+class TestIdempotency:
+    def test_retried_booking_replays_original_response(self, client, court_id):
+        headers = register(client)
+        keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+        payload = {"court_id": court_id, "time_slot": "2031-01-05 10:00-11:00"}
+        first = client.post("/bookings", json=payload, headers=keyed)
+        assert first.status_code == 200
+
+        with count_queries() as statements:
+            retry = client.post("/bookings", json=payload, headers=keyed)
+        assert retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert statements == []
+
+        # Another worker, without the key in its front cache, replays from the table
+        main.idempotency_cache.clear()
+        with count_queries() as statements:
+            retry = client.post("/bookings", json=payload, headers=keyed)
+        assert retry.json() == first.json()
+        assert not any(s.lstrip().upper().startswith(("INSERT", "UPDATE")) for s in statements), statements
+        assert len(client.get("/bookings", headers=headers).json()) == 1
+
+    def test_key_reused_with_different_body_is_rejected(self, client, court_id):
+        keyed = {**register(client), "Idempotency-Key": "reused-key"}
+        client.post("/bookings", json={"court_id": court_id, "time_slot": "2031-01-06 10:00-11:00"}, headers=keyed)
+        resp = client.post("/bookings", json={"court_id": court_id, "time_slot": "2031-01-06 11:00-12:00"}, headers=keyed)
+        assert resp.status_code == 422
+
+    def test_courts_keys_are_scoped_per_user(self, client):
+        payload = {"name": "Idempotent Court", "location": "1 Retry Rd, Austin, TX", "surface_type": "hardcourt"}
+        alice = {**register(client), "Idempotency-Key": "same-key"}
+        bob = {**register(client), "Idempotency-Key": "same-key"}
+        first, retry = (client.post("/courts", json=payload, headers=alice) for _ in range(2))
+        assert first.json()["id"] == retry.json()["id"]
+        assert client.post("/courts", json=payload, headers=bob).json()["id"] != first.json()["id"]
+
+    def test_expired_keys_are_purged_in_batches(self, client, court_id):
+        past = main.datetime.utcnow() - main.timedelta(seconds=1)
+        with main.SessionLocal() as session:
+            for n in range(5):
+                session.add(main.IdempotencyKey(
+                    key=f"expired-{uuid.uuid4().hex}", fingerprint="f", status_code=200, response="{}", expires_at=past,
+                ))
+            session.commit()
+        assert main.purge_expired_idempotency_keys(batch_size=2) == 5
+        with main.SessionLocal() as session:
+            assert session.query(main.IdempotencyKey).filter(main.IdempotencyKey.expires_at <= past).count() == 0
+
+
+# ── Fast JSON ───────────────────────────────────────────────────
+
+class TestFastJSON:
+    @pytest.mark.parametrize("encoder", ["orjson", "json"])
+    def test_list_endpoints_encode_the_same_documents(self, client, auth_headers, court_id, monkeypatch, encoder):
+        assert serialization.ORJSON_AVAILABLE  # a requirement, so the fast path really uses it
+        if encoder == "json":
+            monkeypatch.setattr(serialization, "orjson", None)
+        client.post("/bookings", json={"court_id": court_id, "time_slot": "2032-02-02 08:00-09:00"}, headers=auth_headers)
+        pages = {}
+        for fast in (False, True):
+            monkeypatch.setattr(main, "FAST_JSON", fast)
+            main.catalog_cache.clear()
+            courts = client.get("/courts", params={"limit": 20})
+            bookings = client.get("/bookings", headers=auth_headers)
+            assert courts.status_code == bookings.status_code == 200
+            assert bookings.headers["content-type"] == "application/json"
+            pages[fast] = (courts.json(), courts.headers.get("X-Next-Cursor"), bookings.json())
+        assert pages[True] == pages[False]
+        assert pages[True][2]
+
+    def test_missing_orjson_is_reported(self, monkeypatch, capsys):
+        monkeypatch.setattr(main, "FAST_JSON", True)
+        monkeypatch.setattr(main, "ORJSON_AVAILABLE", False)
+        main.warm_up()
+        assert "orjson isn't installed" in capsys.readouterr().out
+
+
+# ── Catalog HTTP cache ──────────────────────────────────────────
+
+class TestCatalogCache:
+    def test_browsers_can_read_the_next_cursor(self, client):
+        resp = client.get("/courts", params={"limit": 1}, headers={"Origin": "http://localhost:3000"})
+        assert "X-Next-Cursor" in resp.headers["Access-Control-Expose-Headers"]
+
+    def test_conditional_get_skips_database(self, client):
+        first = client.get("/courts", params={"limit": 5})
+        etag = first.headers["ETag"]
+        assert etag.startswith('"') and first.headers["Cache-Control"]
+
+        with count_queries() as statements:
+            resp = client.get("/courts", params={"limit": 5}, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.headers["ETag"] == etag
+        assert statements == []
+
+    def test_create_court_changes_etag(self, client, auth_headers):
+        etag = client.get("/courts", params={"limit": 5}).headers["ETag"]
+        client.post("/courts", json={
+            "name": "Fresh Court", "location": "9 New St", "surface_type": "hardcourt",
+        }, headers=auth_headers)
+        resp = client.get("/courts", params={"limit": 5}, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+        assert resp.json()[0]["name"] == "Fresh Court"
+
+    def test_other_worker_change_seen_after_version_ttl(self, client, monkeypatch):
+        """A version bump written by another process invalidates once the local copy goes stale."""
+        etag = client.get("/courts", params={"limit": 5}).headers["ETag"]
+        with main.SessionLocal() as db:
+            court = main.Court(owner_id=1, name="Other Worker Court", location="1 Far St", surface_type="clay")
+            db.add(court)
+            main.bump_cache_version(db, "courts")
+            db.commit()
+
+        resp = client.get("/courts", params={"limit": 5}, headers={"If-None-Match": etag})
+        assert resp.status_code == 304  # still trusting the local version
+        monkeypatch.setattr(main.catalog_version, "_expires_at", 0)
+        resp = client.get("/courts", params={"limit": 5}, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()[0]["name"] == "Other Worker Court"
+
+
+# ── Spatial index ───────────────────────────────────────────────
+
+@pytest.fixture(scope="module")
+def points():
+    """100k random points across the continental US."""
+    rng = random.Random(42)
+    return [(i, rng.uniform(25, 49), rng.uniform(-124, -67)) for i in range(100_000)]
+
+
+class TestSpatialIndex:
+    def test_matches_brute_force(self, points):
+        index = GridIndex(points)
+        for lat, lng, radius in [(37.77, -122.42, 50), (30.27, -97.74, 5), (47.6, -122.3, 200)]:
+            expected = sorted(
+                (pid, haversine_km(lat, lng, plat, plng))
+                for pid, plat, plng in points
+                if haversine_km(lat, lng, plat, plng) <= radius
+            )
+            assert sorted(index.within(lat, lng, radius)) == expected
+
+    def test_radius_query_is_sub_millisecond_at_100k(self, points):
+        index = GridIndex(points)
+        rng = random.Random(7)
+        queries = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(500)]
+        start = time.perf_counter()
+        for lat, lng in queries:
+            index.within(lat, lng, 10)
+        assert (time.perf_counter() - start) / len(queries) < 0.001
+
+    def test_new_court_is_searchable(self, client, auth_headers):
+        params = {"lat": -33.0, "lng": 151.0, "radius": 1}
+        assert client.get("/courts/nearby", params=params).json() == []
+        resp = client.post("/courts", json={
+            "name": "Harbour Court",
+            "location": "Harbour St",
+            "surface_type": "hardcourt",
+            "latitude": -33.0,
+            "longitude": 151.0,
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+        assert [c["name"] for c in client.get("/courts/nearby", params=params).json()] == ["Harbour Court"]
+
+    def test_geocoding_refreshes_running_workers(self, client, capsys):
+        austin = {"lat": 30.2672, "lng": -97.7431, "radius": 1, "limit": 100}
+        with main.SessionLocal() as db:
+            court = main.Court(owner_id=1, name="Ungeocoded Court", location="5 Congress Ave, Austin, TX",
+                               surface_type="clay")
+            db.add(court)
+            db.flush()
+            # Added before coordinates were filled in on insert
+            db.query(main.Court).filter(main.Court.id == court.id).update({"latitude": None, "longitude": None})
+            db.commit()
+            court_id = court.id
+        assert court_id not in [c["id"] for c in client.get("/courts/nearby", params=austin).json()]
+        geocode_courts()
+        capsys.readouterr()
+        assert court_id in [c["id"] for c in client.get("/courts/nearby", params=austin).json()]
+
+    def test_court_added_by_another_worker_is_found(self, client):
+        params = {"lat": -41.3, "lng": 174.8, "radius": 1}
+        assert client.get("/courts/nearby", params=params).json() == []
+        with main.SessionLocal() as db:
+            db.add(main.Court(owner_id=1, name="Other Worker Harbour", location="1 Quay St", surface_type="clay",
+                              latitude=-41.3, longitude=174.8))
+            main.bump_cache_version(db, "courts")
+            db.commit()
+        assert [c["name"] for c in client.get("/courts/nearby", params=params).json()] == ["Other Worker Harbour"]
+
+
+# ── Court search ────────────────────────────────────────────────
+
+class TestCourtSearch:
+    def test_index_ranks_by_field_and_matches_prefixes(self):
+        index = InvertedIndex()
+        index.add(1, {"name": "Riverside Courts", "amenities": "Lights"})
+        index.add(2, {"name": "Lights Out Arena", "city": "riverside"})
+        index.add(3, {"name": "Hilltop", "amenities": "Lights, Parking"})
+        assert [doc for doc, _ in index.search("light")[1]] == [2, 3, 1]
+        assert index.search("riverside light")[0] == 2
+        assert [doc for doc, _ in index.search("park")[1]] == [3]  # prefix of 'parking'
+        assert index.search("lights tennis") == (0, [])
+        index.add(3, {"name": "Hilltop"})  # re-indexing replaces the old terms
+        index.remove(2)
+        assert [doc for doc, _ in index.search("light")[1]] == [1]
+        assert index.search("park") == (0, [])
+
+    def test_search_endpoint_ranks_and_paginates(self, client, auth_headers):
+        word = "zq" + uuid.uuid4().hex[:6]
+        for name, amenities in [(f"{word} Arena", None), ("Plain Court", f"{word} lighting"), (f"{word} Club", "Lights")]:
+            resp = client.post("/courts", json={
+                "name": name,
+                "location": "9 Search Rd, Boise, ID",
+                "surface_type": "hardcourt",
+                "amenities": amenities,
+            }, headers=auth_headers)
+            assert resp.status_code == 200
+
+        resp = client.get("/courts/search", params={"q": word})
+        assert resp.status_code == 200
+        assert resp.headers["X-Total-Count"] == "3"
+        results = resp.json()
+        assert [c["name"] for c in results] == [f"{word} Club", f"{word} Arena", "Plain Court"]
+        assert results[0]["score"] > results[2]["score"]
+
+        page = client.get("/courts/search", params={"q": word[:-2], "limit": 1, "offset": 2})
+        assert page.headers["X-Total-Count"] == "3"
+        assert [c["name"] for c in page.json()] == ["Plain Court"]
+        both = client.get("/courts/search", params={"q": f"{word} boise lig"}).json()
+        assert [c["name"] for c in both] == [f"{word} Club", "Plain Court"]
+
+    def test_new_court_is_added_without_a_rebuild(self, client, auth_headers):
+        client.get("/courts/search", params={"q": "warmup"})
+        assert main.court_text_index.is_loaded()
+        word = "zq" + uuid.uuid4().hex[:6]
+        resp = client.post("/courts", json={
+            "name": f"{word} Pavilion",
+            "location": "3 Fresh St, Reno, NV",
+            "surface_type": "hardcourt",
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+        assert main.court_text_index.is_loaded()
+        with count_queries() as statements:
+            results = client.get("/courts/search", params={"q": f"{word} reno"}).json()
+        assert [c["id"] for c in results] == [resp.json()["id"]]
+        assert len(statements) == 2  # the courts version and the row fetch for the hits
+
+    def test_court_added_by_another_worker_is_found(self, client):
+        word = "zq" + uuid.uuid4().hex[:6]
+        client.get("/courts/search", params={"q": "warmup"})
+        with main.SessionLocal() as db:
+            db.add(main.Court(owner_id=1, name=f"{word} Dome", location="2 Far St", surface_type="clay"))
+            main.bump_cache_version(db, "courts")
+            db.commit()
+        assert [c["name"] for c in client.get("/courts/search", params={"q": word}).json()] == [f"{word} Dome"]
+
+    def test_query_without_words_is_rejected(self, client):
+        assert client.get("/courts/search", params={"q": "!!"}).status_code == 400
+        assert client.get("/courts/search").status_code == 422
+
+
+# ── Live availability ───────────────────────────────────────────
+
+class TestLiveAvailability:
+    def test_booking_pushes_slot_delta(self, client, auth_headers, court_id):
+        with client.websocket_connect(f"/courts/{court_id}/live") as ws:
+            assert ws.receive_json() == {"type": "subscribed", "court_id": court_id}
+            resp = client.post("/bookings", json={
+                "court_id": court_id,
+                "time_slot": "2030-03-01 18:00-19:00",
+            }, headers=auth_headers)
+            assert resp.status_code == 200
+            assert ws.receive_json() == {
+                "type": "slots",
+                "court_id": court_id,
+                "status": "booked",
+                "slots": [{"date": "2030-03-01", "hours": [18]}],
+            }
+
+    def test_batch_pushes_one_event(self, client, auth_headers, court_id):
+        with client.websocket_connect(f"/courts/{court_id}/live") as ws:
+            ws.receive_json()
+            client.post("/bookings/batch", json={
+                "court_id": court_id,
+                "time_slots": ["2030-04-01 09:00-10:00", "2030-04-02 09:00-10:00"],
+            }, headers=auth_headers)
+            assert ws.receive_json()["slots"] == [
+                {"date": "2030-04-01", "hours": [9]},
+                {"date": "2030-04-02", "hours": [9]},
+            ]
+
+    def test_bookings_by_another_worker_show_up(self, client, auth_headers, court_id):
+        time_slot = "2030-05-01 07:00-08:00"
+        params = {"from": "2030-05-01", "days": 1}
+        client.post("/bookings", json={"court_id": court_id, "time_slot": "2030-05-01 06:00-07:00"}, headers=auth_headers)
+        assert client.get(f"/courts/{court_id}/availability", params=params).json()["days"][0]["booked_hours"] == [6]
+        # Another worker books, then cancels, straight through the database
+        start_at, end_at = main.slot_bounds(time_slot)
+        with main.SessionLocal() as db:
+            booking = main.Booking(court_id=court_id, player_id=1, time_slot=time_slot, start_at=start_at, end_at=end_at)
+            db.add(booking)
+            main.bump_cache_version(db, main.slots_version_name(court_id))
+            db.commit()
+            booking_id = booking.id
+        assert client.get(f"/courts/{court_id}/availability", params=params).json()["days"][0]["booked_hours"] == [6, 7]
+        with main.SessionLocal() as db:
+            db.query(main.Booking).filter(main.Booking.id == booking_id).update({main.Booking.status: "cancelled"})
+            main.bump_cache_version(db, main.slots_version_name(court_id))
+            db.commit()
+        assert client.get(f"/courts/{court_id}/availability", params=params).json()["days"][0]["booked_hours"] == [6]
+
+    def test_slot_index_keeps_only_days_still_ahead(self):
+        today = [date(2030, 1, 2)]
+        index = SlotBitmapIndex(today=lambda: today[0])
+        index.load(1, [datetime(2030, 1, 1, 9), datetime(2030, 1, 2, 9), datetime(2030, 1, 3, 10)], version=1)
+        assert index.get(1, date(2030, 1, 1)) == 0
+        assert index.get(1, date(2030, 1, 2)) == 1 << 9
+        index.mark(2, datetime(2030, 1, 3, 8))  # courts that aren't loaded are left alone
+        assert not index.is_loaded(2)
+
+        today[0] = date(2030, 1, 3)
+        index.mark(1, datetime(2030, 1, 3, 11))
+        assert index.get(1, date(2030, 1, 2)) == 0
+        assert index.get(1, date(2030, 1, 3)) == 1 << 10 | 1 << 11
+        index.unmark(1, datetime(2030, 1, 3, 10))
+        assert index.get(1, date(2030, 1, 3)) == 1 << 11
+
+    def test_cancel_updates_the_index_in_place(self, client, auth_headers, court_id):
+        time_slot = future_slot(15)
+        params = {"from": time_slot.split()[0], "days": 1}
+        booking = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=auth_headers).json()
+        assert client.get(f"/courts/{court_id}/availability", params=params).json()["days"][0]["booked_hours"] == [15]
+        client.post(f"/bookings/{booking['id']}/cancel", headers=auth_headers)
+        with count_queries() as statements:
+            resp = client.get(f"/courts/{court_id}/availability", params=params)
+        assert resp.json()["days"][0]["booked_hours"] == []
+        assert not [s for s in statements if "FROM bookings" in s]  # no reload
+
+    def test_unknown_court_is_rejected(self, client):
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/courts/999999/live"):
+                pass
+        assert exc.value.code == 4404
+        assert client.get("/courts/999999/events").status_code == 404
+
+    def test_slow_subscriber_gets_resync(self):
+        async def scenario():
+            broker = InMemoryPubSub()
+            async with broker.subscribe("court:1") as subscription:
+                for n in range(SUBSCRIBER_QUEUE_SIZE + 1):
+                    await broker.publish("court:1", {"n": n})
+                assert await subscription.get(timeout=0) == {"type": "resync"}
+                assert await subscription.get(timeout=0) is None
+            assert broker.subscriber_count("court:1") == 0
+
+        asyncio.run(scenario())
+
+
+# ── Cancellation and waitlist ───────────────────────────────────
+
+def future_slot(hour=18):
+    """A one-hour slot on a far-future day no other test books"""
+    day = (datetime.utcnow() + timedelta(days=random.randint(7000, 9000))).date()
+    return f"{day.isoformat()} {hour:02d}:00-{hour + 1:02d}:00"
+
+
+class TestWaitlist:
+    def test_cancel_frees_the_slot(self, client, auth_headers, court_id):
+        time_slot = future_slot()
+        booking = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=auth_headers).json()
+        day = time_slot.split()[0]
+        with client.websocket_connect(f"/courts/{court_id}/live") as ws:
+            ws.receive_json()
+            resp = client.post(f"/bookings/{booking['id']}/cancel", headers=auth_headers)
+            assert resp.status_code == 200
+            assert (resp.json()["status"], resp.json()["slot_reassigned"]) == ("cancelled", False)
+            assert ws.receive_json() == {
+                "type": "slots", "court_id": court_id, "status": "released", "slots": [{"date": day, "hours": [18]}],
+            }
+        availability = client.get(f"/courts/{court_id}/availability", params={"from": day, "days": 1}).json()
+        assert availability["days"][0]["booked_hours"] == []
+        assert client.post(f"/bookings/{booking['id']}/cancel", headers=auth_headers).status_code == 409
+        assert client.post(f"/bookings/{booking['id']}/cancel", headers=register(client)).status_code == 404
+        rebooked = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=register(client))
+        assert rebooked.status_code == 200
+
+    def test_cancellation_promotes_the_first_waiter(self, client, court_id):
+        holder, first, second = (register(client) for _ in range(3))
+        time_slot = future_slot()
+        booking = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=holder).json()
+        entries = [
+            client.post("/waitlist", json={"court_id": court_id, "time_slot": time_slot}, headers=headers)
+            for headers in (first, second)
+        ]
+        assert [e.status_code for e in entries] == [200, 200]
+        assert [e.json()["position"] for e in entries] == [1, 2]
+        dup = client.post("/waitlist", json={"court_id": court_id, "time_slot": time_slot}, headers=first)
+        assert dup.status_code == 409
+
+        resp = client.post(f"/bookings/{booking['id']}/cancel", headers=holder)
+        assert resp.json()["slot_reassigned"] is True
+        promoted = [b for b in client.get("/bookings", headers=first).json() if b["time_slot"] == time_slot]
+        assert [b["status"] for b in promoted] == ["confirmed"]
+        assert client.get("/waitlist", headers=first).json() == []
+        assert [e["position"] for e in client.get("/waitlist", headers=second).json()] == [1]
+        # The slot is still taken, so nothing was released to other clients
+        day = time_slot.split()[0]
+        availability = client.get(f"/courts/{court_id}/availability", params={"from": day, "days": 1}).json()
+        assert availability["days"][0]["booked_hours"] == [18]
+
+    def test_failed_promotion_keeps_the_waiter_in_line(self, client, court_id, monkeypatch):
+        holder, waiter, rival = register(client), register(client), register(client)
+        time_slot = future_slot(12)
+        booking = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=holder).json()
+        client.post("/waitlist", json={"court_id": court_id, "time_slot": time_slot}, headers=waiter)
+        sync_waitlist = main.sync_waitlist
+
+        def rebook_then_sync(db, court):
+            # The slot is booked again after the cancellation, before the waiter is promoted
+            start_at, end_at = main.slot_bounds(time_slot)
+            db.add(main.Booking(court_id=court, player_id=user_id_of(rival), time_slot=time_slot,
+                                start_at=start_at, end_at=end_at))
+            db.flush()
+            main.record_usage(db, court, [(start_at, end_at)])
+            sync_waitlist(db, court)
+
+        monkeypatch.setattr(main, "sync_waitlist", rebook_then_sync)
+        resp = client.post(f"/bookings/{booking['id']}/cancel", headers=holder)
+        assert resp.status_code == 200
+        assert resp.json()["slot_reassigned"] is False
+        monkeypatch.undo()
+        assert [e["position"] for e in client.get("/waitlist", headers=waiter).json()] == [1]
+        assert [b["status"] for b in client.get("/bookings", headers=rival).json()] == ["confirmed"]
+
+    def test_waiters_added_by_another_worker_keep_their_place(self, client, court_id):
+        holder, local = register(client), register(client)
+        time_slot = future_slot(9)
+        booking = client.post("/bookings", json={"court_id": court_id, "time_slot": time_slot}, headers=holder).json()
+        client.get("/waitlist", headers=holder)  # load this court's queues
+        # Another worker queues a player first, straight through the database
+        bounds = main.slot_bounds(time_slot)
+        with main.SessionLocal() as session:
+            session.add(main.WaitlistEntry(
+                court_id=court_id, player_id=user_id_of(holder), time_slot=time_slot, start_at=bounds[0], end_at=bounds[1],
+            ))
+            main.bump_cache_version(session, "waitlist")
+            session.commit()
+        joined = client.post("/waitlist", json={"court_id": court_id, "time_slot": time_slot}, headers=local)
+        assert joined.json()["position"] == 2
+
+        client.post(f"/bookings/{booking['id']}/cancel", headers=holder)
+        rebooked = [b for b in client.get("/bookings", headers=holder).json() if b["time_slot"] == time_slot]
+        assert sorted(b["status"] for b in rebooked) == ["cancelled", "confirmed"]
+        assert [e["position"] for e in client.get("/waitlist", headers=local).json()] == [1]
+
+    def test_waitlist_validation_and_leaving(self, client, auth_headers, court_id):
+        headers = register(client)
+        free_slot = future_slot()
+        resp = client.post("/waitlist", json={"court_id": court_id, "time_slot": free_slot}, headers=headers)
+        assert resp.status_code == 409  # nothing to wait for
+        assert client.post("/waitlist", json={"court_id": court_id, "time_slot": "soon"}, headers=headers).status_code == 422
+        client.post("/bookings", json={"court_id": court_id, "time_slot": free_slot}, headers=auth_headers)
+        mine = client.post("/waitlist", json={"court_id": court_id, "time_slot": free_slot}, headers=auth_headers)
+        assert mine.status_code == 409  # already holds it
+        entry = client.post("/waitlist", json={"court_id": court_id, "time_slot": free_slot}, headers=headers).json()
+        assert client.delete(f"/waitlist/{entry['id']}", headers=auth_headers).status_code == 404
+        assert client.delete(f"/waitlist/{entry['id']}", headers=headers).status_code == 204
+        assert client.get("/waitlist", headers=headers).json() == []
+
+    def test_cancellation_is_taken_out_of_usage(self, client, court_id):
+        owner = register(client, role="owner")
+        own_court = client.post("/courts", json={
+            "name": "Refund Court", "location": "1 Undo Ln, Austin, TX", "surface_type": "hardcourt",
+        }, headers=owner).json()["id"]
+        player = register(client)
+        time_slot = future_slot()
+        day = time_slot.split()[0]
+        booking = client.post("/bookings", json={"court_id": own_court, "time_slot": time_slot}, headers=player).json()
+        params = {"from": day, "to": day, "court_id": own_court}
+        assert client.get("/owner/analytics", params=params, headers=owner).json()["courts"][0]["booked_hours"] == 1
+        client.post(f"/bookings/{booking['id']}/cancel", headers=owner)  # owners may cancel on their courts
+        assert client.get("/owner/analytics", params=params, headers=owner).json()["courts"][0]["booked_hours"] == 0
+
+
+# ── Messaging ──────────────────────────────────────────────────
+
+def user_id_of(headers):
+    return main.decode_token_subject(headers["Authorization"].split()[1])
+
+
+class TestMessaging:
+    def test_stream_tokens_open_only_the_event_stream(self, client):
+        headers = register(client)
+        resp = client.post("/messages/events/token", headers=headers)
+        assert resp.status_code == 200 and resp.json()["expires_in"] == main.STREAM_TOKEN_EXPIRE_SECONDS
+        token = resp.json()["token"]
+        assert asyncio.run(main.get_stream_user_id(token=token, credentials=None, db=None)) == user_id_of(headers)
+        assert client.get("/messages/unread", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+        assert client.get("/messages/events", params={"token": headers["Authorization"].split()[1]}).status_code == 401
+        assert client.get("/messages/events", params={"token": "garbage"}).status_code == 401
+        assert client.get("/messages/events").status_code == 401
+
+    def test_send_inbox_and_unread_counts(self, client):
+        alice, bob = register(client, name="Alice Msg"), register(client, name="Bob Msg")
+        bob_id = user_id_of(bob)
+        for text in ("first", "second"):
+            resp = client.post("/messages", json={"receiver_id": bob_id, "content": text}, headers=alice)
+            assert resp.status_code == 200, resp.text
+
+        inbox = client.get("/messages", headers=bob).json()
+        assert [m["content"] for m in inbox] == ["second", "first"]
+        assert inbox[0]["sender_name"] == "Alice Msg"
+
+        with count_queries() as statements:
+            assert client.get("/messages/unread", headers=bob).json() == {"total": 2}
+        assert not any("FROM messages" in s for s in statements), statements
+
+        threads = client.get("/messages/threads", headers=bob).json()
+        assert [(t["peer_name"], t["unread_count"]) for t in threads] == [("Alice Msg", 2)]
+        assert client.post(f"/messages/threads/{user_id_of(alice)}/read", headers=bob).json() == {"total": 0}
+        assert client.get("/messages/threads", headers=alice).json()[0]["unread_count"] == 0
+
+    def test_rejects_unknown_or_self_recipient(self, client):
+        alice = register(client)
+        assert client.post("/messages", json={"receiver_id": 999999, "content": "hi"}, headers=alice).status_code == 404
+        assert client.post("/messages", json={"receiver_id": user_id_of(alice), "content": "hi"}, headers=alice).status_code == 400
+
+    def test_thread_pages_interleave_both_directions(self, client):
+        alice, bob = register(client), register(client)
+        sent = []
+        for n in range(7):
+            sender, receiver = (alice, bob) if n % 3 else (bob, alice)
+            resp = client.post("/messages", json={"receiver_id": user_id_of(receiver), "content": f"m{n}"}, headers=sender)
+            sent.append(resp.json()["id"])
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            resp = client.get(f"/messages/threads/{user_id_of(bob)}", params=params, headers=alice)
+            seen.extend(m["id"] for m in resp.json())
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == sent[::-1]
+
+    def test_thread_query_uses_index_range_scans(self):
+        query = main.thread_query(1, 2, limit=50)
+        with main.engine.connect() as conn:
+            compiled = query.compile(conn, compile_kwargs={"literal_binds": True})
+            plan = " ".join(str(row[-1]) for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"))
+        assert plan.count("ix_messages_sender_receiver_created") == 2, plan
+        assert "SCAN messages" not in plan, plan
+
+
+# ── Bulk import and export ──────────────────────────────────────
+
+class TestBulkImportExport:
+    def test_create_court_keeps_price_hours_and_photo(self, client, auth_headers):
+        resp = client.post("/courts", json={
+            "name": "Priced Court",
+            "location": "4 Fee St, Austin, TX",
+            "surface_type": "hardcourt",
+            "price_per_hour": 40,
+            "operating_hours": "7:00 AM - 9:00 PM daily",
+            "photo_url": "https://example.com/court.jpg",
+        }, headers=auth_headers)
+        court = resp.json()
+        assert (court["price_per_hour"], court["operating_hours"], court["photo_url"]) == (
+            40, "7:00 AM - 9:00 PM daily", "https://example.com/court.jpg"
+        )
+        assert court["latitude"] is not None  # still geocoded from the address
+
+    def test_ndjson_import_reports_rejected_lines(self, client, auth_headers):
+        tag = uuid.uuid4().hex[:8]
+        body = "\n".join([
+            json.dumps({"name": f"Imported {tag} A", "location": "1 Bulk Rd, Denver, CO", "surface_type": "concrete", "price_per_hour": 18}),
+            "{not json",
+            "",
+            json.dumps({"location": "2 Bulk Rd, Denver, CO", "surface_type": "concrete"}),
+            json.dumps({"name": f"Imported {tag} B", "location": "3 Bulk Rd", "surface_type": "sport", "latitude": 1.5, "longitude": 2.5}),
+        ])
+        resp = client.post("/courts/import", content=body, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+        assert resp.status_code == 200, resp.text
+        report = resp.json()
+        assert (report["created"], report["failed"]) == (2, 2)
+        assert [e["line"] for e in report["errors"]] == [2, 4]
+        assert "name" in report["errors"][1]["error"]
+
+        courts = {c["name"]: c for c in client.get("/courts", params={"all": "true"}).json()}
+        assert courts[f"Imported {tag} A"]["price_per_hour"] == 18
+        assert courts[f"Imported {tag} A"]["latitude"] is not None
+        assert (courts[f"Imported {tag} B"]["latitude"], courts[f"Imported {tag} B"]["price_per_hour"]) == (1.5, 25)
+        assert [c["name"] for c in client.get("/courts/search", params={"q": tag}).json()] != []
+
+    def test_csv_import_is_chunked(self, client, auth_headers):
+        tag = uuid.uuid4().hex[:8]
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["name", "location", "surface_type", "amenities", "price_per_hour"])
+        writer.writerow([f"{tag} Quoted", "5 Csv Ave, Boise, ID", "hardcourt", "Lights, \"Pro\" shop\nand cafe", ""])
+        writer.writerow([f"{tag} Short", "6 Csv Ave"])
+        for n in range(1100):
+            writer.writerow([f"{tag} {n}", "7 Csv Ave, Boise, ID", "hardcourt", "", str(n % 50)])
+        with count_queries() as statements:
+            resp = client.post("/courts/import", params={"format": "csv"}, content=out.getvalue(), headers=auth_headers)
+        report = resp.json()
+        assert (report["created"], report["failed"]) == (1101, 1)
+        assert report["errors"] == [{"line": 4, "error": "Expected 5 fields, got 2"}]
+        assert sum(s.lstrip().upper().startswith("INSERT INTO COURTS") for s in statements) == 3  # 500-row chunks
+
+        quoted = client.get("/courts/search", params={"q": f"{tag} quoted"}).json()
+        assert quoted[0]["amenities"] == 'Lights, "Pro" shop\nand cafe'
+        assert quoted[0]["price_per_hour"] == 25
+
+    def test_import_needs_a_known_format(self, client, auth_headers):
+        resp = client.post("/courts/import", content="x", headers={**auth_headers, "Content-Type": "text/plain"})
+        assert resp.status_code == 415
+
+    def test_broken_off_import_keeps_committed_courts_visible(self, client, auth_headers, monkeypatch):
+        tag = "zq" + uuid.uuid4().hex[:6]
+        body = "\n".join(
+            json.dumps({"name": f"{tag} Partial {n}", "location": "8 Bulk Rd, Boise, ID", "surface_type": "clay"})
+            for n in range(bulk.IMPORT_CHUNK_SIZE + 1)
+        )
+        client.get("/courts/search", params={"q": "warmup"})
+        with main.SessionLocal() as db:
+            before = main.read_catalog_version(db)
+        import_court_chunk = main.import_court_chunk
+        calls = []
+
+        def lose_connection_after_first_chunk(db, owner_id, records):
+            calls.append(len(records))
+            if len(calls) > 1:
+                raise ConnectionError("client went away")
+            return import_court_chunk(db, owner_id, records)
+
+        monkeypatch.setattr(main, "import_court_chunk", lose_connection_after_first_chunk)
+        with pytest.raises(ConnectionError):
+            client.post("/courts/import", content=body, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+        with main.SessionLocal() as db:
+            assert main.read_catalog_version(db) > before  # other workers see the committed chunk too
+        resp = client.get("/courts/search", params={"q": f"{tag} partial"})
+        assert resp.headers["X-Total-Count"] == str(bulk.IMPORT_CHUNK_SIZE)
+
+    def test_exports_stream_every_row(self, client, auth_headers, court_id):
+        resp = client.get("/courts/export", headers=auth_headers)
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        courts = [json.loads(line) for line in resp.text.splitlines()]
+        with main.SessionLocal() as session:
+            assert len(courts) == session.query(main.Court).count()
+        assert [c["id"] for c in courts] == sorted(c["id"] for c in courts)
+
+        rows = list(csv.DictReader(io.StringIO(client.get("/courts/export", params={"format": "csv"}, headers=auth_headers).text)))
+        assert len(rows) == len(courts) and rows[0]["name"] == courts[0]["name"]
+
+    def test_booking_export_is_scoped_to_the_caller(self, client, auth_headers):
+        owner = register(client, role="owner")
+        own_court = client.post("/courts", json={
+            "name": "Export Court", "location": "8 Report Rd, Austin, TX", "surface_type": "hardcourt",
+        }, headers=owner).json()["id"]
+        player = register(client)
+        for hour in (9, 10):
+            assert client.post("/bookings", json={
+                "court_id": own_court, "time_slot": f"2031-05-0{hour - 7} {hour:02d}:00-{hour + 1:02d}:00",
+            }, headers=player).status_code == 200
+        client.post("/bookings", json={"court_id": own_court, "time_slot": "2031-06-01 09:00-10:00"}, headers=auth_headers)
+
+        owner_rows = [json.loads(line) for line in client.get("/bookings/export", headers=owner).text.splitlines()]
+        assert len(owner_rows) == 3
+        player_rows = list(csv.DictReader(io.StringIO(
+            client.get("/bookings/export", params={"format": "csv", "from": "2031-05-03"}, headers=player).text
+        )))
+        assert [row["time_slot"] for row in player_rows] == ["2031-05-03 10:00-11:00"]
+        assert client.get("/bookings/export").status_code in (401, 403)
+
+
+# ── Owner analytics ────────────────────────────────────────────
+
+class TestOwnerAnalytics:
+    @pytest.fixture(scope="class")
+    def owner(self, client):
+        headers = register(client, role="owner")
+        resp = client.post("/courts", json={
+            "name": "Analytics Court",
+            "location": "5 Rollup Rd, Austin, TX",
+            "surface_type": "hardcourt",
+        }, headers=headers)
+        return headers, resp.json()["id"]
+
+    def test_bookings_update_rollups(self, client, owner):
+        headers, court = owner
+        player = register(client)
+        client.post("/bookings", json={"court_id": court, "time_slot": "2030-05-01 09:00-10:00"}, headers=player)
+        client.post("/bookings/batch", json={
+            "court_id": court,
+            "time_slots": ["2030-05-01 10:00-11:00", "2030-05-01 18:00-19:00", "2030-05-02 07:00-08:00"],
+        }, headers=player)
+
+        with count_queries() as statements:
+            resp = client.get(f"/owner/analytics?from=2030-05-01&to=2030-05-03&court_id={court}", headers=headers)
+        assert resp.status_code == 200, resp.text
+        assert not any("FROM bookings" in s for s in statements), statements
+        report = resp.json()
+        assert (report["booked_hours"], report["revenue"]) == (4, 100)
+        days = report["courts"][0]["days"]
+        assert [(d["booked_hours"], d["revenue"]) for d in days] == [(3, 75), (1, 25), (0, 0)]
+        assert days[0]["occupancy"] == round(3 / 16, 4)
+
+        heat = client.get(f"/owner/analytics/courts/{court}/heatmap?from=2030-05-01&days=2", headers=headers).json()
+        assert heat["hours"] == list(range(6, 22))
+        assert [heat["hours"][i] for i, n in enumerate(heat["bookings"][0]) if n] == [9, 10, 18]
+        assert [heat["hours"][i] for i, n in enumerate(heat["bookings"][1]) if n] == [7]
+
+    def test_recompute_matches_incremental_rollups(self, client, owner):
+        def snapshot():
+            with main.engine.connect() as conn:
+                return sorted(conn.execute(text(
+                    "SELECT court_id, day, hour, bookings, revenue FROM court_hourly_usage"
+                )).all()), sorted(conn.execute(text(
+                    "SELECT court_id, day, bookings, revenue FROM court_daily_usage"
+                )).all())
+
+        before = snapshot()
+        with main.engine.begin() as conn:
+            main.recompute_usage(conn)
+        assert snapshot() == before
+
+    def test_numpy_and_python_aggregation_agree(self):
+        pytest.importorskip("numpy")
+        rng = random.Random(7)
+        bookings = []
+        for _ in range(500):
+            start = rng.randrange(6, 21)
+            day = main.date(2030, 1, 1) + main.timedelta(days=rng.randrange(365))
+            bookings.append((rng.randrange(1, 4), day, start, rng.randrange(start + 1, 23), rng.choice([20, 35, None])))
+        assert analytics.aggregate_usage(bookings, use_numpy=True) == analytics.aggregate_usage(bookings, use_numpy=False)
+
+    def test_owners_only_and_only_their_courts(self, client, owner):
+        _, court = owner
+        assert client.get("/owner/analytics", headers=register(client)).status_code == 403
+        other_owner = register(client, role="owner")
+        assert client.get(f"/owner/analytics?court_id={court}", headers=other_owner).status_code == 404
+        assert client.get(f"/owner/analytics/courts/{court}/heatmap", headers=other_owner).status_code == 404
+        assert client.get("/owner/analytics", headers=other_owner).json()["courts"] == []
+
+    def test_open_hours_from_operating_hours(self):
+        assert analytics.open_hours("6:00 AM - 10:00 PM daily") == range(6, 22)
+        assert analytics.open_hours("7:00 AM - 10:00 PM Mon-Sat, 8:00 AM - 8:00 PM Sun") == range(7, 22)
+        assert analytics.open_hours("6:00 AM - 12:00 AM") == range(6, 24)
+        assert analytics.open_hours("By appointment") == analytics.DEFAULT_OPEN_HOURS
+
+
+# ── Matchmaking ─────────────────────────────────────────────────
+
+def queue_entry(player_id, skill, hours=(18,), court_id=1):
+    return matchmaking.QueueEntry(player_id, court_id, [datetime(2030, 1, 1, hour) for hour in hours], skill)
+
+
+class TestMatchmaking:
+    def test_groups_fours_by_skill_first_come_first_served(self):
+        matcher = matchmaking.Matchmaker()
+        for player_id in range(1, 10):
+            matcher.enqueue(queue_entry(player_id, skill=player_id % 2))
+        matches = matcher.tick()
+        assert len(matches) == 1  # one game per court hour
+        assert matches[0].player_ids == [1, 3, 5, 7]
+        assert len(matcher) == 5 and 9 in matcher
+
+    def test_player_window_spans_hours_and_booked_hours_are_skipped(self):
+        matcher = matchmaking.Matchmaker()
+        for player_id in range(1, 9):
+            matcher.enqueue(queue_entry(player_id, skill=1, hours=(17, 18, 19)))
+        booked = datetime(2030, 1, 1, 17)
+        matches = matcher.tick(lambda court_id, start_at: start_at != booked)
+        assert [(m.start_at.hour, m.player_ids) for m in matches] == [(18, [1, 2, 3, 4]), (19, [5, 6, 7, 8])]
+        assert len(matcher) == 0
+
+    def test_long_waits_widen_to_the_adjacent_skill(self):
+        matcher = matchmaking.Matchmaker(widen_after=3)
+        for player_id, skill in [(1, 0), (2, 0), (3, 1), (4, 1), (5, 2)]:
+            matcher.enqueue(queue_entry(player_id, skill))
+        assert [matcher.tick() for _ in range(2)] == [[], []]
+        matches = matcher.tick()
+        assert [m.player_ids for m in matches] == [[1, 2, 3, 4]]
+        assert matches[0].skill_level == "beginner"
+        assert 5 in matcher  # advanced is two levels away from beginner
+
+    def test_expired_and_departed_players_leave_every_bucket(self):
+        matcher = matchmaking.Matchmaker()
+        for player_id in range(1, 4):
+            matcher.enqueue(queue_entry(player_id, skill=1, hours=(8, 9)))
+        assert [e.player_id for e in matcher.expire(datetime(2030, 1, 1, 9, 30))] == [1, 2, 3]
+        matcher.enqueue(queue_entry(4, skill=1))
+        matcher.dequeue(4)
+        assert len(matcher) == 0 and matcher.tick() == []
+
+    def test_simulation_is_deterministic_and_fast(self):
+        first = matchmaking.simulate(players=5000, courts=50, ticks=10, seed=7)
+        again = matchmaking.simulate(players=5000, courts=50, ticks=10, seed=7)
+        assert first["digest"] == again["digest"]
+        assert first["games"] > 0 and first["matched_players"] == first["games"] * 4
+        assert first["tick_ms_max"] < 250
+        assert matchmaking.simulate(players=5000, courts=50, ticks=10, seed=8)["digest"] != first["digest"]
+
+    def test_queued_players_are_booked_together(self, client, court_id):
+        day = (datetime.utcnow() + timedelta(days=random.randint(3000, 6000))).date()
+        players = [register(client, skill_level="advanced") for _ in range(4)]
+        for headers in players:
+            resp = client.post("/matchmaking/queue", json={
+                "court_id": court_id, "day": day.isoformat(), "start_hour": 9, "end_hour": 11,
+            }, headers=headers)
+            assert resp.status_code == 200, resp.text
+            assert resp.json()["status"] == "queued"
+
+        assert (court_id, f"{day.isoformat()} 09:00-10:00") in main.run_matchmaking_tick()
+        status = client.get("/matchmaking/queue", headers=players[3]).json()
+        assert status["status"] == "matched"
+        assert status["time_slot"] == f"{day.isoformat()} 09:00-10:00"
+        assert len(status["player_ids"]) == 4
+        availability = client.get(f"/courts/{court_id}/availability", params={"from": day.isoformat(), "days": 1})
+        assert availability.json()["days"][0]["booked_hours"] == [9]
+
+    def test_queue_validation(self, client, court_id):
+        headers = register(client, skill_level="expert")
+        body = {"court_id": court_id, "day": "2099-01-01", "start_hour": 9, "end_hour": 10}
+        assert client.post("/matchmaking/queue", json=body, headers=headers).status_code == 422
+        headers = register(client, skill_level="beginner")
+        assert client.post("/matchmaking/queue", json={**body, "end_hour": 9}, headers=headers).status_code == 422
+        assert client.post("/matchmaking/queue", json={**body, "court_id": 10**9}, headers=headers).status_code == 404
+        assert client.delete("/matchmaking/queue", headers=headers).status_code == 404
+        assert client.post("/matchmaking/queue", json=body, headers=headers).status_code == 200
+        assert client.delete("/matchmaking/queue", headers=headers).json()["status"] == "idle"
+        assert client.get("/matchmaking/queue", headers=headers).json()["status"] == "idle"
+
+
+# ── Metrics ────────────────────────────────────────────────────
+
+def scrape(client) -> dict:
+    """Prometheus samples from /metrics as {"name{labels}": value}."""
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in resp.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestMetrics:
+    def test_route_latency_and_queries_per_request(self, client, auth_headers, court_id):
+        client.get(f"/courts/{court_id}")
+        client.get("/bookings", headers=auth_headers)
+        samples = scrape(client)
+        assert samples['http_request_duration_seconds_count{method="GET",route="/courts/{court_id}"}'] >= 1
+        assert samples['http_requests_total{method="GET",route="/bookings",status="200"}'] >= 1
+        queries = 'http_request_db_queries{method="GET",route="/bookings"}'
+        assert samples[queries.replace("{", "_sum{", 1)] >= samples[queries.replace("{", "_count{", 1)]
+        assert samples["db_queries_total"] > 0
+        assert samples["db_pool_checkout_wait_seconds_count"] > 0
+        assert 'cache_hits_total{cache="users"}' in samples
+
+    def test_unmatched_paths_share_one_label(self, client):
+        client.get(f"/no-such-page-{uuid.uuid4().hex}")
+        samples = scrape(client)
+        assert samples['http_requests_total{method="GET",route="unmatched",status="404"}'] >= 1
+        assert not any("no-such-page" in name for name in samples)
+
+    def test_slow_request_log_includes_sql(self, client, auth_headers, monkeypatch, caplog):
+        monkeypatch.setattr(main.instrumentation, "slow_request_seconds", 0)
+        with caplog.at_level("WARNING", logger="pickleball.slow_requests"):
+            client.get("/bookings", headers=auth_headers)
+        message = next(r.getMessage() for r in caplog.records if "/bookings" in r.getMessage())
+        assert "FROM bookings" in message
+
+
+# ── Benchmark harness ───────────────────────────────────────────
+
+class TestBenchmark:
+    def test_small_run_reports_every_scenario(self):
+        args = benchmark.build_parser().parse_args([
+            "--database-url", os.environ["DATABASE_URL"],
+            "--requests", "40", "--concurrency", "4",
+            "--users", "5", "--courts", "5", "--bookings-per-user", "2",
+            "--calibration", "2",
+        ])
+        report = benchmark.run_benchmark(args)
+        assert report["totals"]["requests"] == 40
+        assert report["totals"]["server_errors"] == 0
+        assert set(report["endpoints"]) == {"POST /auth/login", "GET /courts", "GET /bookings", "POST /bookings"}
+        for stats in report["endpoints"].values():
+            assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+            assert stats["queries_per_request"] is not None
+        assert report["endpoints"]["POST /bookings"]["queries_per_request"] >= 1
+
+    def test_cold_start_within_health_check_budget(self):
+        """A fresh server answers /health well inside Railway's health check timeout."""
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pickleball-startup-'), 'startup.db')}"
+        startup = benchmark.measure_startup(url, runs=2)
+        assert startup["max_s"] < benchmark.STARTUP_BUDGET_SECONDS, startup
+
+        # The restart found every migration applied and had nothing to do
+        engine = create_engine(url)
+        assert migrations.pending_migrations(engine, main.MIGRATIONS) == []
+        engine.dispose()
+
+    def test_serialization_benchmark_compares_both_paths(self):
+        report = benchmark.measure_serialization(items=200, repeat=3)
+        assert set(report["endpoints"]) == {"GET /courts", "GET /bookings"}
+        for stats in report["endpoints"].values():
+            assert stats["fast_us_per_item"] < stats["default_us_per_item"]
+
+    def test_compare_flags_latency_and_query_regressions(self):
+        baseline = {"totals": {"rps": 100}, "endpoints": {
+            "GET /courts": {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "queries_per_request": 1.0},
+        }}
+        report = {"totals": {"rps": 95}, "endpoints": {
+            "GET /courts": {"p50_ms": 10, "p95_ms": 30, "p99_ms": 31, "queries_per_request": 2.0},
+        }}
+        regressions = benchmark.compare(report, baseline, max_regression=0.2)
+        assert len(regressions) == 2
+        assert any("p95_ms" in r for r in regressions)
+        assert any("queries_per_request" in r for r in regressions)
@@ -8,6 +8,7 @@ Usage:
     # Test against local server
     TEST_API_URL=http://localhost:8000 pytest test_e2e.py -v
 """
+import json
 import os
 import uuid
 import pytest
@@ -50,6 +51,18 @@ def auth_headers(registered_user):
     return {"Authorization": f"Bearer {registered_user['access_token']}"}
 
 
+@pytest.fixture(scope="module")
+def court_id(client, auth_headers):
+    """A court created for this run, so booked slots don't collide across runs."""
+    resp = client.post("/courts", json={
+        "name": f"Booking Court {RUN_ID}",
+        "location": "1 Run St",
+        "surface_type": "hardcourt",
+    }, headers=auth_headers)
+    assert resp.status_code == 200, f"Court creation failed: {resp.text}"
+    return resp.json()["id"]
+
+
 # ── 1. Health Check ──────────────────────────────────────────────
 
 class TestHealthCheck:
@@ -128,6 +141,83 @@ class TestCourts:
         data = resp.json()
         assert data["name"] == f"Test Court {RUN_ID}"
 
+    def test_get_court_by_id(self, client, court_id):
+        resp = client.get(f"/courts/{court_id}")
+        assert resp.status_code == 200
+        assert resp.json()["name"] == f"Booking Court {RUN_ID}"
+        assert client.get("/courts/999999999").status_code == 404
+
+    def test_courts_keyset_pagination(self, client, auth_headers):
+        """Filtered pages follow X-Next-Cursor until the catalog is exhausted."""
+        surface = f"surface-{RUN_ID}"
+        created = []
+        for i in range(5):
+            resp = client.post("/courts", json={
+                "name": f"Paged Court {i} {RUN_ID}",
+                "location": f"{i} Page St, Testville, TX",
+                "surface_type": surface,
+            }, headers=auth_headers)
+            created.append(resp.json()["id"])
+
+        seen, cursor = [], None
+        while True:
+            params = {"surface_type": surface, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            resp = client.get("/courts", params=params)
+            assert resp.status_code == 200
+            page = resp.json()
+            assert len(page) <= 2
+            seen.extend(c["id"] for c in page)
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == sorted(created, reverse=True)
+
+        resp = client.get("/courts", params={"surface_type": surface, "city": "TESTVILLE", "all": "true"})
+        assert len(resp.json()) == 5
+
+    def test_courts_invalid_cursor(self, client):
+        assert client.get("/courts", params={"cursor": "not-a-cursor"}).status_code == 400
+
+    def test_nearby_courts(self, client, auth_headers):
+        """A court with explicit coordinates is found by a radius search around it."""
+        # Spread runs over the Pacific so they don't crowd each other's results
+        lat = 10 + int(RUN_ID[:4], 16) % 2000 / 100
+        lng = -150 + int(RUN_ID[4:], 16) % 2000 / 100
+        resp = client.post("/courts", json={
+            "name": f"Island Court {RUN_ID}",
+            "location": "Somewhere offshore",
+            "surface_type": "hardcourt",
+            "latitude": lat,
+            "longitude": lng,
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+        new_id = resp.json()["id"]
+
+        resp = client.get("/courts/nearby", params={"lat": lat + 0.01, "lng": lng, "radius": 5})
+        assert resp.status_code == 200
+        match = [c for c in resp.json() if c["id"] == new_id]
+        assert match and 1.0 < match[0]["distance_km"] < 1.2
+
+        resp = client.get("/courts/nearby", params={"lat": lat + 0.1, "lng": lng, "radius": 5})
+        assert new_id not in [c["id"] for c in resp.json()]
+
+    def test_seeded_courts_are_geocoded(self, client):
+        resp = client.get("/courts/nearby", params={"lat": 37.7749, "lng": -122.4194, "radius": 20})
+        assert resp.status_code == 200
+        assert "Bay Area Courts" in [c["name"] for c in resp.json()]
+
+    def test_courts_conditional_get(self, client):
+        """Revalidating an unchanged catalog page returns 304 Not Modified."""
+        resp = client.get("/courts")
+        etag = resp.headers.get("ETag")
+        assert etag
+        resp = client.get("/courts", headers={"If-None-Match": etag})
+        assert resp.status_code in (200, 304)  # 200 only if a court was added in between
+        if resp.status_code == 304:
+            assert resp.headers["ETag"] == etag
+
     def test_create_court_unauthenticated(self, client):
         """Test 8: POST /courts without token fails."""
         resp = client.post("/courts", json={
@@ -141,13 +231,8 @@ class TestCourts:
 # ── 9-11. Bookings ──────────────────────────────────────────────
 
 class TestBookings:
-    def test_create_booking_authenticated(self, client, auth_headers):
+    def test_create_booking_authenticated(self, client, auth_headers, court_id):
         """Test 9: POST /bookings with auth succeeds."""
-        # Get a court id first
-        courts = client.get("/courts").json()
-        assert len(courts) > 0
-        court_id = courts[0]["id"]
-
         resp = client.post("/bookings", json={
             "court_id": court_id,
             "time_slot": "2026-03-01 10:00-11:00",
@@ -156,6 +241,60 @@ class TestBookings:
         data = resp.json()
         assert data["court_id"] == court_id
         assert data["status"] == "confirmed"
+        assert data["start_at"] == "2026-03-01T10:00:00"
+        assert data["end_at"] == "2026-03-01T11:00:00"
+
+    def test_double_booking_conflict(self, client, auth_headers, court_id):
+        """The same court and hour can only be booked once."""
+        slot = {"court_id": court_id, "time_slot": "2026-03-02 9:00 AM-10:00 AM"}
+        resp = client.post("/bookings", json=slot, headers=auth_headers)
+        assert resp.status_code == 200
+        # Same hour written in the 24h format still conflicts
+        resp = client.post("/bookings", json={
+            "court_id": court_id,
+            "time_slot": "2026-03-02 09:00-10:00",
+        }, headers=auth_headers)
+        assert resp.status_code == 409
+
+    def test_invalid_time_slot(self, client, auth_headers, court_id):
+        resp = client.post("/bookings", json={
+            "court_id": court_id,
+            "time_slot": "sometime tomorrow",
+        }, headers=auth_headers)
+        assert resp.status_code == 422
+
+    def test_batch_recurring_bookings(self, client, auth_headers, court_id):
+        """A 12-week league books every Tuesday in one request."""
+        resp = client.post("/bookings/batch", json={
+            "court_id": court_id,
+            "recurrence": {"start": "2026-09-01T18:00:00", "frequency": "weekly", "count": 12},
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["created"] == 12
+        assert [r["status"] for r in data["results"]] == ["created"] * 12
+        assert data["results"][-1]["time_slot"] == "2026-11-17 18:00-19:00"
+
+        # Partial mode books what's free and reports the rest
+        resp = client.post("/bookings/batch", json={
+            "court_id": court_id,
+            "time_slots": ["2026-09-01 18:00-19:00", "2026-09-01 19:00-20:00", "2026-09-01 19:00-20:00", "nope"],
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+        assert [r["status"] for r in resp.json()["results"]] == ["conflict", "created", "duplicate", "invalid"]
+
+    def test_batch_atomic_books_nothing_on_conflict(self, client, auth_headers, court_id):
+        resp = client.post("/bookings/batch", json={
+            "court_id": court_id,
+            "time_slots": ["2026-09-02 07:00-08:00", "2026-09-08 18:00-19:00"],
+            "atomic": True,
+        }, headers=auth_headers)
+        assert resp.status_code == 409
+        assert [r["status"] for r in resp.json()["results"]] == ["skipped", "conflict"]
+        assert resp.json()["created"] == 0
+
+        resp = client.get(f"/courts/{court_id}/availability", params={"from": "2026-09-02", "days": 1})
+        assert 7 not in resp.json()["days"][0]["booked_hours"]
 
     def test_get_bookings_authenticated(self, client, auth_headers):
         """Test 10: GET /bookings with auth returns user's bookings."""
@@ -171,10 +310,86 @@ class TestBookings:
         assert resp.status_code in (401, 403, 422)
 
 
+# ── Availability ────────────────────────────────────────────────
+
+class TestAvailability:
+    def test_availability_reflects_booking(self, client, auth_headers, court_id):
+        """Booked hours show up in the court's availability bitmap."""
+        resp = client.post("/bookings", json={
+            "court_id": court_id,
+            "time_slot": "2036-04-02 7:00 PM-8:00 PM",
+        }, headers=auth_headers)
+        assert resp.status_code == 200
+
+        resp = client.get(f"/courts/{court_id}/availability", params={"from": "2036-04-01", "days": 3})
+        assert resp.status_code == 200
+        days = resp.json()["days"]
+        assert [d["date"] for d in days] == ["2036-04-01", "2036-04-02", "2036-04-03"]
+        assert 19 in days[1]["booked_hours"]
+        assert days[1]["bitmap"] & (1 << 19)
+
+    def test_availability_unknown_court(self, client):
+        resp = client.get("/courts/999999999/availability")
+        assert resp.status_code == 404
+
+    def test_event_stream_pushes_booking(self, client, auth_headers, court_id):
+        """Subscribers to a court's SSE stream see new bookings without polling."""
+        with client.stream("GET", f"/courts/{court_id}/events") as stream:
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            events = (json.loads(line[len("data: "):]) for line in stream.iter_lines() if line.startswith("data: "))
+            assert next(events)["type"] == "subscribed"
+
+            resp = client.post("/bookings", json={
+                "court_id": court_id,
+                "time_slot": "2026-04-03 06:00-07:00",
+            }, headers=auth_headers)
+            assert resp.status_code == 200
+            assert next(events)["slots"] == [{"date": "2026-04-03", "hours": [6]}]
+
+
+# ── Messaging ───────────────────────────────────────────────────
+
+class TestMessaging:
+    def test_send_and_read_message(self, client, registered_user, auth_headers):
+        resp = client.post("/auth/register", json={
+            "email": f"pen_pal_{RUN_ID}@example.com",
+            "password": TEST_PASSWORD,
+            "name": f"Pen Pal {RUN_ID}",
+            "role": "player",
+            "skill_level": "beginner",
+        })
+        assert resp.status_code == 200
+        pal_headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        my_id = registered_user["user"]["id"]
+
+        resp = client.post("/messages", json={"receiver_id": my_id, "content": "Game on Saturday?"}, headers=pal_headers)
+        assert resp.status_code == 200
+
+        inbox = client.get("/messages", params={"limit": 1}, headers=auth_headers).json()
+        assert inbox[0]["content"] == "Game on Saturday?"
+        assert client.get("/messages/unread", headers=auth_headers).json()["total"] >= 1
+
+        pal_id = inbox[0]["sender_id"]
+        thread = client.get(f"/messages/threads/{pal_id}", headers=auth_headers).json()
+        assert [m["content"] for m in thread] == ["Game on Saturday?"]
+        assert client.post(f"/messages/threads/{pal_id}/read", headers=auth_headers).status_code == 200
+
+    def test_messages_unauthenticated(self, client):
+        assert client.get("/messages").status_code in (401, 403)
+
+    def test_event_stream_opens_with_a_stream_token(self, client, registered_user, auth_headers):
+        """Browsers' EventSource can't send headers, so the stream also takes ?token=."""
+        token = client.post("/messages/events/token", headers=auth_headers).json()["token"]
+        with client.stream("GET", "/messages/events", params={"token": token}) as stream:
+            assert stream.status_code == 200
+            line = next(line for line in stream.iter_lines() if line.startswith("data: "))
+            assert json.loads(line[len("data: "):]) == {"type": "subscribed", "user_id": registered_user["user"]["id"]}
+
+
 # ── 12. Full User Journey ───────────────────────────────────────
 
 class TestFullJourney:
-    def test_complete_user_journey(self, client):
+    def test_complete_user_journey(self, client, court_id):
         """Register → Login → View courts → Book court → View bookings."""
         email = f"journey_{RUN_ID}@example.com"
 
@@ -199,10 +414,11 @@ class TestFullJourney:
         assert resp.status_code == 200
         courts = resp.json()
         assert len(courts) >= 1
+        assert court_id in [c["id"] for c in courts]
 
         # Book a court
         resp = client.post("/bookings", json={
-            "court_id": courts[0]["id"],
+            "court_id": court_id,
             "time_slot": "2026-03-15 14:00-15:00",
         }, headers=headers)
         assert resp.status_code == 200
@@ -0,0 +1,99 @@
+"""
+In-process view of the booking waitlist.
+
+Players waiting for a taken slot are rows in waitlist_entries. Ids only
+grow, so for each (court, start time) the lowest id is next in line.
+WaitlistIndex keeps those queues as heaps, loaded one court at a time,
+so a cancellation finds the player to promote, and a player finds their
+place in line, without scanning the table.
+
+The rows are the source of truth. Every change bumps a shared version,
+and an index that sees a version it didn't produce drops what it has
+loaded, so changes made by other workers are never missed.
+"""
+import heapq
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+
+class WaitlistIndex:
+    """Thread-safe map of (court_id, start_at) -> heap of (entry_id, player_id)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: dict[tuple[int, datetime], list[tuple[int, int]]] = {}
+        self._loaded: set[int] = set()
+        self.version: Optional[int] = None
+
+    def is_loaded(self, court_id: int) -> bool:
+        return court_id in self._loaded
+
+    def sync(self, version: int):
+        """Forget every loaded court if the shared version moved without us"""
+        with self._lock:
+            if version != self.version:
+                self._queues.clear()
+                self._loaded.clear()
+                self.version = version
+
+    def advance(self, version: int) -> bool:
+        """Adopt the version a change from this process produced.
+
+        Returns False, and forgets what was loaded, if another change came
+        in since the last sync; the caller then skips updating the queues.
+        """
+        with self._lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+                return True
+            self._queues.clear()
+            self._loaded.clear()
+            self.version = version
+            return False
+
+    def load(self, court_id: int, entries: Iterable[tuple[int, datetime, int]]):
+        """Replace a court's queues with (entry_id, start_at, player_id) rows"""
+        queues: dict[tuple[int, datetime], list[tuple[int, int]]] = {}
+        for entry_id, start_at, player_id in entries:
+            queues.setdefault((court_id, start_at), []).append((entry_id, player_id))
+        for queue in queues.values():
+            heapq.heapify(queue)
+        with self._lock:
+            for key in [k for k in self._queues if k[0] == court_id]:
+                del self._queues[key]
+            self._queues.update(queues)
+            self._loaded.add(court_id)
+
+    def push(self, court_id: int, start_at: datetime, entry_id: int, player_id: int):
+        with self._lock:
+            if court_id not in self._loaded:
+                return
+            queue = self._queues.setdefault((court_id, start_at), [])
+            if (entry_id, player_id) not in queue:  # a load may already have picked it up
+                heapq.heappush(queue, (entry_id, player_id))
+
+    def remove(self, court_id: int, start_at: datetime, entry_id: int):
+        with self._lock:
+            queue = self._queues.get((court_id, start_at))
+            if not queue:
+                return
+            queue[:] = [item for item in queue if item[0] != entry_id]
+            heapq.heapify(queue)
+            if not queue:
+                del self._queues[(court_id, start_at)]
+
+    def head(self, court_id: int, start_at: datetime) -> Optional[tuple[int, int]]:
+        """(entry_id, player_id) of the next player in line, if any"""
+        queue = self._queues.get((court_id, start_at))
+        return queue[0] if queue else None
+
+    def position(self, court_id: int, start_at: datetime, entry_id: int) -> Optional[int]:
+        """1-based place in line, or None if the entry isn't queued here"""
+        queue = self._queues.get((court_id, start_at), [])
+        if not any(item[0] == entry_id for item in queue):
+            return None
+        return sum(1 for item in queue if item[0] <= entry_id)
+
+    def waiting(self, court_id: int, start_at: datetime) -> int:
+        return len(self._queues.get((court_id, start_at), ()))
@@ -22,7 +22,7 @@ function formatHour(h) {
   return `${h > 12 ? h - 12 : h}:00 ${h < 12 ? 'AM' : 'PM'}`
 }
 
-export default function TimeSlotGrid({ court, bookings = [], onBook }) {
+export default function TimeSlotGrid({ court, bookings = [], bookedHours = {}, onBook }) {
   const [selectedDate, setSelectedDate] = useState(getNext7Days()[0].date)
   const [selectedSlot, setSelectedSlot] = useState(null)
   const days = getNext7Days()
@@ -31,8 +31,10 @@ export default function TimeSlotGrid({ court, bookings = [], onBook }) {
     .filter((b) => b.court_id === court.id && b.status !== 'cancelled')
     .map((b) => b.time_slot)
 
-  const handleSlotClick = (slot) => {
-    if (bookedSlots.includes(slot)) return
+  const isTaken = (slot, h) => bookedSlots.includes(slot) || (bookedHours[selectedDate] || []).includes(h)
+
+  const handleSlotClick = (slot, h) => {
+    if (isTaken(slot, h)) return
     setSelectedSlot(slot === selectedSlot ? null : slot)
   }
 
@@ -59,13 +61,13 @@ export default function TimeSlotGrid({ court, bookings = [], onBook }) {
       <div className="timeslots-grid">
         {HOURS.map((h) => {
           const slot = `${selectedDate} ${formatHour(h)}-${formatHour(h + 1)}`
-          const isBooked = bookedSlots.includes(slot)
+          const isBooked = isTaken(slot, h)
           const isSelected = selectedSlot === slot
           return (
             <button
               key={h}
               className={`timeslot ${isBooked ? 'booked' : 'available'} ${isSelected ? 'selected' : ''}`}
-              onClick={() => handleSlotClick(slot)}
+              onClick={() => handleSlotClick(slot, h)}
               disabled={isBooked}
             >
               {formatHour(h)}
@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react'
 import { useRouter } from 'next/router'
-import api from '../../utils/api'
+import api, { API_URL } from '../../utils/api'
 import Navbar from '../../components/Navbar'
 import TimeSlotGrid from '../../components/TimeSlotGrid'
 
@@ -9,6 +9,7 @@ export default function CourtDetail({ user, loading }) {
   const { id } = router.query
   const [court, setCourt] = useState(null)
   const [bookings, setBookings] = useState([])
+  const [bookedHours, setBookedHours] = useState({})
   const [dataLoading, setDataLoading] = useState(true)
 
   useEffect(() => {
@@ -18,16 +19,49 @@ export default function CourtDetail({ user, loading }) {
   useEffect(() => {
     if (id && user) {
       Promise.all([
-        api.get('/courts'),
+        api.get(`/courts/${id}`),
         api.get('/bookings'),
-      ]).then(([courtsRes, bookingsRes]) => {
-        const found = courtsRes.data.find((c) => String(c.id) === String(id))
-        setCourt(found || null)
+      ]).then(([courtRes, bookingsRes]) => {
+        setCourt(courtRes.data)
         setBookings(bookingsRes.data)
       }).catch(console.error).finally(() => setDataLoading(false))
     }
   }, [id, user])
 
+  // Everyone's booked hours: one availability fetch, then live deltas pushed by the server
+  useEffect(() => {
+    if (!id || !user) return
+    const loadAvailability = () => api.get(`/courts/${id}/availability`).then((res) => {
+      setBookedHours(Object.fromEntries(res.data.days.map((d) => [d.date, d.booked_hours])))
+    }).catch(console.error)
+    loadAvailability()
+
+    const source = new EventSource(`${API_URL}/courts/${id}/events`)
+    source.onmessage = (e) => {
+      const event = JSON.parse(e.data)
+      if (event.type === 'resync') {
+        loadAvailability()
+      } else if (event.type === 'slots' && event.status === 'booked') {
+        setBookedHours((prev) => {
+          const next = { ...prev }
+          event.slots.forEach(({ date, hours }) => {
+            next[date] = [...new Set([...(next[date] || []), ...hours])]
+          })
+          return next
+        })
+      } else if (event.type === 'slots' && event.status === 'released') {
+        setBookedHours((prev) => {
+          const next = { ...prev }
+          event.slots.forEach(({ date, hours }) => {
+            next[date] = (next[date] || []).filter((hour) => !hours.includes(hour))
+          })
+          return next
+        })
+      }
+    }
+    return () => source.close()
+  }, [id, user])
+
   const handleBook = async (courtId, slot) => {
     try {
       await api.post('/bookings', { court_id: courtId, time_slot: slot })
@@ -87,7 +121,7 @@ export default function CourtDetail({ user, loading }) {
 
         <div className="card" style={{ marginBottom: 24 }}>
           <h3 style={{ marginBottom: 16, color: '#2D5016' }}>Book a Time Slot</h3>
-          <TimeSlotGrid court={court} bookings={bookings} onBook={handleBook} />
+          <TimeSlotGrid court={court} bookings={bookings} bookedHours={bookedHours} onBook={handleBook} />
         </div>
 
         <div className="reviews-section">
@@ -7,9 +7,22 @@ import BookingCard from '../components/BookingCard'
 import TimeSlotGrid from '../components/TimeSlotGrid'
 import Modal from '../components/Modal'
 
+const NO_FILTERS = { surface_type: '', city: '', min_price: '', max_price: '' }
+
+// Only the filters that are set, as GET /courts query parameters
+function courtParams(filters, cursor) {
+  const params = Object.fromEntries(Object.entries(filters).filter(([, value]) => value !== ''))
+  if (cursor) params.cursor = cursor
+  return params
+}
+
 export default function Dashboard({ user, loading }) {
   const router = useRouter()
   const [courts, setCourts] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [filters, setFilters] = useState(NO_FILTERS)
+  const [appliedFilters, setAppliedFilters] = useState(NO_FILTERS)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [bookings, setBookings] = useState([])
   const [dataLoading, setDataLoading] = useState(true)
   const [activeTab, setActiveTab] = useState('courts')
@@ -27,10 +40,16 @@ export default function Dashboard({ user, loading }) {
     if (user) fetchData()
   }, [user])
 
+  // One page of courts; the server sends the next page's cursor in X-Next-Cursor
+  const fetchCourts = async (filterValues, cursor = null) => {
+    const res = await api.get('/courts', { params: courtParams(filterValues, cursor) })
+    setCourts((current) => (cursor ? [...current, ...res.data] : res.data))
+    setNextCursor(res.headers['x-next-cursor'] || null)
+  }
+
   const fetchData = async () => {
     try {
-      const courtsRes = await api.get('/courts')
-      setCourts(courtsRes.data)
+      await fetchCourts(appliedFilters)
       const bookingsRes = await api.get('/bookings')
       setBookings(bookingsRes.data)
     } catch (error) {
@@ -40,6 +59,29 @@ export default function Dashboard({ user, loading }) {
     }
   }
 
+  const loadMore = async () => {
+    setLoadingMore(true)
+    try {
+      await fetchCourts(appliedFilters, nextCursor)
+    } catch (error) {
+      console.error('Failed to load more courts:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const applyFilters = async (e) => {
+    e.preventDefault()
+    setAppliedFilters(filters)
+    try {
+      await fetchCourts(filters)
+    } catch (error) {
+      console.error('Failed to filter courts:', error)
+    }
+  }
+
+  const updateFilter = (name) => (e) => setFilters({ ...filters, [name]: e.target.value })
+
   const handleBook = async (courtId, slot) => {
     try {
       await api.post('/bookings', { court_id: courtId, time_slot: slot })
@@ -63,7 +105,7 @@ export default function Dashboard({ user, loading }) {
         <div className="page-header">
           <h1>{activeTab === 'courts' ? 'Available Courts' : 'My Bookings'}</h1>
           <p>{activeTab === 'courts'
-            ? `${courts.length} court${courts.length !== 1 ? 's' : ''} available for booking`
+            ? `${courts.length}${nextCursor ? '+' : ''} court${courts.length !== 1 ? 's' : ''} available for booking`
             : `${bookings.length} booking${bookings.length !== 1 ? 's' : ''}`
           }</p>
         </div>
@@ -77,6 +119,16 @@ export default function Dashboard({ user, loading }) {
           </button>
         </div>
 
+        {activeTab === 'courts' && (
+          <form className="court-filters" onSubmit={applyFilters}>
+            <input className="form-input" placeholder="Surface (e.g. hardcourt)" value={filters.surface_type} onChange={updateFilter('surface_type')} />
+            <input className="form-input" placeholder="City" value={filters.city} onChange={updateFilter('city')} />
+            <input className="form-input" type="number" min="0" placeholder="Min $/hr" value={filters.min_price} onChange={updateFilter('min_price')} />
+            <input className="form-input" type="number" min="0" placeholder="Max $/hr" value={filters.max_price} onChange={updateFilter('max_price')} />
+            <button type="submit" className="btn btn-primary">Filter</button>
+          </form>
+        )}
+
         {activeTab === 'courts' && (
           courts.length === 0 ? (
             <div className="empty-state">
@@ -93,6 +145,14 @@ export default function Dashboard({ user, loading }) {
           )
         )}
 
+        {activeTab === 'courts' && nextCursor && (
+          <div style={{ marginTop: 24, textAlign: 'center' }}>
+            <button className="btn btn-outline" onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? 'Loading...' : 'Load more courts'}
+            </button>
+          </div>
+        )}
+
         {activeTab === 'bookings' && (
           bookings.length === 0 ? (
             <div className="empty-state">
@@ -2,7 +2,7 @@ import axios from 'axios'
 
 // Backend API URL - defaults to FastAPI on port 8000
 // Can be overridden with NEXT_PUBLIC_API_URL environment variable
-const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+export const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 
 const api = axios.create({
   baseURL: API_URL,
@@ -17,7 +17,45 @@ api.interceptors.request.use((config) => {
   if (token) {
     config.headers.Authorization = `Bearer ${token}`
   }
+  // Keep reading from the primary database for a few seconds after a write,
+  // so a new booking shows up even if the request reaches another worker
+  const primaryUntil = typeof window !== 'undefined' ? sessionStorage.getItem('readPrimaryUntil') : null
+  if (primaryUntil && Number(primaryUntil) * 1000 > Date.now()) {
+    config.headers['X-Read-Primary-Until'] = primaryUntil
+  }
   return config
 })
 
+api.interceptors.response.use((response) => {
+  const primaryUntil = response.headers['x-read-primary-until']
+  if (primaryUntil && typeof window !== 'undefined') {
+    sessionStorage.setItem('readPrimaryUntil', primaryUntil)
+  }
+  return response
+})
+
 export default api
+
+// Incoming messages and waitlist promotions as they arrive. EventSource can't
+// send the Authorization header, so each connection opens with a short-lived
+// stream token, and a fresh one is fetched whenever the stream drops.
+// Returns a function that closes the stream.
+export function subscribeToMessages(onEvent) {
+  let source = null
+  let closed = false
+  const retry = (delay) => { if (!closed) setTimeout(connect, delay) }
+  const connect = () => api.post('/messages/events/token').then((res) => {
+    if (closed) return
+    source = new EventSource(`${API_URL}/messages/events?token=${encodeURIComponent(res.data.token)}`)
+    source.onmessage = (e) => onEvent(JSON.parse(e.data))
+    source.onerror = () => {
+      source.close()
+      retry(1000)
+    }
+  }).catch(() => retry(5000))
+  connect()
+  return () => {
+    closed = true
+    if (source) source.close()
+  }
+}